@@ -1,12 +1,30 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterator, Optional
 
 import requests
+import requests.adapters
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from config import BASE_URL, CHUNK_SIZE
+import config
+from config import (
+    ACK_BATCH_SIZE, BASE_URL, CHUNK_SIZE, COMPRESS_MAX_RATIO, COMPRESS_MIN_SIZE, COMPRESS_SAMPLE_SIZE,
+    DOWNLOAD_SEGMENT_SIZE, DOWNLOAD_STREAMS, PENDING_PAGE_SIZE, SPOOL_DIR, TRANSFER_RETRIES,
+    UPLOAD_SEGMENT_SIZE, UPLOAD_STREAMS,
+)
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
 
 
 # ---------------------------------------------------------------------------
@@ -52,6 +70,82 @@ class FileOut:
     comment: str = ""
     status: str = "pending"
     created_at: str = ""
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+# ---------------------------------------------------------------------------
+# Content-coding helpers
+# ---------------------------------------------------------------------------
+
+def _compressor(coding: str):
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    # wbits=31 -> gzip container with a zero mtime, so output is deterministic
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def _decompressor(coding: str):
+    if coding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def _compressed_chunks(fh, coding: str) -> Iterator[bytes]:
+    compressor = _compressor(coding)
+    while chunk := fh.read(CHUNK_SIZE):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _decode_file(src_path: str, dest_path: str, coding: str) -> None:
+    decompressor = _decompressor(coding)
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(decompressor.decompress(chunk))
+        if coding == "gzip":
+            dst.write(decompressor.flush())
+
+
+class _OrderedDigest:
+    """SHA-256 of segments that finish out of order, without reading them back.
+
+    A finished segment is hashed as soon as everything before it has been;
+    segments that finish early wait in memory. At most ``window`` segments
+    may be reserved ahead of the hash, which bounds that memory.
+    """
+
+    def __init__(self, window: int):
+        self._digest = hashlib.sha256()
+        self._offset = 0
+        self._waiting: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._window = window
+        self._slots = threading.Semaphore(window)
+        self._failed = False
+
+    def reserve(self) -> bool:
+        """Wait for room to fetch another segment; False once a segment failed."""
+        self._slots.acquire()
+        return not self._failed
+
+    def add(self, start: int, data: bytes) -> None:
+        with self._lock:
+            self._waiting[start] = data
+            while self._offset in self._waiting:
+                chunk = self._waiting.pop(self._offset)
+                self._digest.update(chunk)
+                self._offset += len(chunk)
+                self._slots.release()
+
+    def fail(self) -> None:
+        self._failed = True
+        self._slots.release(self._window)
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
 
 
 # ---------------------------------------------------------------------------
@@ -61,6 +155,13 @@ class FileOut:
 class ApiClient:
     def __init__(self, base_url: str = BASE_URL):
         self._base_url = base_url
+        self._server_zstd = True
+        self._pending_cache: dict[str, tuple[str, list[FileOut]]] = {}
+        # Event seq reported by the last inbox refresh (X-Event-Seq)
+        self.event_seq: Optional[int] = None
+        # Inbox version of the last refresh (X-Inbox-Version); WebSocket
+        # deltas apply on top of it
+        self.inbox_version: Optional[int] = None
 
     def _to_user_out(self, payload: dict[str, Any]) -> UserOut:
         return UserOut(
@@ -83,6 +184,8 @@ class ApiClient:
             comment=str(payload.get("comment", "")),
             status=str(payload.get("status", "pending")),
             created_at=str(payload.get("created_at", "")),
+            size=payload.get("size"),
+            sha256=payload.get("sha256"),
         )
 
     def _headers(self, token: str) -> dict:
@@ -210,61 +313,328 @@ class ApiClient:
     # ------------------------------------------------------------------
 
     def list_pending(self, token: str) -> list[FileOut]:
+        """All pending parts, fetched page by page.
+
+        The first request is conditional on the last inbox ETag; an unchanged
+        inbox comes back as 304 and the cached list is returned.
+        """
+        cached_etag, cached_files = self._pending_cache.get(token, (None, []))
+        files: list[FileOut] = []
+        after_id = 0
+        etag = None
         try:
-            resp = requests.get(
-                f"{self._base_url}/files/pending",
-                headers=self._headers(token),
-                timeout=10,
-            )
-            self._raise_for_status(resp)
-            data = resp.json()
-            if not isinstance(data, list):
-                raise ApiError(resp.status_code, "Unexpected files response format")
-            return [self._to_file_out(f) for f in data if isinstance(f, dict)]
+            while True:
+                headers = self._headers(token)
+                if after_id == 0 and cached_etag:
+                    headers["If-None-Match"] = cached_etag
+                resp = requests.get(
+                    f"{self._base_url}/files/pending",
+                    params={"after_id": after_id, "limit": PENDING_PAGE_SIZE},
+                    headers=headers,
+                    timeout=10,
+                )
+                if after_id == 0 and resp.headers.get("X-Event-Seq", "").isdigit():
+                    self.event_seq = int(resp.headers["X-Event-Seq"])
+                if after_id == 0 and resp.headers.get("X-Inbox-Version", "").isdigit():
+                    self.inbox_version = int(resp.headers["X-Inbox-Version"])
+                if resp.status_code == 304:
+                    return list(cached_files)
+                self._raise_for_status(resp)
+                data = resp.json()
+                if not isinstance(data, list):
+                    raise ApiError(resp.status_code, "Unexpected files response format")
+                files.extend(self._to_file_out(f) for f in data if isinstance(f, dict))
+                etag = etag or resp.headers.get("ETag")
+                next_after = resp.headers.get("X-Next-After-Id")
+                if not next_after:
+                    break
+                after_id = int(next_after)
         except ApiError:
             raise
         except requests.RequestException as exc:
             raise ApiError(0, str(exc)) from exc
+        if etag:
+            self._pending_cache = {token: (etag, files)}
+        return list(files)
 
     def upload_part(
         self,
         token: str,
         file_path: str,
-        receiver_id: int,
+        receiver_ids: list[int],
         original_filename: str,
         part_number: int,
         total_parts: int,
         comment: str,
         progress_callback: Optional[Callable[[int], None]] = None,
-    ) -> FileOut:
+    ) -> list[FileOut]:
+        """Upload one part to every receiver; returns one record per receiver.
+
+        The bytes are sent and stored once however many receivers there are.
+
+        Data that compresses well (judged from a small sample) is sent with
+        a Content-Encoding and stored compressed. Small parts go in a single
+        raw PUT. Larger ones use a resumable session with segments sent in
+        parallel; the session id is remembered on disk, so if the upload
+        fails (or the client is restarted) calling this again only sends the
+        missing ranges.
+        """
         try:
-            with open(file_path, "rb") as fh:
-                resp = requests.post(
-                    f"{self._base_url}/files/upload",
-                    headers=self._headers(token),
-                    data={
-                        "receiver_id": str(receiver_id),
-                        "original_filename": original_filename,
-                        "part_number": str(part_number),
-                        "total_parts": str(total_parts),
-                        "comment": comment,
-                    },
-                    files={"file": (original_filename, fh)},
-                    timeout=300,
+            stat = os.stat(file_path)
+            key = "|".join(
+                str(v) for v in (
+                    os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns,
+                    ",".join(map(str, receiver_ids)), part_number, total_parts,
+                )
+            )
+            metadata = {
+                "receiver_ids": receiver_ids,
+                "original_filename": original_filename,
+                "part_number": part_number,
+                "total_parts": total_parts,
+                "comment": comment,
+            }
+            coding = self._choose_coding(file_path, stat.st_size)
+            try:
+                return self._upload_encoded(
+                    token, file_path, stat.st_size, key, metadata, coding, progress_callback
+                )
+            except ApiError as exc:
+                if exc.status_code != 415 or coding != "zstd":
+                    raise
+                # Server was installed without zstandard
+                self._server_zstd = False
+                return self._upload_encoded(
+                    token, file_path, stat.st_size, key, metadata, "gzip", progress_callback
                 )
-            if progress_callback:
-                import os
-                progress_callback(os.path.getsize(file_path))
-            self._raise_for_status(resp)
-            data = resp.json()
-            if not isinstance(data, dict):
-                raise ApiError(resp.status_code, "Unexpected upload response format")
-            return self._to_file_out(data)
         except ApiError:
             raise
         except requests.RequestException as exc:
             raise ApiError(0, str(exc)) from exc
 
+    def _upload_encoded(
+        self,
+        token: str,
+        file_path: str,
+        size: int,
+        key: str,
+        metadata: dict[str, Any],
+        coding: Optional[str],
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> list[FileOut]:
+        if size <= UPLOAD_SEGMENT_SIZE:
+            return self._upload_raw(token, file_path, metadata, coding, progress_callback)
+
+        source = file_path
+        if coding:
+            # Sessions need the final size up front, so compress to a spool
+            # file first; compression is deterministic, so a resumed upload
+            # produces identical bytes even if the spool was lost.
+            key = f"{key}|{coding}"
+            source = self._compress_to_spool(file_path, key, coding)
+        data = self._upload_session(
+            token, source, key, {**metadata, "content_encoding": coding}, progress_callback
+        )
+        if source != file_path:
+            os.remove(source)
+        return data
+
+    def _upload_session(
+        self,
+        token: str,
+        file_path: str,
+        key: str,
+        metadata: dict[str, Any],
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> list[FileOut]:
+        size = os.path.getsize(file_path)
+        with requests.Session() as http:
+            http.mount(
+                "http://", requests.adapters.HTTPAdapter(pool_maxsize=UPLOAD_STREAMS)
+            )
+            upload = self._open_upload_session(
+                http, token, key, {**metadata, "size": size}
+            )
+            session_id = upload["id"]
+            received = sum(end - start for start, end in upload["ranges"])
+            if progress_callback and received:
+                progress_callback(received)
+
+            segments = self._missing_segments(size, upload["ranges"])
+            with ThreadPoolExecutor(max_workers=UPLOAD_STREAMS) as pool:
+                futures = [
+                    pool.submit(
+                        self._send_segment, http, token, session_id,
+                        file_path, start, end, progress_callback,
+                    )
+                    for start, end in segments
+                ]
+                for future in futures:
+                    future.result()
+
+            resp = http.post(
+                f"{self._base_url}/files/uploads/{session_id}/complete",
+                headers=self._headers(token),
+                timeout=60,
+            )
+            self._raise_for_status(resp)
+        config.remember_upload_session(key, None)
+        return self._to_file_outs(resp)
+
+    def _upload_raw(
+        self,
+        token: str,
+        file_path: str,
+        metadata: dict[str, Any],
+        coding: Optional[str],
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> list[FileOut]:
+        """Single PUT with the file as the raw body (no multipart encoding).
+
+        With a coding the body is compressed on the fly and sent chunked.
+        Otherwise the file (at most one segment) is hashed first, so the
+        server rejects a body damaged in transit instead of storing it.
+        """
+        headers = self._headers(token)
+        if not coding:
+            headers["X-Content-SHA256"] = self._file_sha256(file_path)
+        with open(file_path, "rb") as fh:
+            body: Any = fh
+            if coding:
+                headers["Content-Encoding"] = coding
+                body = _compressed_chunks(fh, coding)
+            resp = requests.put(
+                f"{self._base_url}/files/upload",
+                params=metadata,
+                data=body,
+                headers=headers,
+                timeout=300,
+            )
+        self._raise_for_status(resp)
+        if progress_callback:
+            progress_callback(os.path.getsize(file_path))
+        return self._to_file_outs(resp)
+
+    def _to_file_outs(self, resp: requests.Response) -> list[FileOut]:
+        """Records of an upload sent with receiver_ids: a list, one per receiver."""
+        data = resp.json()
+        if not isinstance(data, list) or not all(isinstance(d, dict) for d in data):
+            raise ApiError(resp.status_code, "Unexpected upload response format")
+        return [self._to_file_out(d) for d in data]
+
+    # ------------------------------------------------------------------
+    # Compression
+    # ------------------------------------------------------------------
+
+    def _supported_codings(self) -> list[str]:
+        if zstandard is not None and self._server_zstd:
+            return ["zstd", "gzip"]
+        return ["gzip"]
+
+    def _choose_coding(self, file_path: str, size: int) -> Optional[str]:
+        """Pick a content-coding if a sample of the file compresses well.
+
+        Samples the start and the middle, so already-compressed formats
+        (archives, media, images) are sent as-is without wasting CPU.
+        """
+        if size < COMPRESS_MIN_SIZE:
+            return None
+        with open(file_path, "rb") as fh:
+            sample = fh.read(COMPRESS_SAMPLE_SIZE)
+            fh.seek(size // 2)
+            sample += fh.read(COMPRESS_SAMPLE_SIZE)
+        if len(zlib.compress(sample, 1)) > len(sample) * COMPRESS_MAX_RATIO:
+            return None
+        return self._supported_codings()[0]
+
+    def _compress_to_spool(self, file_path: str, key: str, coding: str) -> str:
+        SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+        spool = SPOOL_DIR / f"{hashlib.sha1(key.encode()).hexdigest()}.{coding}"
+        if spool.exists():
+            return str(spool)
+        tmp = spool.with_suffix(".tmp")
+        with open(file_path, "rb") as src, open(tmp, "wb") as dst:
+            for chunk in _compressed_chunks(src, coding):
+                dst.write(chunk)
+        os.replace(tmp, spool)
+        return str(spool)
+
+    def _open_upload_session(
+        self, http: requests.Session, token: str, key: str, body: dict[str, Any]
+    ) -> dict[str, Any]:
+        session_id = config.load_upload_sessions().get(key)
+        if session_id:
+            resp = http.get(
+                f"{self._base_url}/files/uploads/{session_id}",
+                headers=self._headers(token),
+                timeout=10,
+            )
+            if resp.ok:
+                return resp.json()
+            if resp.status_code not in (403, 404):
+                self._raise_for_status(resp)
+
+        resp = http.post(
+            f"{self._base_url}/files/uploads",
+            json=body,
+            headers=self._headers(token),
+            timeout=10,
+        )
+        self._raise_for_status(resp)
+        data = resp.json()
+        config.remember_upload_session(key, data["id"])
+        return data
+
+    @staticmethod
+    def _missing_segments(size: int, ranges: list) -> list[tuple[int, int]]:
+        """Split the gaps between already received ranges into segments."""
+        gaps: list[tuple[int, int]] = []
+        pos = 0
+        for start, end in ranges:
+            if start > pos:
+                gaps.append((pos, start))
+            pos = max(pos, end)
+        if pos < size:
+            gaps.append((pos, size))
+
+        segments: list[tuple[int, int]] = []
+        for start, end in gaps:
+            for seg_start in range(start, end, UPLOAD_SEGMENT_SIZE):
+                segments.append((seg_start, min(seg_start + UPLOAD_SEGMENT_SIZE, end)))
+        return segments
+
+    def _send_segment(
+        self,
+        http: requests.Session,
+        token: str,
+        session_id: str,
+        file_path: str,
+        start: int,
+        end: int,
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> None:
+        with open(file_path, "rb") as fh:
+            fh.seek(start)
+            data = fh.read(end - start)
+
+        for attempt in range(TRANSFER_RETRIES):
+            try:
+                resp = http.patch(
+                    f"{self._base_url}/files/uploads/{session_id}",
+                    data=data,
+                    headers={**self._headers(token), "Upload-Offset": str(start)},
+                    timeout=300,
+                )
+                self._raise_for_status(resp)
+                break
+            except requests.RequestException:
+                if attempt == TRANSFER_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+        if progress_callback:
+            progress_callback(end - start)
+
     def download_part(
         self,
         token: str,
@@ -273,9 +643,74 @@ class ApiClient:
         dest_path: str,
         progress_callback: Optional[Callable[[int], None]] = None,
     ) -> None:
+        """Download a part, in parallel byte-range segments when possible.
+
+        The destination is preallocated and every segment is written at its
+        own offset. Finished segments are recorded in ``<dest>.download``, so
+        after a crash or kill only the missing ones are fetched again. The
+        server's SHA-256 is checked against a digest computed while the
+        bytes stream in, so the file is never read back. Parts stored
+        compressed are transferred compressed and decoded locally.
+        """
+        url = f"{self._base_url}/files/{file_id}/part/{part_n}"
+        headers = {
+            **self._headers(token),
+            "Accept-Encoding": ", ".join(self._supported_codings()),
+        }
+        try:
+            with requests.Session() as http:
+                http.mount(
+                    "http://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_STREAMS)
+                )
+                head = http.head(url, headers=headers, timeout=10)
+                self._raise_for_status(head)
+                size = int(head.headers.get("Content-Length", 0))
+                etag = head.headers.get("ETag")
+                sha256 = head.headers.get("X-Content-SHA256")
+                coding = head.headers.get("Content-Encoding")
+
+                # Compressed parts are fetched as stored and decoded at the end
+                target = f"{dest_path}.{coding}" if coding else dest_path
+                state_path = target + ".download"
+                if not etag or size <= DOWNLOAD_SEGMENT_SIZE:
+                    digest = self._download_single(
+                        http, headers, url, target, progress_callback
+                    )
+                else:
+                    digest = self._download_segmented(
+                        http, headers, url, target, state_path, size, etag,
+                        progress_callback,
+                    )
+
+            if sha256 and digest != sha256:
+                # Start from scratch next time rather than resume corrupt data
+                for path in (state_path, target):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise ApiError(0, "Downloaded file is corrupt (SHA-256 mismatch)")
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            if coding:
+                _decode_file(target, dest_path, coding)
+                os.remove(target)
+        except ApiError:
+            raise
+        except requests.RequestException as exc:
+            raise ApiError(0, str(exc)) from exc
+
+    def download_bundle(
+        self,
+        token: str,
+        file_ids: list[int],
+        dest_path: str,
+        progress_callback: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Download several parts as one ZIP archive streamed by the server."""
+        url = f"{self._base_url}/files/bundle"
         try:
             resp = requests.get(
-                f"{self._base_url}/files/{file_id}/part/{part_n}",
+                url,
+                params={"ids": ",".join(str(i) for i in file_ids)},
                 headers=self._headers(token),
                 stream=True,
                 timeout=300,
@@ -283,15 +718,156 @@ class ApiClient:
             self._raise_for_status(resp)
             with open(dest_path, "wb") as f:
                 for chunk in resp.iter_content(CHUNK_SIZE):
-                    if chunk:
-                        f.write(chunk)
-                        if progress_callback:
-                            progress_callback(len(chunk))
+                    f.write(chunk)
+                    if progress_callback:
+                        progress_callback(len(chunk))
         except ApiError:
             raise
         except requests.RequestException as exc:
             raise ApiError(0, str(exc)) from exc
 
+    def _download_single(
+        self,
+        http: requests.Session,
+        headers: dict[str, str],
+        url: str,
+        dest_path: str,
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> str:
+        """Fetch the whole part in one request; returns its SHA-256."""
+        resp = http.get(url, headers=headers, stream=True, timeout=300)
+        self._raise_for_status(resp)
+        digest = hashlib.sha256()
+        with open(dest_path, "wb") as f:
+            for chunk in resp.raw.stream(CHUNK_SIZE, decode_content=False):
+                if chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    if progress_callback:
+                        progress_callback(len(chunk))
+        return digest.hexdigest()
+
+    def _download_segmented(
+        self,
+        http: requests.Session,
+        headers: dict[str, str],
+        url: str,
+        dest_path: str,
+        state_path: str,
+        size: int,
+        etag: str,
+        progress_callback: Optional[Callable[[int], None]],
+    ) -> str:
+        """Fetch missing segments in parallel; returns the SHA-256 of the whole part.
+
+        Segments left by an earlier attempt are read from disk to feed the
+        digest; everything else is hashed as it arrives.
+        """
+        state = self._load_download_state(state_path)
+        if (
+            state is None
+            or state.get("etag") != etag
+            or state.get("size") != size
+            or not os.path.exists(dest_path)
+        ):
+            with open(dest_path, "wb") as f:
+                f.truncate(size)
+            state = {"etag": etag, "size": size, "done": []}
+            self._save_download_state(state_path, state)
+
+        done = {tuple(seg) for seg in state["done"]}
+        segments = [
+            (start, min(start + DOWNLOAD_SEGMENT_SIZE, size))
+            for start in range(0, size, DOWNLOAD_SEGMENT_SIZE)
+        ]
+        if progress_callback and done:
+            progress_callback(sum(end - start for start, end in done))
+
+        lock = threading.Lock()
+        digest = _OrderedDigest(window=DOWNLOAD_STREAMS * 2)
+
+        def fetch(start: int, end: int) -> None:
+            try:
+                if (start, end) in done:
+                    with open(dest_path, "rb") as f:
+                        f.seek(start)
+                        digest.add(start, f.read(end - start))
+                    return
+                data = self._fetch_segment(http, headers, url, dest_path, start, end, etag)
+                digest.add(start, data)
+            except BaseException:
+                digest.fail()
+                raise
+            with lock:
+                state["done"].append([start, end])
+                self._save_download_state(state_path, state)
+            if progress_callback:
+                progress_callback(end - start)
+
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_STREAMS) as pool:
+            futures = []
+            for start, end in segments:
+                if not digest.reserve():
+                    break
+                futures.append(pool.submit(fetch, start, end))
+            for future in futures:
+                future.result()
+        return digest.hexdigest()
+
+    def _fetch_segment(
+        self,
+        http: requests.Session,
+        headers: dict[str, str],
+        url: str,
+        dest_path: str,
+        start: int,
+        end: int,
+        etag: str,
+    ) -> bytes:
+        """Write one range at its offset; returns the bytes for the running digest."""
+        headers = {**headers, "Range": f"bytes={start}-{end - 1}", "If-Range": etag}
+        for attempt in range(TRANSFER_RETRIES):
+            try:
+                resp = http.get(url, headers=headers, stream=True, timeout=300)
+                self._raise_for_status(resp)
+                if resp.status_code != 206:
+                    raise ApiError(resp.status_code, "File changed on server during download")
+                chunks = []
+                with open(dest_path, "r+b") as f:
+                    f.seek(start)
+                    for chunk in resp.raw.stream(CHUNK_SIZE, decode_content=False):
+                        f.write(chunk)
+                        chunks.append(chunk)
+                return b"".join(chunks)
+            except requests.RequestException:
+                if attempt == TRANSFER_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    @staticmethod
+    def _load_download_state(state_path: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else None
+        except Exception:
+            return None
+
+    @staticmethod
+    def _save_download_state(state_path: str, state: dict[str, Any]) -> None:
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
     def ack_file(self, token: str, file_id: int) -> None:
         try:
             resp = requests.post(
@@ -305,6 +881,40 @@ class ApiClient:
         except requests.RequestException as exc:
             raise ApiError(0, str(exc)) from exc
 
+    def ack_files(
+        self, token: str, file_ids: Optional[list[int]] = None, sender_id: Optional[int] = None
+    ) -> dict[int, str]:
+        """Acknowledge many parts at once; returns {file_id: result}.
+
+        Ids are sent in batches of ACK_BATCH_SIZE. With sender_id instead of
+        ids, every pending part from that sender is acknowledged.
+        """
+        if sender_id is not None:
+            bodies = [{"sender_id": sender_id}]
+        else:
+            ids = list(file_ids or [])
+            bodies = [
+                {"ids": ids[i:i + ACK_BATCH_SIZE]} for i in range(0, len(ids), ACK_BATCH_SIZE)
+            ]
+        results: dict[int, str] = {}
+        try:
+            for body in bodies:
+                resp = requests.post(
+                    f"{self._base_url}/files/ack",
+                    json=body,
+                    headers=self._headers(token),
+                    timeout=30,
+                )
+                self._raise_for_status(resp)
+                results.update(
+                    (int(r["id"]), str(r["result"])) for r in resp.json() if isinstance(r, dict)
+                )
+        except ApiError:
+            raise
+        except requests.RequestException as exc:
+            raise ApiError(0, str(exc)) from exc
+        return results
+
 
 # ---------------------------------------------------------------------------
 # ApiWorker
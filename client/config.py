@@ -105,8 +105,20 @@ BASE_URL = f"http://{SERVER_HOST}" if SERVER_HOST else ""
 WS_URL = f"ws://{SERVER_HOST}/ws" if SERVER_HOST else ""
 
 SESSION_FILE = Path.home() / ".file_exchanger/session.json"
+UPLOAD_STATE_FILE = Path.home() / ".file_exchanger/uploads.json"
+SPOOL_DIR = Path.home() / ".file_exchanger/spool"
 
 CHUNK_SIZE = 256 * 1024
+UPLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+UPLOAD_STREAMS = 4
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+DOWNLOAD_STREAMS = 4
+TRANSFER_RETRIES = 5
+PENDING_PAGE_SIZE = 500
+ACK_BATCH_SIZE = 1000  # server limit per POST /files/ack
+COMPRESS_MIN_SIZE = 4 * 1024
+COMPRESS_SAMPLE_SIZE = 64 * 1024
+COMPRESS_MAX_RATIO = 0.8  # compress only if a sample shrinks by 20%+
 PING_INTERVAL_SEC = 30
 WS_RECONNECT_DELAY_SEC = 5
 
@@ -161,3 +173,22 @@ def clear_session() -> None:
         SESSION_FILE.unlink()
     except FileNotFoundError:
         pass
+
+
+def load_upload_sessions() -> dict[str, str]:
+    """Return {upload key: server session id} for unfinished uploads."""
+    try:
+        data = json.loads(UPLOAD_STATE_FILE.read_text())
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def remember_upload_session(key: str, session_id: str | None) -> None:
+    sessions = load_upload_sessions()
+    if session_id is None:
+        sessions.pop(key, None)
+    else:
+        sessions[key] = session_id
+    UPLOAD_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    UPLOAD_STATE_FILE.write_text(json.dumps(sessions))
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Optional
+
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from PyQt6.QtWidgets import (
     QFileDialog, QHBoxLayout, QLabel, QMessageBox,
@@ -40,6 +42,33 @@ class DownloadWorker(QThread):
             self.error.emit(0, str(e))
 
 
+class BundleDownloadWorker(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
+    error = pyqtSignal(int, str)
+
+    def __init__(self, api: ApiClient, token: str, file_ids: list[int], dest_path: str):
+        super().__init__()
+        self._api = api
+        self._token = token
+        self._file_ids = file_ids
+        self._dest_path = dest_path
+
+    def run(self) -> None:
+        try:
+            self._api.download_bundle(
+                self._token,
+                self._file_ids,
+                self._dest_path,
+                progress_callback=lambda n: self.progress.emit(n),
+            )
+            self.finished.emit(self._dest_path)
+        except ApiError as e:
+            self.error.emit(e.status_code, e.detail)
+        except Exception as e:
+            self.error.emit(0, str(e))
+
+
 class InboxWidget(QWidget):
     request_logout = pyqtSignal()
 
@@ -58,7 +87,9 @@ class InboxWidget(QWidget):
         self._api = api
         self._token = token
         self._workers: list = []
-        self._download_workers: list[DownloadWorker] = []
+        self._download_workers: list[QThread] = []
+        # Inbox version the table reflects; None until the first refresh
+        self._inbox_version: Optional[int] = None
         self.setStyleSheet(GLASS_STYLEHEET)
 
         self._build_ui()
@@ -72,8 +103,20 @@ class InboxWidget(QWidget):
         self._refresh_btn = QPushButton("⟳ Refresh")
         self._refresh_btn.setObjectName("ghostBtn")
         self._refresh_btn.clicked.connect(self._refresh)
+        self._archive_btn = QPushButton("↓ Download as archive")
+        self._archive_btn.setObjectName("ghostBtn")
+        self._archive_btn.clicked.connect(self._on_archive_clicked)
+        self._ack_selected_btn = QPushButton("✓ Ack selected")
+        self._ack_selected_btn.setObjectName("ghostBtn")
+        self._ack_selected_btn.clicked.connect(self._on_ack_selected_clicked)
+        self._ack_all_btn = QPushButton("✓ Ack all")
+        self._ack_all_btn.setObjectName("ghostBtn")
+        self._ack_all_btn.clicked.connect(self._on_ack_all_clicked)
         top.addWidget(title)
         top.addStretch()
+        top.addWidget(self._archive_btn)
+        top.addWidget(self._ack_selected_btn)
+        top.addWidget(self._ack_all_btn)
         top.addWidget(self._refresh_btn)
 
         # Table
@@ -122,6 +165,7 @@ class InboxWidget(QWidget):
         w.start()
 
     def _on_pending_result(self, files: list) -> None:
+        self._inbox_version = self._api.inbox_version
         self._status_label.setText(f"{len(files)} pending file(s).")
         self._table.setRowCount(0)
         for f in files:
@@ -171,9 +215,38 @@ class InboxWidget(QWidget):
     # WS notification
     # ------------------------------------------------------------------
 
-    def _on_new_file_notification(self, data: dict) -> None:
-        self._status_label.setText("New file received — refreshing…")
-        self._refresh()
+    def _on_inbox_delta(self, data: dict) -> None:
+        """Apply a new_file / files_removed delta without going back to HTTP.
+
+        Deltas carry the inbox version they produce. One that follows the
+        table's version directly is applied; an old one is ignored; a gap
+        (or a server too old to send versions) falls back to a refresh, as
+        does files_updated (rare: only server maintenance sends it).
+        """
+        version = data.get("inbox_version")
+        if not isinstance(version, int) or self._inbox_version is None:
+            self._refresh()
+            return
+        if version <= self._inbox_version:
+            return
+        if version != self._inbox_version + 1:
+            self._status_label.setText("Inbox out of date — refreshing…")
+            self._refresh()
+            return
+
+        self._inbox_version = version
+        if data.get("event") == "new_file" and isinstance(data.get("file"), dict):
+            self._add_row(self._api._to_file_out(data["file"]))
+            self._table.resizeColumnsToContents()
+            self._status_label.setText(
+                f"New file received. {self._table.rowCount()} pending file(s)."
+            )
+        elif data.get("event") == "files_removed":
+            for file_id in data.get("file_ids", []):
+                self._remove_row(file_id)
+            self._status_label.setText(f"{self._table.rowCount()} pending file(s).")
+        else:
+            self._refresh()
 
     # ------------------------------------------------------------------
     # Download
@@ -204,6 +277,35 @@ class InboxWidget(QWidget):
         )
         worker.start()
 
+    def _on_archive_clicked(self) -> None:
+        rows = sorted({index.row() for index in self._table.selectionModel().selectedRows()})
+        # Nothing selected: the whole inbox
+        file_ids = self._row_file_ids(rows or range(self._table.rowCount()))
+        if not file_ids:
+            self._status_label.setText("Nothing to download.")
+            return
+        dest, _ = QFileDialog.getSaveFileName(self, "Save Archive", "files.zip", "ZIP (*.zip)")
+        if not dest:
+            return
+
+        self._download_progress.setVisible(True)
+        self._download_progress.setRange(0, 0)  # archive size is not known up front
+        self._status_label.setText(f"Downloading {len(file_ids)} file(s) as archive…")
+
+        worker = BundleDownloadWorker(self._api, self._token, file_ids, dest)
+        self._download_workers.append(worker)
+        worker.finished.connect(self._on_download_finished)
+        worker.error.connect(self._on_download_error)
+        worker.finished.connect(
+            lambda _: self._download_workers.remove(worker)
+            if worker in self._download_workers else None
+        )
+        worker.error.connect(
+            lambda c, d: self._download_workers.remove(worker)
+            if worker in self._download_workers else None
+        )
+        worker.start()
+
     def _on_download_finished(self, path: str) -> None:
         self._download_progress.setVisible(False)
         self._status_label.setText(f"Downloaded to: {path}")
@@ -236,16 +338,63 @@ class InboxWidget(QWidget):
         w.error.connect(self._on_ack_error)
         w.start()
 
-    def _on_ack_result(self, file_id: int) -> None:
-        # Find and remove the row with this file_id
+    def _remove_row(self, file_id: int) -> None:
         for row in range(self._table.rowCount()):
             item = self._table.item(row, self.COL_ID)
             if item and item.text() == str(file_id):
                 self._table.removeRow(row)
                 break
+
+    def _on_ack_result(self, file_id: int) -> None:
+        self._remove_row(file_id)
         count = self._table.rowCount()
         self._status_label.setText(f"Acknowledged. {count} pending file(s).")
 
+    def _row_file_ids(self, rows) -> list[int]:
+        ids = []
+        for row in rows:
+            item = self._table.item(row, self.COL_ID)
+            if item and item.text().isdigit():
+                ids.append(int(item.text()))
+        return ids
+
+    def _on_ack_selected_clicked(self) -> None:
+        rows = sorted({index.row() for index in self._table.selectionModel().selectedRows()})
+        self._ack_many(self._row_file_ids(rows))
+
+    def _on_ack_all_clicked(self) -> None:
+        self._ack_many(self._row_file_ids(range(self._table.rowCount())))
+
+    def _ack_many(self, file_ids: list[int]) -> None:
+        if not file_ids:
+            self._status_label.setText("Nothing to acknowledge.")
+            return
+        reply = QMessageBox.question(
+            self,
+            "Acknowledge Files",
+            f"Acknowledge {len(file_ids)} file(s)? They will be marked as received.",
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+
+        self._ack_selected_btn.setEnabled(False)
+        self._ack_all_btn.setEnabled(False)
+        w = self._run_worker(self._api.ack_files, self._token, file_ids)
+        w.result.connect(self._on_ack_many_result)
+        w.error.connect(self._on_ack_error)
+        w.finished.connect(lambda: self._ack_selected_btn.setEnabled(True))
+        w.finished.connect(lambda: self._ack_all_btn.setEnabled(True))
+        w.start()
+
+    def _on_ack_many_result(self, results: dict) -> None:
+        # Parts acked or already gone leave the inbox; others stay visible
+        for file_id, result in results.items():
+            if result in ("acked", "not_pending", "not_found"):
+                self._remove_row(file_id)
+        acked = sum(1 for r in results.values() if r == "acked")
+        count = self._table.rowCount()
+        self._status_label.setText(f"Acknowledged {acked}. {count} pending file(s).")
+
     def _on_ack_error(self, code: int, detail: str) -> None:
         if code == 401:
             msg = "Session expired. Re-login via File -> Log Out."
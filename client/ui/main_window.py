@@ -87,8 +87,11 @@ class MainWindow(QMainWindow):
     # ------------------------------------------------------------------
 
     def _start_ws(self) -> None:
-        self._ws = WsThread(self._token)
+        self._ws = WsThread(self._token, seq_source=lambda: self._api.event_seq)
         self._ws.new_file.connect(self._on_new_file)
+        self._ws.files_removed.connect(self._inbox._on_inbox_delta)
+        self._ws.files_updated.connect(self._inbox._on_inbox_delta)
+        self._ws.resync.connect(self._inbox._refresh)
         self._ws.connected.connect(self._on_ws_connected)
         self._ws.disconnected.connect(self._on_ws_disconnected)
         self._ws.error.connect(self._on_ws_error)
@@ -112,7 +115,7 @@ class MainWindow(QMainWindow):
             self._ws = None
 
     def _on_new_file(self, data: dict) -> None:
-        self._inbox._on_new_file_notification(data)
+        self._inbox._on_inbox_delta(data)
 
     # ------------------------------------------------------------------
     # Menu slots
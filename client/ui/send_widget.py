@@ -5,8 +5,8 @@ import os
 
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from PyQt6.QtWidgets import (
-    QComboBox, QFileDialog, QFormLayout, QHBoxLayout,
-    QLabel, QLineEdit, QMessageBox, QProgressBar,
+    QAbstractItemView, QFileDialog, QFormLayout, QHBoxLayout,
+    QLabel, QLineEdit, QListWidget, QListWidgetItem, QMessageBox, QProgressBar,
     QPushButton, QSpinBox, QTextEdit, QVBoxLayout, QWidget,
 )
 
@@ -16,7 +16,7 @@ from ui.glass_style import GLASS_STYLEHEET
 
 class UploadWorker(QThread):
     progress = pyqtSignal(int)
-    finished = pyqtSignal(dict)
+    finished = pyqtSignal(list)
     error = pyqtSignal(int, str)
 
     def __init__(
@@ -24,7 +24,7 @@ class UploadWorker(QThread):
         api: ApiClient,
         token: str,
         file_path: str,
-        receiver_id: int,
+        receiver_ids: list[int],
         original_filename: str,
         part_number: int,
         total_parts: int,
@@ -34,7 +34,7 @@ class UploadWorker(QThread):
         self._api = api
         self._token = token
         self._file_path = file_path
-        self._receiver_id = receiver_id
+        self._receiver_ids = receiver_ids
         self._original_filename = original_filename
         self._part_number = part_number
         self._total_parts = total_parts
@@ -45,14 +45,14 @@ class UploadWorker(QThread):
             result = self._api.upload_part(
                 self._token,
                 self._file_path,
-                self._receiver_id,
+                self._receiver_ids,
                 self._original_filename,
                 self._part_number,
                 self._total_parts,
                 self._comment,
                 progress_callback=lambda n: self.progress.emit(n),
             )
-            self.finished.emit(dataclasses.asdict(result))
+            self.finished.emit([dataclasses.asdict(r) for r in result])
         except ApiError as e:
             self.error.emit(e.status_code, e.detail)
         except Exception as e:
@@ -90,8 +90,10 @@ class SendWidget(QWidget):
         title.setObjectName("sectionTitle")
         layout.addWidget(title)
 
-        # To: combobox + refresh
-        self._receiver_combo = QComboBox()
+        # To: recipient list (several may be selected) + refresh
+        self._receiver_list = QListWidget()
+        self._receiver_list.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
+        self._receiver_list.setMaximumHeight(120)
         self._refresh_users_btn = QPushButton("⟳")
         self._refresh_users_btn.setFixedWidth(36)
         self._refresh_users_btn.setToolTip("Refresh user list")
@@ -100,7 +102,7 @@ class SendWidget(QWidget):
         to_layout = QHBoxLayout(to_row)
         to_layout.setContentsMargins(0, 0, 0, 0)
         to_layout.setSpacing(8)
-        to_layout.addWidget(self._receiver_combo)
+        to_layout.addWidget(self._receiver_list)
         to_layout.addWidget(self._refresh_users_btn)
 
         # File picker
@@ -202,24 +204,33 @@ class SendWidget(QWidget):
         )
         w.start()
 
+    def _add_placeholder(self, text: str) -> None:
+        item = QListWidgetItem(text)
+        item.setFlags(Qt.ItemFlag.NoItemFlags)
+        self._receiver_list.addItem(item)
+
     def _on_users_result(self, users: list) -> None:
-        self._receiver_combo.clear()
+        selected = set(self._selected_receiver_ids())
+        self._receiver_list.clear()
         has_recipients = False
         for user in users:
             if user.id != self._current_user_id:
-                self._receiver_combo.addItem(user.username, userData=user.id)
+                item = QListWidgetItem(user.username)
+                item.setData(Qt.ItemDataRole.UserRole, user.id)
+                self._receiver_list.addItem(item)
+                item.setSelected(user.id in selected)
                 has_recipients = True
 
         if not has_recipients:
-            self._receiver_combo.addItem("No recipients available", userData=None)
+            self._add_placeholder("No recipients available")
             self._status_label.setText("No recipients available for sending.")
             return
 
         self._status_label.setText("")
 
     def _on_users_error(self, code: int, detail: str) -> None:
-        self._receiver_combo.clear()
-        self._receiver_combo.addItem("Recipients unavailable", userData=None)
+        self._receiver_list.clear()
+        self._add_placeholder("Recipients unavailable")
         if code == 401:
             self._status_label.setText(
                 "Session expired while loading recipients. Please log in again."
@@ -259,13 +270,9 @@ class SendWidget(QWidget):
         if not self._selected_file:
             self._status_label.setText("Please select a file.")
             return
-        if self._receiver_combo.count() == 0:
-            self._status_label.setText("No recipients available.")
-            return
-
-        receiver_id = self._receiver_combo.currentData()
-        if receiver_id is None:
-            self._status_label.setText("Please select a recipient.")
+        receiver_ids = self._selected_receiver_ids()
+        if not receiver_ids:
+            self._status_label.setText("Please select at least one recipient.")
             return
 
         original_filename = os.path.basename(self._selected_file)
@@ -282,7 +289,7 @@ class SendWidget(QWidget):
             self._api,
             self._token,
             self._selected_file,
-            receiver_id,
+            receiver_ids,
             original_filename,
             part_number,
             total_parts,
@@ -302,19 +309,32 @@ class SendWidget(QWidget):
         )
         worker.start()
 
+    def _selected_receiver_ids(self) -> list[int]:
+        return [
+            item.data(Qt.ItemDataRole.UserRole)
+            for item in self._receiver_list.selectedItems()
+            if item.data(Qt.ItemDataRole.UserRole) is not None
+        ]
+
     def _set_enabled(self, enabled: bool) -> None:
         self._send_btn.setEnabled(enabled)
-        self._receiver_combo.setEnabled(enabled)
+        self._receiver_list.setEnabled(enabled)
         self._part_spin.setEnabled(enabled)
         self._total_spin.setEnabled(enabled)
         self._comment_edit.setEnabled(enabled)
 
-    def _on_upload_finished(self, result: dict) -> None:
+    def _on_upload_finished(self, result: list) -> None:
         self._progress.setVisible(False)
         self._set_enabled(True)
-        self._status_label.setText(
-            f"Sent successfully! File ID: {result.get('id')}"
-        )
+        if len(result) == 1:
+            self._status_label.setText(
+                f"Sent successfully! File ID: {result[0].get('id')}"
+            )
+        else:
+            ids = ", ".join(str(r.get("id")) for r in result)
+            self._status_label.setText(
+                f"Sent successfully to {len(result)} recipients! File IDs: {ids}"
+            )
 
     def _on_upload_error(self, code: int, detail: str) -> None:
         self._progress.setVisible(False)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import threading
+from typing import Callable, Optional
 
 import websocket
 from PyQt6.QtCore import QThread, pyqtSignal
@@ -11,15 +12,27 @@ from config import WS_URL, PING_INTERVAL_SEC, WS_RECONNECT_DELAY_SEC
 
 class WsThread(QThread):
     new_file = pyqtSignal(dict)
+    files_removed = pyqtSignal(dict)
+    files_updated = pyqtSignal(dict)
+    resync = pyqtSignal()
     connected = pyqtSignal()
     disconnected = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, token: str, ws_url: str = WS_URL):
+    def __init__(
+        self,
+        token: str,
+        ws_url: str = WS_URL,
+        seq_source: Optional[Callable[[], Optional[int]]] = None,
+    ):
+        """seq_source reports the event seq of the latest HTTP inbox refresh,
+        so a reconnect replays only what arrived after it."""
         super().__init__()
         self._ws_url = ws_url
         self._lock = threading.Lock()
         self._token = token
+        self._seq_source = seq_source
+        self._last_seq: Optional[int] = None
         self._stop_event = threading.Event()
         self._ws: websocket.WebSocketApp | None = None
 
@@ -42,6 +55,9 @@ class WsThread(QThread):
             with self._lock:
                 token = self._token
             url = f"{self._ws_url}?token={token}"
+            since = self._resume_seq()
+            if since is not None:
+                url += f"&since={since}"
 
             wsa = websocket.WebSocketApp(
                 url,
@@ -62,6 +78,13 @@ class WsThread(QThread):
             if not self._stop_event.is_set():
                 self._stop_event.wait(WS_RECONNECT_DELAY_SEC)
 
+    def _resume_seq(self) -> Optional[int]:
+        known = [self._last_seq]
+        if self._seq_source is not None:
+            known.append(self._seq_source())
+        known = [seq for seq in known if seq is not None]
+        return max(known) if known else None
+
     def _on_open(self, ws) -> None:
         self.connected.emit()
 
@@ -72,8 +95,20 @@ class WsThread(QThread):
             data = json.loads(msg)
         except Exception:
             return
-        if data.get("event") == "new_file":
+        event = data.get("event")
+        seq = data.get("seq")
+        if isinstance(seq, int):
+            if event != "resync" and self._last_seq is not None and seq <= self._last_seq:
+                return  # already seen
+            self._last_seq = seq
+        if event == "resync":
+            self.resync.emit()
+        elif event == "new_file":
             self.new_file.emit(data)
+        elif event == "files_removed":
+            self.files_removed.emit(data)
+        elif event == "files_updated":
+            self.files_updated.emit(data)
 
     def _on_error(self, ws, err) -> None:
         self.error.emit(str(err))
@@ -5,11 +5,14 @@ import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
 from database import get_db
+from hash_pool import hash_pool
 from models import User
+from principal_cache import principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -22,6 +25,16 @@ def verify_password(plain: str, hashed: str) -> bool:
     return bcrypt.checkpw(plain.encode(), hashed.encode())
 
 
+async def hash_password_async(plain: str) -> str:
+    """hash_password on the dedicated hashing pool (may raise 503)."""
+    return await hash_pool.run(hash_password, plain)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """verify_password on the dedicated hashing pool (may raise 503)."""
+    return await hash_pool.run(verify_password, plain, hashed)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (
@@ -41,33 +54,44 @@ def decode_token(token: str) -> dict:
         )
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
 ) -> User:
-    payload = decode_token(token)
-    user_id: Optional[int] = payload.get("sub")
+    user_id = principal_cache.token_user_id(token)
     if user_id is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.get(User, int(user_id))
+        payload = decode_token(token)
+        sub: Optional[str] = payload.get("sub")
+        if sub is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user_id = int(sub)
+        principal_cache.put_token(token, user_id, payload.get("exp"))
+
+    cached = principal_cache.user(user_id)
+    if cached is not None:
+        # Attach a copy to this session without a round trip
+        return await db.merge(cached, load=False)
+
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    principal_cache.put_user(user)
     return user
 
 
-def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin required")
     return current_user
 
 
-def init_admin(db: Session) -> None:
+async def init_admin(db: AsyncSession) -> None:
     """Insert default admin account if users table is empty."""
-    if db.query(User).count() == 0:
+    if await db.scalar(select(func.count()).select_from(User)) == 0:
         admin = User(
             username="admin",
-            password_hash=hash_password("admin"),
+            password_hash=await hash_password_async("admin"),
             is_admin=True,
             force_change_password=True,
         )
         db.add(admin)
-        db.commit()
+        await db.commit()
@@ -0,0 +1,317 @@
+"""Content-addressed, reference-counted blob storage.
+
+Payloads are stored in the storage backend under ``blobs/<aa>/<sha256>``;
+``PendingFile.stored_filename`` holds that key. Every *pending* record owns one reference, so a blob
+is only removed once the last record pointing at it is acked, expired or
+deleted.
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterable, Optional
+
+import aiofiles
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import storage
+from config import settings
+from expiry import utcnow
+from inbox import record_updates
+from models import Blob, PendingDeletion, PendingFile
+
+BLOBS_DIR = "blobs"
+STAGING_DIR = "tmp"
+STAGING_MAX_AGE = 24 * 3600  # seconds without a write before a staging file is orphaned
+TOMBSTONE_WAIT = 30.0  # seconds an upload waits for identical content to finish deleting
+TOMBSTONE_POLL = 0.1
+
+
+def blob_relative_path(sha256: str) -> str:
+    return f"{BLOBS_DIR}/{sha256[:2]}/{sha256}"
+
+
+def blob_sha256(stored_filename: str) -> Optional[str]:
+    """Digest encoded in a blob path, or None for legacy per-record files."""
+    if stored_filename.startswith(f"{BLOBS_DIR}/"):
+        return stored_filename.rsplit("/", 1)[-1]
+    return None
+
+
+def new_staging_path() -> Path:
+    path = settings.STORAGE_PATH / STAGING_DIR / uuid.uuid4().hex
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+async def write_staging(chunks: AsyncIterable[bytes]) -> tuple[Path, str, int]:
+    """Stream chunks into a new staging file, hashing as they are written.
+
+    Returns (staging path, sha256 hex digest, size).
+    """
+    path = new_staging_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def hash_file(path: Path, digest=None, start: int = 0) -> tuple[str, int]:
+    """SHA-256 and size of an existing file (for uploads written out of order).
+
+    With digest, continue it: it already covers bytes [0, start) of the file.
+    Blocking; run it with ``run_in_threadpool``.
+    """
+    digest = digest or hashlib.sha256()
+    size = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def acquire_blob(
+    db: AsyncSession, staging: Path, sha256: str, size: int, refs: int = 1
+) -> str:
+    """Take refs references on the blob for sha256, storing the staged file if new.
+
+    One reference per pending record, so an upload fanned out to several
+    receivers takes them all at once. Must be followed by ``db.commit()``.
+    Returns the storage key; raises 503 if the same content is still being
+    deleted.
+    """
+    key = blob_relative_path(sha256)
+    # A copy being deleted counts as absent, once it is gone
+    await _wait_for_deletion(db, sha256)
+    # Stored before the first write, so no lock is held while a remote
+    # backend uploads
+    stored = await storage.backend.exists(key)
+    if not stored:
+        await storage.backend.put_file(key, staging)
+
+    updated = (
+        await db.execute(
+            update(Blob)
+            .where(Blob.sha256 == sha256, Blob.deleting.is_(False))
+            .values(ref_count=Blob.ref_count + refs)
+        )
+    ).rowcount
+    if not updated:
+        if await db.get(Blob, sha256) is not None:
+            # Tombstoned since the wait; the worker cannot finish while
+            # this transaction holds the write lock
+            raise _being_deleted()
+        db.add(Blob(sha256=sha256, size=size, ref_count=refs))
+    if stored:
+        # Holding the write lock now, so no deletion can start; one that
+        # finished since the check has dropped its tombstone
+        if await storage.backend.exists(key):
+            staging.unlink(missing_ok=True)
+        else:
+            # Deleted since the check; store this copy
+            await storage.backend.put_file(key, staging)
+    return key
+
+
+def _being_deleted() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Identical content is being deleted, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _wait_for_deletion(db: AsyncSession, sha256: str) -> None:
+    """Wait while the blob for sha256 is tombstoned; 503 after TOMBSTONE_WAIT seconds.
+
+    Reads only, so the deletion worker can still take the write lock to
+    drop the tombstone. A tombstone left by a crashed worker goes once the
+    queue entry's lease expires and the deletion is retried.
+    """
+    deadline = time.monotonic() + TOMBSTONE_WAIT
+    while await db.scalar(select(Blob.deleting).where(Blob.sha256 == sha256)):
+        if time.monotonic() >= deadline:
+            raise _being_deleted()
+        await asyncio.sleep(TOMBSTONE_POLL)
+
+
+async def backfill_digests(db: AsyncSession, batch_size: int = 1000) -> None:
+    """Record size and SHA-256 on pending parts stored before they were kept per record.
+
+    Only content-addressed parts can be filled in; legacy per-record files
+    keep NULL. Bumps the receivers' inbox versions, since /files/pending
+    returns both fields.
+    """
+    while True:
+        rows = (
+            await db.execute(
+                select(PendingFile, Blob.size)
+                .join(
+                    Blob,
+                    PendingFile.stored_filename
+                    == BLOBS_DIR + "/" + func.substr(Blob.sha256, 1, 2) + "/" + Blob.sha256,
+                )
+                .where(PendingFile.status == "pending", PendingFile.sha256.is_(None))
+                .limit(batch_size)
+            )
+        ).all()
+        if not rows:
+            return
+        updated = []
+        for record, size in rows:
+            record.sha256 = blob_sha256(record.stored_filename)
+            record.size = size
+            updated.append(
+                (record.receiver_id, {"id": record.id, "size": size, "sha256": record.sha256})
+            )
+        # Runs before clients connect; they replay the deltas from the event log
+        await record_updates(db, updated)
+        await db.commit()
+
+
+async def release_blob(db: AsyncSession, stored_filename: str) -> Optional[str]:
+    """Drop one reference held by a pending record.
+
+    Returns a storage key the caller should queue for deletion, or None
+    while the blob is still referenced. Nothing is touched in storage here:
+    an unreferenced blob keeps its row at ref_count 0, and the deletion
+    worker removes it only if it is still unreferenced by then (see
+    ``claim_unreferenced``), so a rollback or a new upload of the same
+    content keeps the bytes.
+    """
+    if not stored_filename:
+        return None
+    sha256 = blob_sha256(stored_filename)
+    if sha256 is None:
+        # Legacy per-record layout: <id>/part_N
+        return stored_filename.split("/", 1)[0]
+
+    ref_count = (
+        await db.execute(
+            update(Blob)
+            .where(Blob.sha256 == sha256)
+            .values(ref_count=Blob.ref_count - 1)
+            .returning(Blob.ref_count)
+        )
+    ).scalar()
+    if ref_count is None or ref_count > 0:
+        return None
+    return stored_filename
+
+
+async def claim_unreferenced(db: AsyncSession, key: str) -> bool:
+    """Tombstone an unreferenced blob's row; False if key is in use again.
+
+    Commit, delete the object, then ``drop_tombstone``: no lock is held
+    while a remote backend deletes, and ``acquire_blob`` meanwhile waits
+    for the tombstone to go rather than taking up bytes being removed.
+    """
+    sha256 = blob_sha256(key)
+    claimed = (
+        await db.execute(
+            update(Blob)
+            .where(Blob.sha256 == sha256, Blob.ref_count <= 0)
+            .values(deleting=True)
+        )
+    ).rowcount
+    if claimed:
+        return True
+    if await db.get(Blob, sha256) is not None:
+        return False
+    # Stored by an upload that never committed its row (queue_orphan_blobs)
+    db.add(Blob(sha256=sha256, size=0, ref_count=0, deleting=True))
+    return True
+
+
+async def drop_tombstone(db: AsyncSession, key: str) -> None:
+    """Remove the row ``claim_unreferenced`` tombstoned, whether or not the object went.
+
+    A blob still stored is then an orphan like any other: the queue entry
+    retries its deletion, and an upload of the same content takes it up.
+    """
+    await db.execute(delete(Blob).where(Blob.sha256 == blob_sha256(key), Blob.deleting.is_(True)))
+
+
+async def queue_orphan_blobs(
+    db: AsyncSession, max_age: float = STAGING_MAX_AGE, batch_size: int = 1000
+) -> int:
+    """Queue stored blobs that no row refers to, once older than max_age seconds.
+
+    ``acquire_blob`` stores the object before its row is written, so an
+    upload that fails or is rolled back afterwards leaves it behind. The
+    deletion worker rechecks the row before deleting, so a blob taken up
+    again meanwhile is kept. Commits; returns the number of keys queued.
+    """
+    cutoff = time.time() - max_age
+    queued = 0
+    batch: list[str] = []
+
+    async def flush() -> int:
+        known = set(
+            await db.scalars(
+                select(Blob.sha256).where(Blob.sha256.in_([blob_sha256(k) for k in batch]))
+            )
+        )
+        pending = set(
+            await db.scalars(select(PendingDeletion.path).where(PendingDeletion.path.in_(batch)))
+        )
+        orphans = [k for k in batch if blob_sha256(k) not in known and k not in pending]
+        for key in orphans:
+            db.add(PendingDeletion(path=key, not_before=utcnow()))
+        await db.commit()
+        batch.clear()
+        return len(orphans)
+
+    async for key, stat in storage.backend.list(f"{BLOBS_DIR}/"):
+        if stat.modified < cutoff:
+            batch.append(key)
+        if len(batch) >= batch_size:
+            queued += await flush()
+    if batch:
+        queued += await flush()
+    return queued
+
+
+def remove_path(path: Path) -> None:
+    """Delete a local file or directory tree."""
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def sweep_staging(max_age: float = STAGING_MAX_AGE) -> int:
+    """Delete staging files not written to for max_age seconds.
+
+    Uploads interrupted by a crash or restart leave their staging file
+    behind, since nothing was committed for it. Blocking; returns the number
+    of files removed.
+    """
+    staging_dir = settings.STORAGE_PATH / STAGING_DIR
+    if not staging_dir.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(staging_dir):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                remove_path(Path(entry.path))
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -6,10 +7,61 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "change-me-in-production-use-long-random-string"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 8  # 8 hours
+    AUTH_CACHE_SIZE: int = 10_000  # verified tokens / principals kept in memory
+    AUTH_CACHE_TTL: float = 60  # seconds
+    HASH_WORKERS: int = 4  # bcrypt threads, separate from THREADPOOL_SIZE
+    HASH_QUEUE_LIMIT: int = 32  # hashes waiting beyond that get 503
 
+    WS_SEND_QUEUE_SIZE: int = 64  # undelivered notifications before a socket is dropped
+    WS_SEND_TIMEOUT: float = 10  # seconds a single send may stall
+    # "local" (single worker) or "unix" (fan out across uvicorn workers)
+    NOTIFY_BACKEND: str = "local"
+    NOTIFY_SOCKET_DIR: Path = Path(__file__).parent / "run"
+    EVENT_RETENTION_HOURS: int = 72  # how long /ws?since= can replay
+    EVENT_REPLAY_MAX: int = 1000  # larger gaps get a resync instead
+
+    STORAGE_BACKEND: str = "local"  # where payloads live (see storage.py)
+    # Local payloads, plus staging files for uploads in progress with any backend
     STORAGE_PATH: Path = Path(__file__).parent / "storage"
+    # STORAGE_BACKEND=s3: any S3-compatible endpoint (None = AWS)
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_BUCKET: str = "file-exchanger"
+    S3_PREFIX: str = ""  # prepended to every key, e.g. "prod/"
+    S3_ACCESS_KEY_ID: Optional[str] = None  # None = boto3's usual credential chain
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_PART_SIZE: int = 64 * 1024 ** 2  # multipart upload part; S3 needs >= 5 MiB
+    S3_UPLOAD_CONCURRENCY: int = 4  # part PUTs in flight per upload
+    S3_PRESIGN_TTL: int = 300  # seconds a download redirect stays valid
+    # Redirect plain GETs of remote objects to presigned URLs instead of proxying
+    STORAGE_REDIRECT_DOWNLOADS: bool = True
+    MAX_UPLOAD_SIZE: int = 20 * 1024 ** 3  # 20 GiB per part
+    FILE_TTL_HOURS: int = 24 * 7  # default lifetime of a pending part
+    FILE_TTL_MAX_HOURS: int = 24 * 30  # longest ttl_hours an upload may ask for
+    EXPIRY_BATCH_SIZE: int = 100  # parts expired per transaction
+    EXPIRY_PREFETCH: int = 1000  # upcoming deadlines held in memory
+    EXPIRY_RESCAN_INTERVAL: float = 60  # seconds; picks up other workers' uploads
+    DELETE_RATE: float = 50  # storage paths removed per second, at most
+    DELETE_BATCH_SIZE: int = 50  # paths claimed from the deletion queue at once
+    DELETE_POLL_INTERVAL: float = 5  # seconds between queue checks when idle
+    DELETE_RETRY_MAX_DELAY: float = 3600  # backoff cap for paths that fail to delete
 
     DATABASE_URL: str = "sqlite:///./file_exchanger.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_MAINTENANCE_INTERVAL: int = 15 * 60  # seconds
+
+    # SQLite pragmas applied to every connection (see database.sqlite_pragmas)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 30_000
+    SQLITE_CACHE_SIZE: int = -64_000  # negative = KiB, i.e. 64 MB
+    SQLITE_MMAP_SIZE: int = 256 * 1024 ** 2
+    SQLITE_TEMP_STORE: str = "MEMORY"
+
+    # Worker threads for blocking work (bcrypt, hashing, file housekeeping)
+    THREADPOOL_SIZE: int = 40
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
@@ -1,44 +1,138 @@
 import asyncio
-from typing import Dict, Set
+import json
+from typing import Dict, Optional, Set
 
 from fastapi import WebSocket
 
+from config import settings
+
+
+class _Connection:
+    """One WebSocket with its own bounded send queue and writer task.
+
+    Messages are queued as pre-encoded text, so a notification is serialised
+    once however many sockets it goes to. A socket that cannot keep up
+    (queue full) or stalls on a send (timeout) is closed rather than
+    delaying anyone else.
+    """
+
+    def __init__(
+        self, manager: "ConnectionManager", user_id: int, websocket: WebSocket, hold: bool
+    ) -> None:
+        self.manager = manager
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(settings.WS_SEND_QUEUE_SIZE)
+        # While a replay is being sent, live messages wait here as (seq, text)
+        self._held: Optional[list[tuple[Optional[int], str]]] = [] if hold else None
+        self._held_overflow = False
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, text: str, seq: Optional[int] = None) -> bool:
+        if self._held is not None:
+            if len(self._held) >= settings.WS_SEND_QUEUE_SIZE:
+                self._held_overflow = True
+            else:
+                self._held.append((seq, text))
+            return True
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def resume(self, after_seq: int) -> bool:
+        """Stop holding: queue held messages newer than after_seq.
+
+        Returns False if messages were dropped while held, in which case
+        the client should be told to resync. If they do not all fit in the
+        send queue the socket is closed, as on a live overflow, and the
+        client reconnects with ?since=.
+        """
+        held, self._held = self._held or [], None
+        for seq, text in held:
+            if (seq is None or seq > after_seq) and not self.enqueue(text):
+                self.manager.evict(self)
+                break
+        return not self._held_overflow
+
+    async def _write(self) -> None:
+        try:
+            while (text := await self.queue.get()) is not None:
+                await asyncio.wait_for(
+                    self.websocket.send_text(text), settings.WS_SEND_TIMEOUT
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Stalled or dead socket: drop it so its queue stops filling up
+            self.manager.evict(self)
+
+    async def close(self) -> None:
+        self.writer.cancel()
+        try:
+            await self.websocket.close(code=1011)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
+    """Registry of open sockets per user.
+
+    Registration and fan-out never await, so on the single event loop they
+    need no lock; slow sockets only ever block their own writer task.
+    """
+
     def __init__(self) -> None:
-        self._connections: Dict[int, Set[WebSocket]] = {}
-        self._lock = asyncio.Lock()
+        self._connections: Dict[int, Set[_Connection]] = {}
+        self.evicted = 0
 
-    async def connect(self, user_id: int, websocket: WebSocket) -> None:
+    async def connect(self, user_id: int, websocket: WebSocket, hold: bool = False) -> _Connection:
+        """Register a socket; with hold=True live messages wait for conn.resume()."""
         await websocket.accept()
-        async with self._lock:
-            self._connections.setdefault(user_id, set()).add(websocket)
+        conn = _Connection(self, user_id, websocket, hold)
+        self._connections.setdefault(user_id, set()).add(conn)
+        return conn
 
-    async def disconnect(self, user_id: int, websocket: WebSocket) -> None:
-        async with self._lock:
-            sockets = self._connections.get(user_id, set())
-            sockets.discard(websocket)
-            if not sockets:
-                self._connections.pop(user_id, None)
+    async def disconnect(self, conn: _Connection) -> None:
+        self._unregister(conn)
+        conn.writer.cancel()
 
     async def send_to_user(self, user_id: int, message: dict) -> None:
-        async with self._lock:
-            sockets = set(self._connections.get(user_id, set()))
-        # Send outside the lock to prevent deadlocks
-        dead: list[WebSocket] = []
-        for ws in sockets:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        # Clean up dead connections
-        if dead:
-            async with self._lock:
-                bucket = self._connections.get(user_id, set())
-                for ws in dead:
-                    bucket.discard(ws)
-                if not bucket:
-                    self._connections.pop(user_id, None)
+        """Queue a message on every socket of user_id; returns immediately."""
+        self.deliver(user_id, message)
+
+    def deliver(self, user_id: int, message: dict) -> None:
+        """Synchronous form of send_to_user, for callbacks outside a coroutine."""
+        conns = self._connections.get(user_id)
+        if not conns:
+            return
+        text = json.dumps(message)
+        seq = message.get("seq")
+        for conn in list(conns):
+            if not conn.enqueue(text, seq):
+                self.evict(conn)
+
+    def evict(self, conn: _Connection) -> None:
+        if self._unregister(conn):
+            self.evicted += 1
+            asyncio.create_task(conn.close())
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._connections),
+            "sockets": sum(len(c) for c in self._connections.values()),
+            "evicted": self.evicted,
+        }
+
+    def _unregister(self, conn: _Connection) -> bool:
+        bucket = self._connections.get(conn.user_id)
+        if not bucket or conn not in bucket:
+            return False
+        bucket.discard(conn)
+        if not bucket:
+            self._connections.pop(conn.user_id, None)
+        return True
 
 
 manager = ConnectionManager()
@@ -0,0 +1,86 @@
+"""HTTP content-coding support (gzip, optionally zstd) for stored payloads.
+
+Uploads may arrive already compressed (``Content-Encoding``); they are stored
+as received and the coding is recorded on ``PendingFile.content_encoding``.
+Downloads are served in that form to clients that accept it and decoded on
+the fly for the rest.
+"""
+import zlib
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from fastapi import HTTPException, status
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+SUPPORTED_CODINGS = ("gzip", "zstd") if zstandard is not None else ("gzip",)
+
+
+def parse_content_encoding(header: Optional[str]) -> Optional[str]:
+    """Validate a request Content-Encoding; None means identity."""
+    if header is None:
+        return None
+    coding = header.strip().lower()
+    if coding in ("", "identity"):
+        return None
+    if coding not in SUPPORTED_CODINGS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding: {header}",
+        )
+    return coding
+
+
+def accepts_coding(accept_encoding: Optional[str], coding: str) -> bool:
+    """True if an Accept-Encoding header allows the given coding."""
+    if not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if name not in (coding, "*"):
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def _decompressor(coding: str):
+    if coding == "gzip":
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if coding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Cannot decode {coding}")
+
+
+async def iter_decoded(chunks: AsyncIterable[bytes], coding: str) -> AsyncIterator[bytes]:
+    """Stream stored bytes (e.g. ``storage.backend.read_range``), undoing their content-coding."""
+    decompressor = _decompressor(coding)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if coding == "gzip":
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def decode_chunks(chunks: Iterable[bytes], coding: str) -> Iterator[bytes]:
+    """Blocking counterpart of iter_decoded over any stream of chunks."""
+    decompressor = _decompressor(coding)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if coding == "gzip":
+        tail = decompressor.flush()
+        if tail:
+            yield tail
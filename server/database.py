@@ -1,23 +1,157 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import asyncio
+import logging
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
 from config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False, "timeout": 30},
+logger = logging.getLogger(__name__)
+
+
+def _async_url(url: str) -> str:
+    """Map a plain sqlite:// URL onto the aiosqlite driver."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def sqlite_pragmas() -> dict[str, object]:
+    """Per-connection storage-engine profile, from settings."""
+    return {
+        # WAL lets readers run alongside the single writer
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        # NORMAL is durable across application crashes in WAL mode; only an
+        # OS crash/power loss can roll back the last transactions
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        # SQLite's busy handler retries with increasing sleeps up to this long
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+
+def configure_sqlite(sync_engine: Engine) -> None:
+    """Apply ``sqlite_pragmas()`` to every new DBAPI connection of an engine."""
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    if not url.startswith("sqlite"):
+        return {}
+    if ":memory:" in url or url.rstrip("/").endswith(":"):
+        return {"poolclass": StaticPool}
+    # aiosqlite defaults to NullPool, i.e. a new connection (and a replay of
+    # every pragma) per session; keep a bounded set of warm connections.
+    return {
+        "connect_args": {"timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
+engine = create_async_engine(
+    _async_url(settings.DATABASE_URL),
+    **_engine_options(settings.DATABASE_URL),
 )
+configure_sqlite(engine.sync_engine)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and in async code, impossible) lazy refresh.
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
     pass
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def release_connection(db: AsyncSession) -> None:
+    """End the session's implicit transaction and return its connection.
+
+    Call before long non-database work (streaming a request body, hashing a
+    file) so the request neither pins a pooled connection nor keeps a WAL
+    read snapshot open. Loaded objects stay usable (expire_on_commit=False);
+    the next query starts a fresh transaction.
+    """
+    await db.commit()
+
+
+def upgrade_schema(bind) -> None:
+    """Add columns and indexes introduced after the database was created.
+
+    create_all() only creates missing tables, so existing deployments would
+    otherwise fail with "no such column" after an upgrade. Takes a sync
+    connection; from async code use ``conn.run_sync(upgrade_schema)``.
+    """
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} " + (
+                column.type.compile(dialect=bind.dialect)
+            )
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            bind.execute(text(ddl))
+        indexes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind)
+
+
+async def init_schema(async_engine: AsyncEngine = engine) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+
+async def run_maintenance(async_engine: AsyncEngine = engine) -> None:
+    """Fold the WAL back into the main file and refresh planner statistics.
+
+    Without periodic checkpoints a busy WAL file only ever grows, and every
+    reader has to scan it.
+    """
+    if async_engine.dialect.name != "sqlite":
+        return
+    async with async_engine.connect() as conn:
+        await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        await conn.exec_driver_sql("PRAGMA optimize")
+
+
+async def maintenance_loop(async_engine: AsyncEngine = engine) -> None:
+    """Background task: run ``run_maintenance`` every DB_MAINTENANCE_INTERVAL seconds."""
+    while True:
+        try:
+            await asyncio.sleep(settings.DB_MAINTENANCE_INTERVAL)
+            await run_maintenance(async_engine)
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            # Retried on the next interval
+            logger.exception("Database maintenance failed")
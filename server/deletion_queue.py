@@ -0,0 +1,184 @@
+"""Durable, rate-limited removal of unreferenced storage.
+
+When an ack, expiry or user deletion releases the last reference to a blob,
+its storage key is queued here in the same transaction. The space is
+therefore reclaimed even if the process restarts first, and nothing is lost
+if that transaction rolls back. A blob is only deleted if it is still
+unreferenced when its turn comes; one uploaded again meanwhile is kept.
+
+``DeletionWorker`` claims due keys in batches and deletes them through the
+storage backend, at no more than ``DELETE_RATE`` per second. It pauses while
+the threadpool is busy serving requests, and retries failed removals with
+exponential backoff.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from anyio import to_thread
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import storage
+from blob_store import blob_sha256, claim_unreferenced, drop_tombstone
+from config import settings
+from expiry import utcnow
+from models import PendingDeletion
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed path is hidden from other workers
+CLAIM_LEASE = timedelta(minutes=10)
+BUSY_PAUSE = 1.0  # seconds to yield to requests before each removal under load
+
+
+async def enqueue_deletions(
+    db: AsyncSession, keys: Iterable[str], not_before: Optional[datetime] = None
+) -> None:
+    """Queue storage keys for removal; commit together with the change that orphaned them."""
+    for key in keys:
+        db.add(PendingDeletion(path=key, not_before=not_before or utcnow()))
+
+
+async def _remove(key: str) -> bool:
+    """True once nothing is left at key."""
+    try:
+        await storage.backend.delete(key)
+        return not await storage.backend.exists(key)
+    except OSError:
+        return False
+
+
+async def _remove_blob(db_factory, key: str) -> bool:
+    """Delete an unreferenced blob and its row; True once done or in use again.
+
+    The row is tombstoned and committed first, so the write lock is not
+    held while the backend deletes.
+    """
+    async with db_factory() as db:
+        if not await claim_unreferenced(db, key):
+            await db.rollback()
+            return True
+        await db.commit()
+    try:
+        return await _remove(key)
+    finally:
+        async with db_factory() as db:
+            await drop_tombstone(db, key)
+            await db.commit()
+
+
+def _threadpool_busy() -> bool:
+    limiter = to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    return stats.tasks_waiting > 0 or stats.borrowed_tokens * 2 >= limiter.total_tokens
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, settings.DELETE_RETRY_MAX_DELAY))
+
+
+class DeletionWorker:
+    def __init__(self) -> None:
+        self._wake = asyncio.Event()
+        self.backlog = 0
+        self.deleted = 0
+        self.failed = 0
+        self.busy_pauses = 0
+
+    def wake(self) -> None:
+        """Hint that new paths were committed; otherwise they wait for the next poll."""
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.backlog,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "busy_pauses": self.busy_pauses,
+        }
+
+    async def run(self, db_factory) -> None:
+        """Background task: drain the queue, then poll every DELETE_POLL_INTERVAL."""
+        while True:
+            try:
+                if await self.run_once(db_factory):
+                    continue
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.DELETE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                # Don't let disk cleanup crash the server; retried on the next poll
+                logger.exception("Deletion worker failed")
+                await asyncio.sleep(settings.DELETE_POLL_INTERVAL)
+
+    async def run_once(self, db_factory) -> int:
+        """Claim and process one batch of due paths; returns how many were claimed."""
+        async with db_factory() as db:
+            claimed = await self._claim(db)
+            self.backlog = await db.scalar(
+                select(func.count()).select_from(PendingDeletion)
+            )
+            await db.commit()
+        if not claimed:
+            return 0
+
+        done: list[int] = []
+        failed: list[tuple[int, int]] = []
+        for item_id, path, attempts in claimed:
+            if _threadpool_busy():
+                self.busy_pauses += 1
+                await asyncio.sleep(BUSY_PAUSE)
+            if blob_sha256(path) is not None:
+                removed = await _remove_blob(db_factory, path)
+            else:
+                removed = await _remove(path)
+            if removed:
+                done.append(item_id)
+            else:
+                failed.append((item_id, attempts + 1))
+            await asyncio.sleep(1 / settings.DELETE_RATE)
+
+        async with db_factory() as db:
+            if done:
+                await db.execute(delete(PendingDeletion).where(PendingDeletion.id.in_(done)))
+            for item_id, attempts in failed:
+                await db.execute(
+                    update(PendingDeletion)
+                    .where(PendingDeletion.id == item_id)
+                    .values(attempts=attempts, not_before=utcnow() + _retry_delay(attempts))
+                )
+            await db.commit()
+        self.deleted += len(done)
+        self.failed += len(failed)
+        self.backlog = max(self.backlog - len(done), 0)
+        return len(claimed)
+
+    async def _claim(self, db: AsyncSession) -> list[tuple[int, str, int]]:
+        now = utcnow()
+        ids = (
+            await db.scalars(
+                select(PendingDeletion.id)
+                .where(PendingDeletion.not_before <= now)
+                .order_by(PendingDeletion.id)
+                .limit(settings.DELETE_BATCH_SIZE)
+            )
+        ).all()
+        if not ids:
+            return []
+        # Conditional on not_before, so two workers never claim the same path
+        result = await db.execute(
+            update(PendingDeletion)
+            .where(PendingDeletion.id.in_(ids), PendingDeletion.not_before <= now)
+            .values(not_before=now + CLAIM_LEASE)
+            .returning(PendingDeletion.id, PendingDeletion.path, PendingDeletion.attempts)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+deletion_worker = DeletionWorker()
@@ -0,0 +1,66 @@
+"""Per-user, sequenced log of WebSocket notifications.
+
+Every notification is stored with the next value of ``User.event_seq`` in the
+same transaction as the change it describes, then published. A client that
+reconnects with ``/ws?since=<seq>`` gets the events it missed replayed in
+order, or a single ``{"event": "resync"}`` when they are no longer all
+available (pruned, too many, or the server's log was reset).
+"""
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Event, User
+
+
+async def record_event(db: AsyncSession, user_id: int, message: dict) -> dict:
+    """Append message to user_id's stream; returns it with its "seq".
+
+    Commit with the change itself, and publish the returned message only
+    after the commit.
+    """
+    seq = await db.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(event_seq=User.event_seq + 1)
+        .returning(User.event_seq)
+        .execution_options(synchronize_session=False)
+    )
+    event = {**message, "seq": seq}
+    db.add(Event(user_id=user_id, seq=seq, payload=json.dumps(event)))
+    return event
+
+
+async def replay(db: AsyncSession, user_id: int, since: int) -> tuple[Optional[list[str]], int]:
+    """Encoded events after since, and the current seq.
+
+    The list is None when the client has to resync instead.
+    """
+    current = await db.scalar(select(User.event_seq).where(User.id == user_id)) or 0
+    missed = current - since
+    if missed < 0 or missed > settings.EVENT_REPLAY_MAX:
+        return None, current
+    payloads = (
+        await db.scalars(
+            select(Event.payload)
+            .where(Event.user_id == user_id, Event.seq > since)
+            .order_by(Event.seq)
+        )
+    ).all()
+    if len(payloads) != missed:
+        return None, current  # some were pruned
+    return list(payloads), current
+
+
+def resync_message(seq: int) -> dict:
+    return {"event": "resync", "seq": seq}
+
+
+async def prune_events(db: AsyncSession, cutoff: datetime) -> None:
+    """Drop events created before cutoff."""
+    await db.execute(delete(Event).where(Event.created_at < cutoff))
+    await db.commit()
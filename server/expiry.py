@@ -0,0 +1,162 @@
+"""Deadline-driven expiry of pending parts.
+
+Every pending part carries its own ``expires_at``. Rather than scanning the
+table on a timer, the scheduler holds the next ``EXPIRY_PREFETCH`` deadlines
+in a heap (loaded through ``ix_pending_files_expiry``), sleeps until the
+earliest one is due and expires due parts in transactions of at most
+``EXPIRY_BATCH_SIZE``, so no single sweep holds the write lock for long.
+
+Uploads handled by this process are pushed in directly with ``schedule``;
+a rescan every ``EXPIRY_RESCAN_INTERVAL`` seconds picks up those of other
+uvicorn workers. Expiring is idempotent (a conditional status update), so
+workers racing on the same deadline are harmless.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from inbox import record_updates
+from models import PendingFile
+
+logger = logging.getLogger(__name__)
+
+ExpireFn = Callable[[AsyncSession, list[int]], Awaitable[int]]
+
+
+def utcnow() -> datetime:
+    """Naive UTC, the form SQLite hands DateTime columns back in."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ExpiryScheduler:
+    def __init__(self) -> None:
+        self._heap: list[tuple[datetime, int]] = []
+        self._queued: set[int] = set()
+        # Deadlines after this were not loaded; None means the heap has them all
+        self._horizon: Optional[datetime] = None
+        self._wake = asyncio.Event()
+        self.expired = 0
+
+    def schedule(self, file_id: int, expires_at: Optional[datetime]) -> None:
+        """Track a new part's deadline; wakes the loop if it is now the earliest."""
+        if expires_at is None or file_id in self._queued:
+            return
+        deadline = _naive_utc(expires_at)
+        if self._horizon is not None and deadline > self._horizon:
+            return  # beyond the loaded window; a later load finds it
+        heapq.heappush(self._heap, (deadline, file_id))
+        self._queued.add(file_id)
+        if self._heap[0][1] == file_id:
+            self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._heap),
+            "next_deadline": self._heap[0][0].isoformat() if self._heap else None,
+            "expired": self.expired,
+        }
+
+    async def run(self, db_factory, expire: ExpireFn) -> None:
+        """Background task. ``expire(db, ids)`` expires what is still due and commits."""
+        backfilled = False
+        loaded_at = float("-inf")
+        while True:
+            try:
+                if not backfilled:
+                    async with db_factory() as db:
+                        await backfill_expires_at(db)
+                    backfilled = True
+                if time.monotonic() - loaded_at >= settings.EXPIRY_RESCAN_INTERVAL:
+                    await self._load(db_factory)
+                    loaded_at = time.monotonic()
+
+                due = self._pop_due(utcnow(), settings.EXPIRY_BATCH_SIZE)
+                if due:
+                    async with db_factory() as db:
+                        self.expired += await expire(db, due)
+                    continue
+                if not self._heap and self._horizon is not None:
+                    loaded_at = float("-inf")
+                    continue  # window used up: load the next one
+
+                timeout = settings.EXPIRY_RESCAN_INTERVAL - (time.monotonic() - loaded_at)
+                if self._heap:
+                    until_due = (self._heap[0][0] - utcnow()).total_seconds()
+                    timeout = min(timeout, until_due)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                # Don't let expiry crash the server; retry after a pause
+                logger.exception("Expiry failed")
+                await asyncio.sleep(settings.EXPIRY_RESCAN_INTERVAL)
+
+    async def _load(self, db_factory) -> None:
+        limit = settings.EXPIRY_PREFETCH
+        async with db_factory() as db:
+            rows = (
+                await db.execute(
+                    select(PendingFile.expires_at, PendingFile.id)
+                    .where(PendingFile.status == "pending", PendingFile.expires_at.is_not(None))
+                    .order_by(PendingFile.expires_at)
+                    .limit(limit)
+                )
+            ).all()
+        self._heap = [(_naive_utc(deadline), file_id) for deadline, file_id in rows]
+        heapq.heapify(self._heap)
+        self._queued = {file_id for _, file_id in self._heap}
+        self._horizon = _naive_utc(rows[-1][0]) if len(rows) == limit else None
+
+    def _pop_due(self, now: datetime, limit: int) -> list[int]:
+        due = []
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            _, file_id = heapq.heappop(self._heap)
+            self._queued.discard(file_id)
+            due.append(file_id)
+        return due
+
+
+async def backfill_expires_at(db: AsyncSession) -> None:
+    """Give parts stored before per-file deadlines the default TTL.
+
+    Bumps the receivers' inbox versions, since /files/pending returns the field.
+    """
+    while True:
+        records = (
+            await db.scalars(
+                select(PendingFile)
+                .where(PendingFile.status == "pending", PendingFile.expires_at.is_(None))
+                .limit(settings.EXPIRY_BATCH_SIZE)
+            )
+        ).all()
+        if not records:
+            return
+        updated = []
+        for record in records:
+            record.expires_at = record.created_at + timedelta(hours=settings.FILE_TTL_HOURS)
+            updated.append(
+                (record.receiver_id, {"id": record.id, "expires_at": record.expires_at.isoformat()})
+            )
+        # Clients replay the deltas from the event log
+        await record_updates(db, updated)
+        await db.commit()
+
+
+scheduler = ExpiryScheduler()
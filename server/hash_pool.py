@@ -0,0 +1,81 @@
+"""Dedicated, admission-controlled executor for password hashing.
+
+bcrypt costs ~250 ms of CPU per call. Run on the shared anyio threadpool it
+competes with file I/O and hashing for every other request, so a login
+storm starves file traffic. Here it gets its own small pool, and callers
+beyond ``workers + queue_limit`` get an immediate 503 instead of queueing
+without bound.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from config import settings
+
+
+class HashPool:
+    def __init__(self, workers: int, queue_limit: int) -> None:
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._wait_seconds = 0.0
+        self._hash_seconds = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) on the pool, or raise 503 if the queue is full."""
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_limit:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent logins, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._in_flight += 1
+        # The slot is freed when the work finishes (or is cancelled before it
+        # starts), not when the awaiting request goes away.
+        future: Future = self._executor.submit(self._timed, time.perf_counter(), fn, args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _timed(self, submitted: float, fn: Callable[..., Any], args: tuple) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._completed += 1
+                self._wait_seconds += started - submitted
+                self._hash_seconds += finished - started
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.workers),
+                "rejected": self._rejected,
+                "completed": completed,
+                "avg_wait_ms": round(1000 * self._wait_seconds / completed, 1) if completed else 0.0,
+                "avg_hash_ms": round(1000 * self._hash_seconds / completed, 1) if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hash_pool = HashPool(settings.HASH_WORKERS, settings.HASH_QUEUE_LIMIT)
@@ -0,0 +1,85 @@
+"""Per-receiver inbox versioning and delta events.
+
+``User.inbox_version`` is bumped in the same transaction as any change to a
+user's set of pending files (new part, ack, expiry, sender deletion). It
+backs the ETag of ``GET /files/pending``, so an unchanged inbox can be
+answered with 304 from a single primary-key lookup.
+
+Every bump also records exactly one delta event carrying the new
+``inbox_version``: ``new_file`` with the complete record,
+``files_removed`` with the ids that left the inbox, or ``files_updated``
+with the fields that maintenance (digest backfill, storage migration)
+rewrote on pending records. A client holding version
+N applies a delta for N + 1, ignores older ones and refreshes on a gap.
+"""
+from typing import Iterable
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from event_log import record_event
+from models import User
+
+REMOVED_DELIVERED = "delivered"
+REMOVED_EXPIRED = "expired"
+REMOVED_DELETED = "deleted"
+
+
+async def record_inbox_change(db: AsyncSession, receiver_id: int, delta: dict) -> dict:
+    """Bump the receiver's inbox version and log the delta that explains it.
+
+    Commit with the change itself, then ``notify`` the returned event.
+    """
+    version = await db.scalar(
+        update(User)
+        .where(User.id == receiver_id)
+        .values(inbox_version=User.inbox_version + 1)
+        .returning(User.inbox_version)
+        .execution_options(synchronize_session=False)
+    )
+    return await record_event(db, receiver_id, {**delta, "inbox_version": version})
+
+
+async def record_removals(
+    db: AsyncSession, removed: Iterable[tuple[int, int]], reason: str
+) -> list[tuple[int, dict]]:
+    """One ``files_removed`` delta per receiver for (receiver_id, file_id) pairs.
+
+    Returns (receiver_id, event) pairs to notify after the commit.
+    """
+    by_receiver: dict[int, list[int]] = {}
+    for receiver_id, file_id in removed:
+        by_receiver.setdefault(receiver_id, []).append(file_id)
+    events = []
+    for receiver_id, file_ids in sorted(by_receiver.items()):
+        delta = {"event": "files_removed", "file_ids": sorted(file_ids), "reason": reason}
+        events.append((receiver_id, await record_inbox_change(db, receiver_id, delta)))
+    return events
+
+
+async def record_updates(
+    db: AsyncSession, updated: Iterable[tuple[int, dict]]
+) -> list[tuple[int, dict]]:
+    """One ``files_updated`` delta per receiver for (receiver_id, changed fields) pairs.
+
+    Each dict holds the record's ``id`` and the fields that changed.
+    Returns (receiver_id, event) pairs to notify after the commit.
+    """
+    by_receiver: dict[int, list[dict]] = {}
+    for receiver_id, fields in updated:
+        by_receiver.setdefault(receiver_id, []).append(fields)
+    events = []
+    for receiver_id, files in sorted(by_receiver.items()):
+        delta = {"event": "files_updated", "files": sorted(files, key=lambda f: f["id"])}
+        events.append((receiver_id, await record_inbox_change(db, receiver_id, delta)))
+    return events
+
+
+async def inbox_state(db: AsyncSession, user_id: int) -> tuple[int, int]:
+    """(inbox_version, event_seq) of a user in one primary-key lookup."""
+    row = (
+        await db.execute(
+            select(User.inbox_version, User.event_seq).where(User.id == user_id)
+        )
+    ).first()
+    return (row[0], row[1]) if row else (0, 0)
@@ -1,39 +1,82 @@
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 
-from fastapi import FastAPI
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only
+    fcntl = None
 
-from auth import init_admin
+from anyio import to_thread
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from auth import get_current_admin, init_admin
+from blob_store import backfill_digests, sweep_staging
 from config import settings
-from database import Base, SessionLocal, engine
+from connection_manager import manager
+from database import AsyncSessionLocal, engine, init_schema, maintenance_loop, run_maintenance
+from deletion_queue import deletion_worker
+from expiry import scheduler as expiry_scheduler
+from hash_pool import hash_pool
+import notification_bus
+import storage
+from principal_cache import principal_cache
 from routes.auth import router as auth_router
-from routes.files import cleanup_expired_files, router as files_router
+from routes.files import expire_files, housekeeping, router as files_router
+from routes.transfers import router as transfers_router
+from routes.uploads import router as uploads_router
 from routes.users import router as users_router
 from routes.ws import router as ws_router
 
 
+@contextmanager
+def _startup_lock():
+    """Serialise schema setup and admin bootstrap across uvicorn workers."""
+    settings.STORAGE_PATH.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(settings.STORAGE_PATH / ".startup.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    Base.metadata.create_all(bind=engine)
-    settings.STORAGE_PATH.mkdir(parents=True, exist_ok=True)
+    to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    storage.backend = storage.create_backend()
+    with _startup_lock():
+        await init_schema()
+        async with AsyncSessionLocal() as db:
+            await init_admin(db)
+            await backfill_digests(db)
+    await run_in_threadpool(sweep_staging)
 
-    db = SessionLocal()
-    try:
-        init_admin(db)
-    finally:
-        db.close()
+    notification_bus.bus = notification_bus.create_bus()
+    await notification_bus.bus.start()
 
-    cleanup_task = asyncio.create_task(cleanup_expired_files(SessionLocal))
+    expiry_task = asyncio.create_task(expiry_scheduler.run(AsyncSessionLocal, expire_files))
+    housekeeping_task = asyncio.create_task(housekeeping(AsyncSessionLocal))
+    deletion_task = asyncio.create_task(deletion_worker.run(AsyncSessionLocal))
+    maintenance_task = asyncio.create_task(maintenance_loop())
 
     yield
 
     # Shutdown
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+    for task in (expiry_task, housekeeping_task, deletion_task, maintenance_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await notification_bus.bus.stop()
+    await run_maintenance()
+    await engine.dispose()
+    hash_pool.shutdown()
 
 
 app = FastAPI(title="File Exchanger", version="1.0.0", lifespan=lifespan)
@@ -41,9 +84,30 @@ app = FastAPI(title="File Exchanger", version="1.0.0", lifespan=lifespan)
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(files_router)
+app.include_router(uploads_router)
+app.include_router(transfers_router)
 app.include_router(ws_router)
 
 
 @app.get("/health", tags=["health"])
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", tags=["health"], dependencies=[Depends(get_current_admin)])
+async def metrics():
+    """Runtime counters for capacity tuning (admin only)."""
+    limiter = to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    return {
+        "threadpool": {
+            "size": limiter.total_tokens,
+            "busy": stats.borrowed_tokens,
+            "waiting": stats.tasks_waiting,
+        },
+        "auth_cache": principal_cache.stats(),
+        "hash_pool": hash_pool.stats(),
+        "expiry": expiry_scheduler.stats(),
+        "deletion_queue": deletion_worker.stats(),
+        "websockets": manager.stats(),
+    }
@@ -0,0 +1,192 @@
+"""Move parts from the legacy per-record layout into the blob store.
+
+Before content addressing, every part lived in its own directory,
+``<id>/part_N``, all of them siblings at the top of the storage. This copies
+each still-pending legacy part to ``blobs/<aa>/<sha256>`` (hashing it on the
+way), points its record there, and queues the old directory for deletion.
+Directories that no pending record refers to any more are queued too.
+
+Safe to run while the server is up. Each part is switched in its own short
+transaction, conditional on the record still being pending under its old
+key, so a part acked meanwhile is skipped. Old directories are only deleted
+after a grace period, so downloads already reading them can finish.
+
+    python migrate_storage.py [--batch-size 100] [--grace-minutes 60] [--dry-run]
+"""
+import argparse
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import select, update
+
+import storage
+from blob_store import BLOBS_DIR, acquire_blob, blob_relative_path, write_staging
+from database import AsyncSessionLocal, init_schema
+from deletion_queue import enqueue_deletions
+from expiry import utcnow
+from inbox import record_updates
+from models import PendingDeletion, PendingFile
+
+LEGACY_DIR = re.compile(r"^\d+$")
+
+
+@dataclass
+class MigrationStats:
+    migrated: int = 0
+    skipped: int = 0  # acked, expired or moved by someone else meanwhile
+    missing: int = 0  # record points at a file that is gone
+    orphans: int = 0  # legacy directories queued that no pending record uses
+
+
+def _legacy_dir(key: str) -> str:
+    return key.split("/", 1)[0]
+
+
+async def migrate_part(db_factory, record_id: int, key: str, grace: timedelta) -> bool:
+    """Copy one legacy part into the blob store and repoint its record.
+
+    Returns False if the record changed underneath; the blob stored for it
+    is then queued for deletion (kept if something else refers to it).
+    Raises FileNotFoundError if the legacy file is gone.
+    """
+    staging, sha256, size = await write_staging(storage.backend.read_range(key))
+    new_key = blob_relative_path(sha256)
+    async with db_factory() as db:
+        try:
+            # The blob goes in first, so no write lock is held while a remote
+            # backend uploads it
+            await acquire_blob(db, staging, sha256, size)
+            receiver_id = await db.scalar(
+                update(PendingFile)
+                .where(
+                    PendingFile.id == record_id,
+                    PendingFile.stored_filename == key,
+                    PendingFile.status == "pending",
+                )
+                .values(stored_filename=new_key, sha256=sha256, size=size)
+                .returning(PendingFile.receiver_id)
+                .execution_options(synchronize_session=False)
+            )
+            if receiver_id is not None:
+                await enqueue_deletions(db, [_legacy_dir(key)], not_before=utcnow() + grace)
+                # /files/pending returns these fields. This process has no
+                # sockets; clients pick the delta up from the event log.
+                changed = {"id": record_id, "stored_filename": new_key, "size": size, "sha256": sha256}
+                await record_updates(db, [(receiver_id, changed)])
+                await db.commit()
+                return True
+            await db.rollback()
+        except BaseException:
+            await db.rollback()
+            staging.unlink(missing_ok=True)
+            await _abandon(db_factory, new_key)
+            raise
+    await _abandon(db_factory, new_key)
+    return False
+
+
+async def _abandon(db_factory, blob_key: str) -> None:
+    """Queue a blob stored for a migration that did not happen.
+
+    The deletion worker keeps it if another record took it up meanwhile.
+    """
+    async with db_factory() as db:
+        await enqueue_deletions(db, [blob_key])
+        await db.commit()
+
+
+async def migrate(
+    db_factory, batch_size: int = 100, grace: timedelta = timedelta(hours=1),
+    dry_run: bool = False,
+) -> MigrationStats:
+    """Migrate every pending legacy part, then queue orphaned legacy directories."""
+    stats = MigrationStats()
+    after_id = 0
+    while True:
+        async with db_factory() as db:
+            batch = (
+                await db.execute(
+                    select(PendingFile.id, PendingFile.stored_filename)
+                    .where(
+                        PendingFile.status == "pending",
+                        PendingFile.id > after_id,
+                        PendingFile.stored_filename.not_like(f"{BLOBS_DIR}/%"),
+                    )
+                    .order_by(PendingFile.id)
+                    .limit(batch_size)
+                )
+            ).all()
+        if not batch:
+            break
+        after_id = batch[-1][0]
+        for record_id, key in batch:
+            if dry_run:
+                stats.migrated += 1
+                continue
+            try:
+                if await migrate_part(db_factory, record_id, key, grace):
+                    stats.migrated += 1
+                else:
+                    stats.skipped += 1
+            except FileNotFoundError:
+                stats.missing += 1
+
+    stats.orphans = await queue_orphans(db_factory, grace, dry_run)
+    return stats
+
+
+async def queue_orphans(db_factory, grace: timedelta, dry_run: bool = False) -> int:
+    """Queue legacy directories that no pending record uses and nothing has queued yet."""
+    found: set[str] = set()
+    async for key, _ in storage.backend.list():
+        top = _legacy_dir(key)
+        if "/" in key and LEGACY_DIR.match(top):
+            found.add(top)
+    if not found:
+        return 0
+    async with db_factory() as db:
+        in_use = {
+            _legacy_dir(key)
+            for key in await db.scalars(
+                select(PendingFile.stored_filename).where(
+                    PendingFile.status == "pending",
+                    PendingFile.stored_filename.not_like(f"{BLOBS_DIR}/%"),
+                )
+            )
+        }
+        queued = set(
+            await db.scalars(select(PendingDeletion.path).where(PendingDeletion.path.in_(found)))
+        )
+        orphans = sorted(found - in_use - queued)
+        if not dry_run:
+            await enqueue_deletions(db, orphans, not_before=utcnow() + grace)
+            await db.commit()
+    return len(orphans)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--grace-minutes", type=int, default=60,
+        help="keep old directories this long for downloads in progress",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = parser.parse_args()
+
+    storage.backend = storage.create_backend()
+    await init_schema()
+    stats = await migrate(
+        AsyncSessionLocal, args.batch_size, timedelta(minutes=args.grace_minutes), args.dry_run
+    )
+    print(
+        f"{'Would migrate' if args.dry_run else 'Migrated'} {stats.migrated} parts; "
+        f"skipped {stats.skipped}, missing {stats.missing}; "
+        f"{stats.orphans} orphaned directories queued for deletion"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
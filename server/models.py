@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 from sqlalchemy import (
-    Boolean, DateTime, ForeignKey, Index, Integer, String, Text
+    BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, String, Text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -15,6 +15,14 @@ class User(Base):
     password_hash: Mapped[str] = mapped_column(String(128), nullable=False)
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
     force_change_password: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Bumped whenever the user's pending inbox changes (see inbox.py)
+    inbox_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # Sequence number of the user's last WebSocket event (see event_log.py)
+    event_seq: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(timezone.utc)
     )
@@ -29,23 +37,41 @@ class User(Base):
 
 class PendingFile(Base):
     __tablename__ = "pending_files"
+    __table_args__ = (
+        # Serves the inbox query: WHERE receiver_id=? AND status=? ORDER BY id
+        Index("ix_pending_files_inbox", "receiver_id", "status", "id"),
+        # Serves the expiry scheduler: WHERE status=? ORDER BY expires_at
+        Index("ix_pending_files_expiry", "status", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     sender_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
     receiver_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("users.id"), nullable=False, index=True
+        Integer, ForeignKey("users.id"), nullable=False
     )
     original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
     stored_filename: Mapped[str] = mapped_column(String(255), nullable=False)
     part_number: Mapped[int] = mapped_column(Integer, default=1)
     total_parts: Mapped[int] = mapped_column(Integer, default=1)
     comment: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Content-coding of the stored bytes ("gzip", "zstd"); NULL means identity
+    content_encoding: Mapped[str | None] = mapped_column(String(16), nullable=True)
     status: Mapped[str] = mapped_column(String(16), default="pending")
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(timezone.utc)
     )
+    # Size and SHA-256 of the stored bytes, computed while the upload was
+    # written; NULL for parts stored before they were recorded
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # When the part expires if not acknowledged (see expiry.py)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # The logical file this part belongs to (see transfers.py)
+    transfer_id: Mapped[int | None] = mapped_column(
+        Integer, ForeignKey("transfers.id"), nullable=True, index=True
+    )
 
     sender: Mapped["User"] = relationship(
         "User", foreign_keys=[sender_id], back_populates="sent_files"
@@ -54,3 +80,125 @@ class PendingFile(Base):
         "User", foreign_keys=[receiver_id], back_populates="received_files"
     )
 
+
+class Transfer(Base):
+    """One logical file, sent as total_parts PendingFile parts."""
+
+    __tablename__ = "transfers"
+    __table_args__ = (
+        Index("ix_transfers_lookup", "receiver_id", "sender_id", "original_filename"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    sender_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    receiver_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    total_parts: Mapped[int] = mapped_column(Integer, default=1)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+    parts: Mapped[list["PendingFile"]] = relationship(
+        "PendingFile", order_by="PendingFile.part_number", lazy="selectin"
+    )
+
+
+class Blob(Base):
+    """Content-addressed payload shared by every PendingFile with the same bytes."""
+
+    __tablename__ = "blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Set while the deletion worker removes the object; the row goes after
+    deleting: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default="0"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class UploadSession(Base):
+    """A resumable upload: bytes are PATCHed at offsets into a staging file."""
+
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    sender_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), nullable=False, index=True
+    )
+    receiver_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), nullable=False
+    )
+    # Comma-separated ids when the upload goes to several receivers
+    receiver_ids: Mapped[str | None] = mapped_column(Text, nullable=True)
+    original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    part_number: Mapped[int] = mapped_column(Integer, default=1)
+    total_parts: Mapped[int] = mapped_column(Integer, default=1)
+    comment: Mapped[str | None] = mapped_column(Text, nullable=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    content_encoding: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    ttl_hours: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # SHA-256 the sender declared for the whole body, checked on completion
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+    ranges: Mapped[list["UploadRange"]] = relationship(
+        "UploadRange",
+        cascade="all, delete-orphan",
+        order_by="UploadRange.start",
+        lazy="selectin",
+    )
+
+
+class UploadRange(Base):
+    """A byte range [start, end) already written into an upload session."""
+
+    __tablename__ = "upload_ranges"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("upload_sessions.id"), nullable=False, index=True
+    )
+    start: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    end: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class Event(Base):
+    """A notification in a user's replayable WebSocket stream."""
+
+    __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_user_seq", "user_id", "seq", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    # JSON message exactly as sent, including its "seq"
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), index=True
+    )
+
+
+class PendingDeletion(Base):
+    """Storage to remove once nothing references it (see deletion_queue.py)."""
+
+    __tablename__ = "deletion_queue"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Storage key (see storage.py)
+    path: Mapped[str] = mapped_column(String(512), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Not picked up before this (retry backoff, or another worker's lease)
+    not_before: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), index=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
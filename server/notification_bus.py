@@ -0,0 +1,126 @@
+"""Fan-out of WebSocket notifications across uvicorn worker processes.
+
+Each worker only holds its own clients' sockets (``connection_manager``), so
+an event raised in one worker must reach the others. ``publish`` delivers
+locally and, with the ``unix`` backend, sends one datagram to every other
+worker's socket in NOTIFY_SOCKET_DIR. No external service is needed, and a
+worker that died is detected on the next send and its socket file removed.
+
+The ``unix`` bus also carries committed user changes, so every worker drops
+its cached principal for that user (see principal_cache.py).
+
+Delivery is best-effort, like the WebSocket itself: a peer whose receive
+buffer is full misses the event rather than blocking the publisher. A missed
+user change is still bounded by AUTH_CACHE_TTL.
+"""
+import asyncio
+import json
+import os
+import socket
+from pathlib import Path
+from typing import Callable, Optional
+
+from config import settings
+from connection_manager import manager
+from principal_cache import principal_cache
+
+Deliver = Callable[[int, dict], None]
+
+MAX_DATAGRAM = 64 * 1024
+
+
+class LocalBus:
+    """Single-process bus: events only go to this worker's sockets."""
+
+    def __init__(self, deliver: Optional[Deliver] = None) -> None:
+        self._deliver = deliver or manager.deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, user_id: int, message: dict) -> None:
+        self._deliver(user_id, message)
+
+
+class UnixSocketBus(LocalBus):
+    """Peer-to-peer bus over AF_UNIX datagram sockets, one per worker."""
+
+    def __init__(self, directory: Path, deliver: Optional[Deliver] = None) -> None:
+        super().__init__(deliver)
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}.sock"
+        self._sock: Optional[socket.socket] = None
+
+    async def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self.path))
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+        principal_cache.add_listener(self._user_changed)
+
+    async def stop(self) -> None:
+        if self._sock is None:
+            return
+        principal_cache.remove_listener(self._user_changed)
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        self.path.unlink(missing_ok=True)
+
+    def publish(self, user_id: int, message: dict) -> None:
+        self._deliver(user_id, message)
+        self._send_to_peers({"user_id": user_id, "message": message})
+
+    def _user_changed(self, user_id: int) -> None:
+        self._send_to_peers({"user_changed": user_id})
+
+    def _send_to_peers(self, event: dict) -> None:
+        if self._sock is None:
+            return
+        data = json.dumps(event).encode()
+        for peer in self.directory.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                peer.unlink(missing_ok=True)  # worker is gone
+            except (BlockingIOError, OSError):
+                pass  # peer is saturated; drop for it only
+
+    def _on_readable(self) -> None:
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                event = json.loads(data)
+                if "user_changed" in event:
+                    principal_cache.invalidate_user(int(event["user_changed"]))
+                    continue
+                self._deliver(int(event["user_id"]), event["message"])
+            except (ValueError, KeyError, TypeError):
+                continue
+
+
+def create_bus() -> LocalBus:
+    if settings.NOTIFY_BACKEND == "unix":
+        return UnixSocketBus(settings.NOTIFY_SOCKET_DIR)
+    if settings.NOTIFY_BACKEND == "local":
+        return LocalBus()
+    raise ValueError(f"Unknown NOTIFY_BACKEND: {settings.NOTIFY_BACKEND!r}")
+
+
+bus: LocalBus = LocalBus()
+
+
+def notify(user_id: int, message: dict) -> None:
+    """Send a notification to all of a user's sockets, in every worker."""
+    bus.publish(user_id, message)
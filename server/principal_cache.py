@@ -0,0 +1,129 @@
+"""Bounded in-process cache of verified tokens and user principals.
+
+Saves a JWT verification and a users-table lookup on every authenticated
+request. Entries live for at most AUTH_CACHE_TTL seconds. Any ORM update or
+delete of a User (password change, admin flag, deletion) drops that user's
+principal through mapper events, and again once the change commits; the
+listeners added with ``add_listener`` then hear of it too, which is how the
+notification bus tells the other worker processes. Tokens are never cached
+beyond their ``exp``.
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from config import settings
+from models import User
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # token -> (user_id, monotonic deadline)
+        self._tokens: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        # user_id -> (detached User snapshot, monotonic deadline)
+        self._users: OrderedDict[int, tuple[User, float]] = OrderedDict()
+        self._counters = dict.fromkeys(
+            ("token_hits", "token_misses", "user_hits", "user_misses"), 0
+        )
+        self._listeners: list[Callable[[int], None]] = []
+
+    def token_user_id(self, token: str) -> Optional[int]:
+        """User id of a previously verified, unexpired token."""
+        entry = self._get(self._tokens, token)
+        self._counters["token_hits" if entry else "token_misses"] += 1
+        return entry
+
+    def put_token(self, token: str, user_id: int, exp: Optional[float]) -> None:
+        lifetime = self.ttl
+        if exp is not None:
+            lifetime = min(lifetime, exp - time.time())
+        if lifetime > 0:
+            self._put(self._tokens, token, user_id, lifetime)
+
+    def user(self, user_id: int) -> Optional[User]:
+        """Detached snapshot of a user; attach with ``session.merge(u, load=False)``."""
+        entry = self._get(self._users, user_id)
+        self._counters["user_hits" if entry else "user_misses"] += 1
+        return entry
+
+    def put_user(self, user: User) -> None:
+        snapshot = User(
+            **{col.key: getattr(user, col.key) for col in User.__table__.columns}
+        )
+        make_transient_to_detached(snapshot)
+        self._put(self._users, user.id, snapshot, self.ttl)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._users.pop(user_id, None)
+
+    def user_changed(self, user_id: int) -> None:
+        """A change to the user was committed: evict it here and tell the listeners."""
+        self.invalidate_user(user_id)
+        for listener in self._listeners:
+            listener(user_id)
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int], None]) -> None:
+        self._listeners.remove(listener)
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._users.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+        }
+
+    def _get(self, entries: OrderedDict, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, deadline = entry
+        if deadline < time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _put(self, entries: OrderedDict, key, value, lifetime: float) -> None:
+        entries[key] = (value, time.monotonic() + lifetime)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+CHANGED_USERS = "principal_cache.changed_users"  # Session.info key
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(_mapper, _connection, target: User) -> None:
+    principal_cache.invalidate_user(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(CHANGED_USERS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _announce_changed_users(session: Session) -> None:
+    # Evicting again after the commit stops a request that read the old row
+    # in between from keeping it cached
+    for user_id in session.info.pop(CHANGED_USERS, ()):
+        principal_cache.user_changed(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session: Session, _previous_transaction) -> None:
+    session.info.pop(CHANGED_USERS, None)
@@ -0,0 +1,190 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union
+
+import aiofiles
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from storage import StorageBackend
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse that hands the file descriptor to the server when it can.
+
+    If the ASGI server advertises the ``http.response.zerocopysend`` extension
+    the body is sent with ``os.sendfile`` by the server, so file bytes never
+    pass through Python. Otherwise it falls back to Starlette's chunked reads,
+    with larger chunks than the default. Range, multi-range, If-Range and
+    HEAD handling are inherited from FileResponse.
+    """
+
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, _fix_multipart_content_type(send))
+
+    async def _handle_simple(self, send: Send, send_header_only: bool, send_pathsend: bool) -> None:
+        if not self._zerocopy or send_header_only or send_pathsend:
+            return await super()._handle_simple(send, send_header_only, send_pathsend)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await self._send_zerocopy(send, 0, None)
+
+    async def _handle_single_range(
+        self, send: Send, start: int, end: int, file_size: int, send_header_only: bool
+    ) -> None:
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._send_zerocopy(send, start, end - start)
+
+    async def _send_zerocopy(self, send: Send, offset: int, count: Optional[int]) -> None:
+        with open(self.path, "rb") as file:
+            message = {
+                "type": "http.response.zerocopysend",
+                "file": file,
+                "offset": offset,
+                "more_body": False,
+            }
+            if count is not None:
+                message["count"] = count
+            await send(message)
+
+
+class ConcatFileResponse(Response):
+    """Several files sent back to back as one body, without assembling them.
+
+    Each file goes out with ``os.sendfile`` through the zerocopysend
+    extension when the server offers it, otherwise in chunks read in the
+    threadpool. Objects with no local path are given as storage keys and
+    streamed through ``backend.read_range``. A single byte range is honoured
+    (subject to If-Range), so an interrupted download can resume.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(
+        self,
+        files: list[tuple[Union[Path, str], int]],
+        headers: Optional[dict[str, str]] = None,
+        media_type: str = "application/octet-stream",
+        backend: Optional["StorageBackend"] = None,
+    ) -> None:
+        self.files = files
+        self.backend = backend
+        self.size = sum(size for _, size in files)
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        start, end = 0, self.size
+        byte_range = None
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range == self.headers.get("etag"):
+            byte_range = _single_range(request_headers.get("range"), self.size)
+        if byte_range == "unsatisfiable":
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{self.size}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": 416, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if byte_range:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{self.size}"
+        self.headers["content-length"] = str(end - start)
+        await send(
+            {"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers}
+        )
+        if scope["method"] != "HEAD":
+            zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+            for path, offset, count in self._segments(start, end):
+                if isinstance(path, str):
+                    await self._send_object(send, path, offset, count)
+                elif zerocopy:
+                    with open(path, "rb") as file:
+                        await send({
+                            "type": "http.response.zerocopysend",
+                            "file": file,
+                            "offset": offset,
+                            "count": count,
+                            "more_body": True,
+                        })
+                else:
+                    await self._send_chunks(send, path, offset, count)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def _segments(self, start: int, end: int):
+        """(path, offset, count) for the slice [start, end) of the concatenation."""
+        position = 0
+        for path, size in self.files:
+            lo, hi = max(start, position), min(end, position + size)
+            if lo < hi:
+                yield path, lo - position, hi - lo
+            position += size
+
+    async def _send_chunks(self, send: Send, path: Path, offset: int, count: int) -> None:
+        async with aiofiles.open(path, "rb") as file:
+            await file.seek(offset)
+            while count > 0:
+                chunk = await file.read(min(self.chunk_size, count))
+                if not chunk:
+                    raise RuntimeError(f"{path} is shorter than expected")
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def _send_object(self, send: Send, key: str, offset: int, count: int) -> None:
+        async for chunk in self.backend.read_range(key, offset, offset + count):
+            count -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if count > 0:
+            raise RuntimeError(f"{key} is shorter than expected")
+
+
+def _single_range(header: Optional[str], size: int) -> Union[tuple[int, int], str, None]:
+    """[start, end) for a one-range Range header; None to send the whole body."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        return "unsatisfiable"
+    return start, end
+
+
+def _fix_multipart_content_type(send: Send) -> Send:
+    """Starlette advertises multi-range bodies in Content-Range; RFC 9110
+    wants ``Content-Type: multipart/byteranges`` and no Content-Range."""
+
+    async def wrapped(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = message["headers"]
+            multipart = [
+                value for name, value in headers
+                if name == b"content-range" and value.startswith(b"multipart/byteranges")
+            ]
+            if multipart:
+                message["headers"] = [
+                    (name, value) for name, value in headers
+                    if name not in (b"content-range", b"content-type")
+                ] + [(b"content-type", multipart[0])]
+        await send(message)
+
+    return wrapped
@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
 from auth import (
     create_access_token,
     get_current_user,
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_password_async,
 )
 from database import get_db
 from models import User
@@ -47,12 +48,12 @@ class ChangePasswordRequest(BaseModel):
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user: User | None = db.query(User).filter(User.username == form.username).first()
-    if not user or not verify_password(form.password, user.password_hash):
+    user: User | None = await db.scalar(select(User).where(User.username == form.username))
+    if not user or not await verify_password_async(form.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -66,22 +67,22 @@ def login(
 
 
 @router.post("/change-password", status_code=status.HTTP_204_NO_CONTENT)
-def change_password(
+async def change_password(
     body: ChangePasswordRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    if not verify_password(body.current_password, current_user.password_hash):
+    if not await verify_password_async(body.current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect",
         )
-    current_user.password_hash = hash_password(body.new_password)
+    current_user.password_hash = await hash_password_async(body.new_password)
     current_user.force_change_password = False
     try:
-        db.commit()
+        await db.commit()
     except SQLAlchemyError as exc:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=_db_error_to_detail(exc),
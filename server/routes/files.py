@@ -1,24 +1,52 @@
 import asyncio
-import shutil
+import logging
+import os
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
 
-import aiofiles
-from fastapi import APIRouter, Depends, Form, HTTPException, UploadFile, status
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter, Depends, Form, Header, HTTPException, Query, Request, Response, UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import storage
 from auth import get_current_user
+from blob_store import (
+    acquire_blob, blob_sha256, queue_orphan_blobs, release_blob, sweep_staging, write_staging,
+)
 from config import settings
-from connection_manager import manager
-from database import get_db
+from content_coding import accepts_coding, iter_decoded, parse_content_encoding
+from database import get_db, release_connection
+from deletion_queue import deletion_worker, enqueue_deletions
+from event_log import prune_events
+from expiry import scheduler as expiry_scheduler, utcnow
+from inbox import (
+    REMOVED_DELIVERED, REMOVED_EXPIRED, inbox_state, record_inbox_change, record_removals,
+)
 from models import PendingFile, User
+from notification_bus import notify
+from responses import ConcatFileResponse, ZeroCopyFileResponse
+from transfers import assign_transfer
+from upload_sessions import drop_finished_digests, purge_stale_sessions, sweep_orphan_uploads
+from zip_stream import ZipEntry, iter_zip
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-FILE_TTL_HOURS = 24 * 7  # 7 days
+PENDING_PAGE_SIZE = 500
+PENDING_PAGE_MAX = 1000
+ACK_BATCH_MAX = 1000
+BUNDLE_MAX_FILES = 1000
+RECEIVERS_MAX = 100
 
 
 class FileOut(BaseModel):
@@ -30,166 +58,681 @@ class FileOut(BaseModel):
     part_number: int
     total_parts: int
     comment: Optional[str]
+    content_encoding: Optional[str] = None
     status: str
     created_at: datetime
+    expires_at: Optional[datetime] = None
+    transfer_id: Optional[int] = None
+    size: Optional[int] = None  # of the stored bytes, as is the SHA-256
+    sha256: Optional[str] = None
 
     model_config = {"from_attributes": True}
 
 
-@router.post("/upload", response_model=FileOut, status_code=status.HTTP_201_CREATED)
+class AckRequest(BaseModel):
+    """Either explicit ids, or every pending part from sender_id."""
+
+    ids: list[int] = Field(default_factory=list, max_length=ACK_BATCH_MAX)
+    sender_id: Optional[int] = None
+
+
+class AckResult(BaseModel):
+    id: int
+    # "acked", "not_pending" (already acked or expired), "forbidden" or "not_found"
+    result: str
+
+
+@router.post(
+    "/upload", response_model=FileOut | list[FileOut], status_code=status.HTTP_201_CREATED
+)
 async def upload_file(
     file: UploadFile,
-    receiver_id: int = Form(...),
+    receiver_id: Optional[int] = Form(None),
+    receiver_ids: Optional[list[int]] = Form(None),
     original_filename: str = Form(...),
     part_number: int = Form(1),
     total_parts: int = Form(1),
     comment: Optional[str] = Form(None),
+    ttl_hours: Optional[int] = Form(None),
+    sha256: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    receiver = db.get(User, receiver_id)
-    if not receiver:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receiver not found")
+    ttl = _ttl(ttl_hours)
+    receivers = await _receivers(db, receiver_id, receiver_ids)
+    await release_connection(db)
+
+    # Hash while writing so identical content is stored only once
+    staging, digest, size = await write_staging(_limit_size(_iter_upload(file)))
 
-    # Create DB record first to get the id
-    record = PendingFile(
-        sender_id=current_user.id,
-        receiver_id=receiver_id,
+    records = await _store_pending_file(
+        db, staging, digest, size, current_user, receivers,
+        declared_sha256=sha256,
         original_filename=original_filename,
-        stored_filename="",  # filled after we know the id
         part_number=part_number,
         total_parts=total_parts,
         comment=comment,
-        status="pending",
+        expires_at=datetime.now(timezone.utc) + ttl,
     )
-    db.add(record)
-    db.flush()  # assigns record.id without committing
-
-    relative_path = f"{record.id}/part_{part_number}"
-    record.stored_filename = relative_path
-
-    dest_dir = settings.STORAGE_PATH / str(record.id)
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    dest_file = settings.STORAGE_PATH / relative_path
-
-    async with aiofiles.open(dest_file, "wb") as f:
-        while chunk := await file.read(1024 * 256):  # 256 KB chunks
-            await f.write(chunk)
-
-    db.commit()
-    db.refresh(record)
-
-    # Notify receiver via WebSocket
-    asyncio.create_task(
-        manager.send_to_user(
-            receiver_id,
-            {
-                "event": "new_file",
-                "file_id": record.id,
-                "sender": current_user.username,
-                "original_filename": original_filename,
-                "part_number": part_number,
-                "total_parts": total_parts,
-            },
+    return records if receiver_ids else records[0]
+
+
+@router.put(
+    "/upload", response_model=FileOut | list[FileOut], status_code=status.HTTP_201_CREATED
+)
+async def upload_file_raw(
+    request: Request,
+    original_filename: str,
+    receiver_id: Optional[int] = None,
+    receiver_ids: Optional[list[int]] = Query(None),
+    part_number: int = 1,
+    total_parts: int = 1,
+    comment: Optional[str] = None,
+    ttl_hours: Optional[int] = None,
+    content_length: Optional[int] = Header(None),
+    content_encoding: Optional[str] = Header(None),
+    x_content_sha256: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Upload the raw request body, metadata in the query string.
+
+    Chunks go from the socket straight into the staging file as they arrive
+    (no multipart spooling), so each byte is written once. Chunked transfer
+    encoding is accepted; the size limit is enforced while streaming. A
+    compressed body (Content-Encoding) is stored as sent. With
+    ``X-Content-SHA256`` the body's digest is checked before anything is
+    committed.
+
+    Repeat ``receiver_ids`` to send one upload to several users; the
+    response is then a list with one record per receiver.
+    """
+    coding = parse_content_encoding(content_encoding)
+    ttl = _ttl(ttl_hours)
+    if content_length is not None and content_length > settings.MAX_UPLOAD_SIZE:
+        raise _too_large()
+    receivers = await _receivers(db, receiver_id, receiver_ids)
+    await release_connection(db)
+
+    staging, sha256, size = await write_staging(_limit_size(request.stream()))
+
+    records = await _store_pending_file(
+        db, staging, sha256, size, current_user, receivers,
+        declared_sha256=x_content_sha256,
+        original_filename=original_filename,
+        part_number=part_number,
+        total_parts=total_parts,
+        comment=comment,
+        content_encoding=coding,
+        expires_at=datetime.now(timezone.utc) + ttl,
+    )
+    return records if receiver_ids else records[0]
+
+
+async def _receivers(
+    db: AsyncSession, receiver_id: Optional[int], receiver_ids: Optional[list[int]]
+) -> list[int]:
+    """Recipients of an upload, de-duplicated in the order given; 404 if any is unknown."""
+    ids = list(dict.fromkeys([
+        *([receiver_id] if receiver_id is not None else []), *(receiver_ids or [])
+    ]))
+    if not 1 <= len(ids) <= RECEIVERS_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Give receiver_id or 1 to {RECEIVERS_MAX} receiver_ids",
+        )
+    found = set(await db.scalars(select(User.id).where(User.id.in_(ids))))
+    if len(found) != len(ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receiver not found")
+    return ids
+
+
+def _ttl(ttl_hours: Optional[int]) -> timedelta:
+    """Lifetime of a new part: ttl_hours if given, else FILE_TTL_HOURS."""
+    if ttl_hours is None:
+        return timedelta(hours=settings.FILE_TTL_HOURS)
+    if not 1 <= ttl_hours <= settings.FILE_TTL_MAX_HOURS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ttl_hours must be between 1 and {settings.FILE_TTL_MAX_HOURS}",
         )
+    return timedelta(hours=ttl_hours)
+
+
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(1024 * 256):  # 256 KB chunks
+        yield chunk
+
+
+async def _limit_size(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > settings.MAX_UPLOAD_SIZE:
+            raise _too_large()
+        yield chunk
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"Upload exceeds {settings.MAX_UPLOAD_SIZE} bytes",
     )
 
-    return record
+
+async def _store_pending_file(
+    db: AsyncSession,
+    staging: Path,
+    sha256: str,
+    size: int,
+    sender: User,
+    receiver_ids: list[int],
+    declared_sha256: Optional[str] = None,
+    keep_staging: bool = False,
+    **fields,
+) -> list[PendingFile]:
+    """Move a staged upload into the blob store, record it and notify the receivers.
+
+    Second phase of an upload: the bytes are already on disk, so the write
+    transaction only covers the ref-count update, the rename into the blob
+    store, the inserts and the receivers' event log entries. The blob is
+    stored once and every receiver gets its own record referencing it.
+
+    sha256 and size were computed while the bytes were written. A digest
+    declared by the sender must match, or nothing is stored (400); nor is
+    it if a receiver no longer exists (404).
+
+    On failure the staging file is removed, unless keep_staging is set
+    (upload sessions keep theirs so the completion can be retried).
+    """
+    try:
+        _check_sha256(declared_sha256, sha256)
+        stored_filename = await acquire_blob(db, staging, sha256, size, refs=len(receiver_ids))
+        # Checked again under the write lock: a receiver may have been
+        # deleted since the upload started
+        await _receivers(db, None, receiver_ids)
+        records = []
+        for receiver_id in receiver_ids:
+            transfer_id = await assign_transfer(
+                db,
+                sender.id,
+                receiver_id,
+                fields["original_filename"],
+                fields.get("part_number", 1),
+                fields.get("total_parts", 1),
+            )
+            record = PendingFile(
+                stored_filename=stored_filename,
+                status="pending",
+                sender_id=sender.id,
+                receiver_id=receiver_id,
+                transfer_id=transfer_id,
+                size=size,
+                sha256=sha256,
+                **fields,
+            )
+            db.add(record)
+            records.append(record)
+        await db.flush()
+        events = []
+        for record in records:
+            # Read back as the database stores it, so the pushed delta
+            # matches what GET /files/pending returns
+            await db.refresh(record)
+            events.append(
+                await record_inbox_change(db, record.receiver_id, _new_file_event(record, sender))
+            )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        if not keep_staging:
+            staging.unlink(missing_ok=True)
+        raise
+    for record, event in zip(records, events):
+        notify(record.receiver_id, event)
+        expiry_scheduler.schedule(record.id, record.expires_at)
+    return records
+
+
+def _check_sha256(declared: Optional[str], actual: str) -> None:
+    """400 unless the digest the sender declared (if any) matches the bytes received."""
+    if declared is not None and declared.strip().lower() != actual:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"SHA-256 mismatch: received content hashes to {actual}",
+        )
+
+
+def _new_file_event(record: PendingFile, sender: User) -> dict:
+    """Inbox delta for a new part: the full FileOut, so clients need no refetch."""
+    return {
+        "event": "new_file",
+        "file": FileOut.model_validate(record).model_dump(mode="json"),
+        # Summary fields kept for older clients
+        "file_id": record.id,
+        "sender": sender.username,
+        "original_filename": record.original_filename,
+        "part_number": record.part_number,
+        "total_parts": record.total_parts,
+    }
 
 
 @router.get("/pending", response_model=list[FileOut])
-def list_pending(
+async def list_pending(
+    response: Response,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(PENDING_PAGE_SIZE, ge=1, le=PENDING_PAGE_MAX),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    return (
-        db.query(PendingFile)
-        .filter(
+    """Pending parts for the caller, oldest first, keyset-paginated by id.
+
+    A full page carries ``X-Next-After-Id``; pass it back as ``after_id``.
+    The ETag names the inbox version, so it is the same for every page and
+    changes whenever any pending part is added or removed.
+    """
+    version, event_seq = await inbox_state(db, current_user.id)
+    etag = f'W/"inbox-{current_user.id}-{version}"'
+    # X-Inbox-Version: base for applying WebSocket deltas
+    # X-Event-Seq: where a WebSocket (/ws?since=) should resume from
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "X-Inbox-Version": str(version),
+        "X-Event-Seq": str(event_seq),
+    }
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    result = await db.execute(
+        select(PendingFile)
+        .where(
             PendingFile.receiver_id == current_user.id,
             PendingFile.status == "pending",
+            PendingFile.id > after_id,
         )
-        .all()
+        .order_by(PendingFile.id)
+        .limit(limit)
     )
+    records = result.scalars().all()
+    response.headers.update(headers)
+    if len(records) == limit:
+        response.headers["X-Next-After-Id"] = str(records[-1].id)
+    return records
+
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check using weak comparison (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(",")
+    )
 
-@router.get("/{file_id}/part/{part_n}")
-def download_part(
+
+@router.get("/bundle")
+async def download_bundle(
+    ids: str = Query(..., description="Comma-separated file ids"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream several parts as one ZIP64 archive, built on the fly.
+
+    Entries are named after the original files (".partN" for multi-part
+    uploads). Each one is stored or deflated depending on how well it
+    compresses. Parts uploaded compressed are decoded first.
+    """
+    try:
+        file_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        file_ids = []
+    if not 1 <= len(file_ids) <= BUNDLE_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ids must list 1 to {BUNDLE_MAX_FILES} file ids",
+        )
+
+    records = {
+        r.id: r
+        for r in await db.scalars(select(PendingFile).where(PendingFile.id.in_(file_ids)))
+    }
+    if len(records) != len(file_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    if not current_user.is_admin and any(
+        r.receiver_id != current_user.id for r in records.values()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    await release_connection(db)
+
+    names: set[str] = set()
+    entries = []
+    for file_id in file_ids:
+        key = records[file_id].stored_filename
+        path = storage.backend.local_path(key)
+        entries.append(ZipEntry(
+            name=_bundle_entry_name(records[file_id], names),
+            path=path,
+            modified=records[file_id].created_at,
+            coding=records[file_id].content_encoding,
+            read=None if path is not None else partial(storage.backend.read_blocking, key),
+        ))
+    keys = [records[file_id].stored_filename for file_id in file_ids]
+    if not all([await storage.backend.exists(key) for key in keys]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not on disk")
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": _content_disposition(f"files-{stamp}.zip")},
+    )
+
+
+def _bundle_entry_name(record: PendingFile, taken: set[str]) -> str:
+    """A flat, unique archive name for record; adds it to taken."""
+    base = record.original_filename.replace("\\", "/").rsplit("/", 1)[-1] or f"file-{record.id}"
+    if record.total_parts > 1:
+        base = f"{base}.part{record.part_number}"
+    name, n = base, 1
+    while name in taken:
+        n += 1
+        stem, dot, suffix = base.rpartition(".")
+        name = f"{stem} ({n}).{suffix}" if dot and stem else f"{base} ({n})"
+    taken.add(name)
+    return name
+
+
+@router.api_route("/{file_id}/part/{part_n}", methods=["GET", "HEAD"])
+async def download_part(
     file_id: int,
     part_n: int,
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    record: PendingFile | None = (
-        db.query(PendingFile)
-        .filter(PendingFile.id == file_id, PendingFile.part_number == part_n)
-        .first()
+    """Serve a stored part; supports Range/If-Range, HEAD and If-None-Match.
+
+    Compressed parts are sent as stored (with Content-Encoding) when the
+    client accepts that coding, otherwise decoded on the fly without
+    range support.
+    """
+    record: PendingFile | None = await db.scalar(
+        select(PendingFile).where(
+            PendingFile.id == file_id, PendingFile.part_number == part_n
+        )
     )
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     if record.receiver_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
-    path = settings.STORAGE_PATH / record.stored_filename
-    if not path.exists():
+    key = record.stored_filename
+    path = storage.backend.local_path(key)
+    try:
+        if path is not None:
+            stat_result = await run_in_threadpool(os.stat, path)
+            size = stat_result.st_size
+        else:
+            size = (await storage.backend.stat(key)).size
+    except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not on disk")
 
-    return FileResponse(
+    coding = record.content_encoding
+    if coding and not accepts_coding(accept_encoding, coding):
+        headers = {"Vary": "Accept-Encoding", "Accept-Ranges": "none"}
+        if request.method == "HEAD":
+            return Response(headers=headers, media_type="application/octet-stream")
+        return StreamingResponse(
+            iter_decoded(storage.backend.read_range(key), coding),
+            media_type="application/octet-stream",
+            headers={
+                **headers,
+                "Content-Disposition": _content_disposition(record.original_filename),
+            },
+        )
+
+    headers = {}
+    if coding:
+        headers = {"Content-Encoding": coding, "Vary": "Accept-Encoding"}
+    sha256 = record.sha256 or blob_sha256(key)
+    if sha256:
+        # Content-addressed, so the ETag is strong and never needs the mtime.
+        # Clients check the digest as they stream (it covers the bytes as
+        # sent, compressed if Content-Encoding is set).
+        etag = f'"{sha256}-{size}"'
+        headers.update({"ETag": etag, "X-Content-SHA256": sha256})
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if path is None:
+        disposition = _content_disposition(record.original_filename)
+        # A plain GET can fetch straight from the object store. If-Range
+        # needs our ETag semantics, so those (and HEAD) are streamed through.
+        if (
+            settings.STORAGE_REDIRECT_DOWNLOADS
+            and request.method == "GET"
+            and "if-range" not in request.headers
+        ):
+            url = storage.backend.presigned_url(key, disposition=disposition, content_encoding=coding)
+            if url:
+                return RedirectResponse(
+                    url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers
+                )
+        return ConcatFileResponse(
+            [(key, size)],
+            headers={**headers, "Content-Disposition": disposition},
+            backend=storage.backend,
+        )
+
+    return ZeroCopyFileResponse(
         path=str(path),
         filename=record.original_filename,
         media_type="application/octet-stream",
+        headers=headers,
+        stat_result=stat_result,
     )
 
 
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+@router.post("/ack", response_model=list[AckResult])
+async def ack_files(
+    body: AckRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Acknowledge many parts in one transaction, with a result per id.
+
+    Ownership is checked with one query and the status change is a single
+    conditional UPDATE, so parts acked concurrently elsewhere come back as
+    "not_pending" rather than being released twice.
+    """
+    results: dict[int, str] = {}
+    if body.sender_id is not None:
+        owned = (
+            await db.scalars(
+                select(PendingFile.id)
+                .where(
+                    PendingFile.receiver_id == current_user.id,
+                    PendingFile.sender_id == body.sender_id,
+                    PendingFile.status == "pending",
+                )
+                .order_by(PendingFile.id)
+                .limit(ACK_BATCH_MAX)
+            )
+        ).all()
+        requested = list(owned)
+    elif body.ids:
+        requested = list(dict.fromkeys(body.ids))
+        rows = (
+            await db.execute(
+                select(PendingFile.id, PendingFile.receiver_id)
+                .where(PendingFile.id.in_(requested))
+            )
+        ).all()
+        receivers = dict(rows)
+        for file_id in requested:
+            if file_id not in receivers:
+                results[file_id] = "not_found"
+            elif receivers[file_id] != current_user.id:
+                results[file_id] = "forbidden"
+        owned = [file_id for file_id in requested if file_id not in results]
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Give ids or sender_id"
+        )
+
+    acked = []
+    if owned:
+        acked = (
+            await db.execute(
+                update(PendingFile)
+                .where(PendingFile.id.in_(owned), PendingFile.status == "pending")
+                .values(status="delivered")
+                .returning(PendingFile.id, PendingFile.stored_filename)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+    unreferenced = []
+    for _, stored_filename in acked:
+        key = await release_blob(db, stored_filename)
+        if key is not None:
+            unreferenced.append(key)
+    await enqueue_deletions(db, unreferenced)
+    events = await record_removals(
+        db, [(current_user.id, file_id) for file_id, _ in acked], REMOVED_DELIVERED
+    )
+    await db.commit()
+
+    for receiver_id, event in events:
+        notify(receiver_id, event)
+    if unreferenced:
+        deletion_worker.wake()
+    acked_ids = {file_id for file_id, _ in acked}
+    return [
+        AckResult(
+            id=file_id,
+            result=results.get(file_id, "acked" if file_id in acked_ids else "not_pending"),
+        )
+        for file_id in requested
+    ]
+
+
 @router.post("/{file_id}/ack", status_code=status.HTTP_204_NO_CONTENT)
 async def ack_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    record: PendingFile | None = db.get(PendingFile, file_id)
+    record: PendingFile | None = await db.get(PendingFile, file_id)
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     if record.receiver_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
-    record.status = "delivered"
-    db.commit()
+    if not await _transition(db, record, "delivered"):
+        await db.refresh(record, ["status"])
+        if record.status == "delivered":
+            return  # acked already; a retried ack succeeds
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"File is {record.status}, not pending"
+        )
+    unreferenced = await release_blob(db, record.stored_filename)
+    if unreferenced is not None:
+        await enqueue_deletions(db, [unreferenced])
+    events = await record_removals(db, [(record.receiver_id, record.id)], REMOVED_DELIVERED)
+    await db.commit()
+
+    for receiver_id, event in events:
+        notify(receiver_id, event)
+    deletion_worker.wake()
+
 
-    dir_path = settings.STORAGE_PATH / str(record.id)
-    asyncio.create_task(_delete_dir(dir_path))
+async def _transition(db: AsyncSession, record: PendingFile, new_status: str) -> bool:
+    """Move a record out of "pending"; False if someone else already did.
 
+    Conditional on the current status, so a blob reference is released
+    exactly once even when workers race on the same record.
+    """
+    result = await db.execute(
+        update(PendingFile)
+        .where(PendingFile.id == record.id, PendingFile.status == "pending")
+        .values(status=new_status)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        record.status = new_status
+    return bool(result.rowcount)
 
-async def _delete_dir(path: Path) -> None:
-    await asyncio.sleep(0)  # yield to event loop
-    if path.exists():
-        shutil.rmtree(path, ignore_errors=True)
 
+async def expire_files(db: AsyncSession, file_ids: list[int]) -> int:
+    """Expire those of file_ids still pending and past their deadline.
 
-async def cleanup_expired_files(db_factory) -> None:
-    """Background task: mark and delete files older than TTL."""
+    Called by the expiry scheduler with one bounded batch; commits, then
+    notifies receivers. Unreferenced blobs go to the deletion queue.
+    Returns the number of parts expired.
+    """
+    expired = (
+        await db.scalars(
+            select(PendingFile).where(
+                PendingFile.id.in_(file_ids),
+                PendingFile.status == "pending",
+                PendingFile.expires_at <= utcnow(),
+            )
+        )
+    ).all()
+    unreferenced = []
+    removed = []
+    for rec in expired:
+        if not await _transition(db, rec, "expired"):
+            continue
+        removed.append((rec.receiver_id, rec.id))
+        key = await release_blob(db, rec.stored_filename)
+        if key is not None:
+            unreferenced.append(key)
+    await enqueue_deletions(db, unreferenced)
+    events = await record_removals(db, removed, REMOVED_EXPIRED)
+    await db.commit()
+    for receiver_id, event in events:
+        notify(receiver_id, event)
+    if unreferenced:
+        deletion_worker.wake()
+    return len(removed)
+
+
+async def housekeeping(db_factory) -> None:
+    """Background task: hourly purge of stale upload sessions, old events and leftover files.
+
+    Leftovers are staging files and blobs stored by uploads that failed
+    before their row committed, upload session files left without a row,
+    and this worker's digests of sessions finished in another. Expiring
+    pending parts is deadline-driven instead; see expiry.py.
+    """
     while True:
         try:
             await asyncio.sleep(3600)  # run every hour
-            cutoff = datetime.now(timezone.utc) - timedelta(hours=FILE_TTL_HOURS)
-            db: Session = db_factory()
-            try:
-                expired = (
-                    db.query(PendingFile)
-                    .filter(
-                        PendingFile.status == "pending",
-                        PendingFile.created_at < cutoff,
-                    )
-                    .all()
-                )
-                for rec in expired:
-                    rec.status = "expired"
-                    dir_path = settings.STORAGE_PATH / str(rec.id)
-                    if dir_path.exists():
-                        shutil.rmtree(dir_path, ignore_errors=True)
-                db.commit()
-            finally:
-                db.close()
+            now = datetime.now(timezone.utc)
+            async with db_factory() as db:
+                await purge_stale_sessions(db, now - timedelta(hours=settings.FILE_TTL_HOURS))
+                await sweep_orphan_uploads(db)
+                await drop_finished_digests(db)
+                await prune_events(db, now - timedelta(hours=settings.EVENT_RETENTION_HOURS))
+                if await queue_orphan_blobs(db):
+                    deletion_worker.wake()
+            await run_in_threadpool(sweep_staging)
         except asyncio.CancelledError:
             break
         except Exception:
-            pass  # don't let cleanup crash the server
+            # Don't let cleanup crash the server; retried on the next run
+            logger.exception("Housekeeping failed")
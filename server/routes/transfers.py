@@ -0,0 +1,145 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import storage
+from auth import get_current_user
+from blob_store import blob_sha256
+from content_coding import iter_decoded
+from database import get_db, release_connection
+from models import Transfer, User
+from responses import ConcatFileResponse
+from routes.files import _content_disposition
+from transfers import is_complete
+
+router = APIRouter(prefix="/transfers", tags=["transfers"])
+
+
+class TransferPart(BaseModel):
+    part_number: int
+    file_id: int
+    status: str
+    size: Optional[int]  # None once the part's bytes are gone
+    sha256: Optional[str]
+    content_encoding: Optional[str] = None
+
+
+class TransferManifest(BaseModel):
+    id: int
+    sender_id: int
+    receiver_id: int
+    original_filename: str
+    total_parts: int
+    created_at: datetime
+    complete: bool  # every part is in and still pending; /content is available
+    size: Optional[int]  # of the reassembled file, when complete and not compressed
+    parts: list[TransferPart]
+
+
+async def _get_transfer(db: AsyncSession, transfer_id: int, user: User) -> Transfer:
+    transfer: Transfer | None = await db.get(Transfer, transfer_id)
+    if not transfer:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer not found")
+    if transfer.receiver_id != user.id and not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    return transfer
+
+
+@router.get("/{transfer_id}", response_model=TransferManifest)
+async def get_manifest(
+    transfer_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Parts received so far, with their sizes and SHA-256 digests."""
+    transfer = await _get_transfer(db, transfer_id, current_user)
+    parts = [
+        TransferPart(
+            part_number=p.part_number,
+            file_id=p.id,
+            status=p.status,
+            size=p.size if p.status == "pending" else None,
+            sha256=p.sha256 or blob_sha256(p.stored_filename),
+            content_encoding=p.content_encoding,
+        )
+        for p in transfer.parts
+    ]
+    complete = is_complete(transfer)
+    size = None
+    if complete and not any(p.content_encoding for p in parts if p.status == "pending"):
+        size = sum(p.size or 0 for p in parts if p.status == "pending")
+    return TransferManifest(
+        id=transfer.id,
+        sender_id=transfer.sender_id,
+        receiver_id=transfer.receiver_id,
+        original_filename=transfer.original_filename,
+        total_parts=transfer.total_parts,
+        created_at=transfer.created_at,
+        complete=complete,
+        size=size,
+        parts=parts,
+    )
+
+
+@router.api_route("/{transfer_id}/content", methods=["GET", "HEAD"])
+async def get_content(
+    transfer_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """The original file: every part streamed in order, never assembled on disk.
+
+    Supports a single Range (with If-Range). Parts uploaded compressed are
+    decoded on the fly, in which case the length is unknown and ranges are
+    not offered.
+    """
+    transfer = await _get_transfer(db, transfer_id, current_user)
+    if not is_complete(transfer):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Transfer incomplete")
+    parts = [p for p in transfer.parts if p.status == "pending"]
+    await release_connection(db)
+
+    keys = [p.stored_filename for p in parts]
+    try:
+        sizes = [(await storage.backend.stat(key)).size for key in keys]
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not on disk")
+    disposition = _content_disposition(transfer.original_filename)
+
+    if any(p.content_encoding for p in parts):
+        headers = {"Content-Disposition": disposition, "Accept-Ranges": "none"}
+        if request.method == "HEAD":
+            return StreamingResponse(iter(()), media_type="application/octet-stream", headers=headers)
+        return StreamingResponse(
+            _iter_decoded_parts(keys, [p.content_encoding for p in parts]),
+            media_type="application/octet-stream",
+            headers=headers,
+        )
+
+    # Content-addressed parts, so the part digests identify the whole file
+    combined = hashlib.sha256(
+        "".join(p.sha256 or blob_sha256(p.stored_filename) or "" for p in parts).encode()
+    )
+    return ConcatFileResponse(
+        [(storage.backend.local_path(key) or key, size) for key, size in zip(keys, sizes)],
+        headers={
+            "Content-Disposition": disposition,
+            "ETag": f'"transfer-{combined.hexdigest()}"',
+        },
+        backend=storage.backend,
+    )
+
+
+async def _iter_decoded_parts(keys, codings):
+    for key, coding in zip(keys, codings):
+        chunks = storage.backend.read_range(key)
+        if coding:
+            chunks = iter_decoded(chunks, coding)
+        async for chunk in chunks:
+            yield chunk
@@ -0,0 +1,351 @@
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+
+from auth import get_current_user
+from blob_store import hash_file
+from config import settings
+from content_coding import parse_content_encoding
+from database import get_db, release_connection
+from models import UploadRange, UploadSession, User
+from routes.files import (
+    FileOut, _check_sha256, _receivers, _store_pending_file, _too_large, _ttl,
+)
+from upload_sessions import PrefixDigest, lock_staging, prefix_digests, staging_path
+
+router = APIRouter(prefix="/files/uploads", tags=["files"])
+
+
+class UploadSessionCreate(BaseModel):
+    receiver_id: Optional[int] = None
+    receiver_ids: Optional[list[int]] = None  # send to several users; completes to a list
+    original_filename: str
+    size: int = Field(ge=0)
+    part_number: int = 1
+    total_parts: int = 1
+    comment: Optional[str] = None
+    content_encoding: Optional[str] = None
+    ttl_hours: Optional[int] = None
+    sha256: Optional[str] = None  # of the whole body; checked on completion
+
+
+class UploadSessionOut(BaseModel):
+    id: str
+    size: int
+    offset: int
+    ranges: list[tuple[int, int]]
+    created_at: datetime
+
+
+def _preallocate(path: Path, size: int) -> None:
+    """Create a sparse file of the declared size so ranges can land anywhere."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Merge overlapping/adjacent [start, end) ranges into a sorted list."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _contiguous_offset(ranges: list[tuple[int, int]]) -> int:
+    """Number of bytes received without gaps from the start of the file."""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def _session_out(session: UploadSession) -> UploadSessionOut:
+    ranges = _merge_ranges([(r.start, r.end) for r in session.ranges])
+    return UploadSessionOut(
+        id=session.id,
+        size=session.size,
+        offset=_contiguous_offset(ranges),
+        ranges=ranges,
+        created_at=session.created_at,
+    )
+
+
+@asynccontextmanager
+async def _locked_staging(session_id: str, mode: str, exclusive: bool = False) -> AsyncIterator:
+    """Open a session's staging file under ``lock_staging``; 404 once it is gone."""
+    gone = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    try:
+        f = await aiofiles.open(staging_path(session_id), mode)
+    except FileNotFoundError:
+        raise gone from None
+    try:
+        if not await run_in_threadpool(lock_staging, f.fileno(), session_id, exclusive):
+            raise gone
+        yield f
+    finally:
+        await f.close()  # releases the lock
+
+
+async def _get_own_session(db: AsyncSession, session_id: str, user: User) -> UploadSession:
+    session: UploadSession | None = await db.get(UploadSession, session_id)
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if session.sender_id != user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    return session
+
+
+@router.post("", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    body: UploadSessionCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if body.size > settings.MAX_UPLOAD_SIZE:
+        raise _too_large()
+    _ttl(body.ttl_hours)
+    receivers = await _receivers(db, body.receiver_id, body.receiver_ids)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        sender_id=current_user.id,
+        receiver_id=receivers[0],
+        receiver_ids=",".join(map(str, receivers)) if body.receiver_ids else None,
+        original_filename=body.original_filename,
+        part_number=body.part_number,
+        total_parts=body.total_parts,
+        comment=body.comment,
+        size=body.size,
+        content_encoding=parse_content_encoding(body.content_encoding),
+        ttl_hours=body.ttl_hours,
+        sha256=body.sha256,
+    )
+
+    await run_in_threadpool(_preallocate, staging_path(session.id), body.size)
+
+    db.add(session)
+    await db.commit()
+    await db.refresh(session, ["ranges"])
+    prefix_digests[session.id] = PrefixDigest()
+
+    response.headers["Location"] = f"{router.prefix}/{session.id}"
+    return _session_out(session)
+
+
+@router.get("/{session_id}", response_model=UploadSessionOut)
+async def get_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return _session_out(await _get_own_session(db, session_id, current_user))
+
+
+@router.head("/{session_id}")
+async def head_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    out = _session_out(await _get_own_session(db, session_id, current_user))
+    return Response(
+        headers={"Upload-Offset": str(out.offset), "Upload-Length": str(out.size)}
+    )
+
+
+@router.patch("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_upload_session(
+    session_id: str,
+    request: Request,
+    upload_offset: int = Header(..., ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Write the request body into the session file starting at Upload-Offset.
+
+    Disjoint ranges may be sent concurrently. If the client disconnects
+    mid-body, whatever reached the disk is still recorded so the client
+    only has to resend the rest.
+    """
+    session = await _get_own_session(db, session_id, current_user)
+    if upload_offset > session.size:
+        raise HTTPException(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            detail="Upload-Offset beyond declared size",
+        )
+    await release_connection(db)
+
+    written = 0
+    too_large = False
+    prefix = prefix_digests.get(session.id)
+    async with _locked_staging(session.id, "r+b") as f:
+        try:
+            await f.seek(upload_offset)
+            async for chunk in request.stream():
+                if upload_offset + written + len(chunk) > session.size:
+                    too_large = True
+                    break
+                await f.write(chunk)
+                if prefix is not None:
+                    prefix.feed(upload_offset + written, chunk)
+                written += len(chunk)
+        except ClientDisconnect:
+            pass
+
+        # Recorded before the lock goes, so completion sees every range written
+        if written:
+            db.add(UploadRange(session_id=session.id, start=upload_offset, end=upload_offset + written))
+            await db.commit()
+            if prefix is not None:
+                prefix.ranges.append((upload_offset, upload_offset + written))
+    if written:
+        await db.refresh(session, ["ranges"])
+
+    if too_large:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail="Body exceeds declared upload size",
+        )
+
+    out = _session_out(session)
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={"Upload-Offset": str(out.offset)},
+    )
+
+
+@router.post(
+    "/{session_id}/complete",
+    response_model=FileOut | list[FileOut],
+    status_code=status.HTTP_201_CREATED,
+)
+async def complete_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    session = await _get_own_session(db, session_id, current_user)
+    await release_connection(db)
+    # Waits for PATCHes still writing, in any worker; later ones find the file gone
+    async with _locked_staging(session.id, "rb", exclusive=True):
+        return await _complete_locked(db, session, current_user)
+
+
+async def _complete_locked(db: AsyncSession, session: UploadSession, current_user: User):
+    """Hash and store a session's file; the caller holds its exclusive lock."""
+    await db.refresh(session, ["ranges"])
+    out = _session_out(session)
+    if out.offset != session.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete: {out.offset} of {session.size} bytes received",
+        )
+
+    receivers = [session.receiver_id]
+    if session.receiver_ids:
+        receivers = [int(i) for i in session.receiver_ids.split(",")]
+    # Receivers deleted since the session was created are left out
+    found = set(await db.scalars(select(User.id).where(User.id.in_(receivers))))
+    receivers = [receiver_id for receiver_id in receivers if receiver_id in found]
+    if not receivers:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receiver not found")
+
+    prefix = prefix_digests.get(session.id)
+    if prefix is None or not prefix.covers(session):
+        prefix = PrefixDigest()  # written elsewhere too: hash it all
+
+    # Claim the session, so of concurrent completes only one goes on
+    fields = {column.key: getattr(session, column.key) for column in UploadSession.__table__.columns}
+    claimed = (
+        await db.execute(
+            delete(UploadSession)
+            .where(UploadSession.id == session.id)
+            .returning(UploadSession.id)
+        )
+    ).first()
+    if claimed is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload session is already completing"
+        )
+    await db.execute(delete(UploadRange).where(UploadRange.session_id == session.id))
+    await db.commit()
+    prefix_digests.pop(session.id, None)
+
+    staging = staging_path(session.id)
+    try:
+        # The row is gone: keep sweep_orphan_uploads off the file while it is stored
+        await run_in_threadpool(os.utime, staging)
+        # Ranges that arrived out of order are not in the prefix digest yet
+        sha256, size = await run_in_threadpool(hash_file, staging, prefix.digest, prefix.offset)
+        # Some range may have arrived corrupted and there is no telling
+        # which, so a mismatching session cannot be resumed
+        _check_sha256(session.sha256, sha256)
+    except BaseException:
+        staging.unlink(missing_ok=True)
+        raise
+
+    try:
+        records = await _store_pending_file(
+            db, staging, sha256, size, current_user, receivers, keep_staging=True,
+            original_filename=session.original_filename,
+            part_number=session.part_number,
+            total_parts=session.total_parts,
+            comment=session.comment,
+            content_encoding=session.content_encoding,
+            # The part's lifetime starts once it is complete
+            expires_at=datetime.now(timezone.utc) + _ttl(session.ttl_hours),
+        )
+    except Exception:
+        if staging.exists():
+            # Nothing was stored: put the session back so the client can retry
+            db.add(UploadSession(**fields, ranges=[UploadRange(start=0, end=session.size)]))
+            await db.commit()
+        raise
+    except BaseException:
+        staging.unlink(missing_ok=True)
+        raise
+    return records if session.receiver_ids else records[0]
+
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    session = await _get_own_session(db, session_id, current_user)
+    await release_connection(db)
+    # Not while a completion is hashing and storing the file
+    async with _locked_staging(session.id, "rb", exclusive=True):
+        deleted = (
+            await db.execute(
+                delete(UploadSession)
+                .where(UploadSession.id == session.id)
+                .returning(UploadSession.id)
+            )
+        ).first()
+        if deleted is None:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found"
+            )
+        await db.execute(delete(UploadRange).where(UploadRange.session_id == session.id))
+        await db.commit()
+        staging_path(session.id).unlink(missing_ok=True)
+    prefix_digests.pop(session.id, None)
@@ -1,13 +1,20 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
-from auth import get_current_admin, get_current_user, hash_password
+from auth import get_current_admin, get_current_user, hash_password_async
+from blob_store import release_blob
 from database import get_db
-from models import User
+from deletion_queue import deletion_worker, enqueue_deletions
+from inbox import REMOVED_DELETED, record_removals
+from models import Event, PendingFile, Transfer, UploadRange, UploadSession, User
+from notification_bus import notify
+from upload_sessions import prefix_digests, staging_path
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -48,37 +55,37 @@ class UserCreate(BaseModel):
 
 
 @router.get("/", response_model=list[UserOut])
-def list_users(
+async def list_users(
     _: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    return db.query(User).all()
+    return (await db.scalars(select(User))).all()
 
 
 @router.get("/me", response_model=UserOut)
-def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 
 @router.get("/{user_id}", response_model=UserOut)
-def get_user(
+async def get_user(
     user_id: int,
     _: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.get(User, user_id)
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return user
 
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     body: UserCreate,
     _: User = Depends(get_current_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    existing = db.query(User).filter(User.username == body.username).first()
+    existing = await db.scalar(select(User).where(User.username == body.username))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -86,16 +93,16 @@ def create_user(
         )
     user = User(
         username=body.username,
-        password_hash=hash_password(body.password),
+        password_hash=await hash_password_async(body.password),
         is_admin=body.is_admin,
         force_change_password=True,
     )
     try:
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     except SQLAlchemyError as exc:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=_db_error_to_detail(exc),
@@ -104,31 +111,72 @@ def create_user(
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
+async def delete_user(
     user_id: int,
     current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if current_user.id == user_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot delete yourself",
         )
-    user = db.get(User, user_id)
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
+
     # Delete associated files (both sent and received)
-    from models import PendingFile
+    files_filter = (PendingFile.sender_id == user_id) | (PendingFile.receiver_id == user_id)
     try:
-        db.query(PendingFile).filter(
-            (PendingFile.sender_id == user_id) | (PendingFile.receiver_id == user_id)
-        ).delete(synchronize_session=False)
-        db.delete(user)
-        db.commit()
+        # Conditional, so parts acked or expired meanwhile are not released twice
+        pending = (
+            await db.execute(
+                update(PendingFile)
+                .where(files_filter, PendingFile.status == "pending")
+                .values(status="deleted")
+                .returning(PendingFile.id, PendingFile.receiver_id, PendingFile.stored_filename)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        unreferenced = []
+        for _, _, stored_filename in pending:
+            key = await release_blob(db, stored_filename)
+            if key is not None:
+                unreferenced.append(key)
+        await enqueue_deletions(db, unreferenced)
+        # Parts this user sent vanish from other receivers' inboxes
+        events = await record_removals(
+            db,
+            [(receiver_id, file_id) for file_id, receiver_id, _ in pending if receiver_id != user_id],
+            REMOVED_DELETED,
+        )
+        await db.execute(delete(PendingFile).where(files_filter))
+        await db.execute(
+            delete(Transfer).where((Transfer.sender_id == user_id) | (Transfer.receiver_id == user_id))
+        )
+        await db.execute(delete(Event).where(Event.user_id == user_id))
+        # Both columns refer to the user; sessions naming it among several
+        # receivers fail when completed instead
+        sessions = (
+            await db.scalars(
+                delete(UploadSession)
+                .where((UploadSession.sender_id == user_id) | (UploadSession.receiver_id == user_id))
+                .returning(UploadSession.id)
+            )
+        ).all()
+        await db.execute(delete(UploadRange).where(UploadRange.session_id.in_(sessions)))
+        await db.delete(user)
+        await db.commit()
     except SQLAlchemyError as exc:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=_db_error_to_detail(exc),
         )
+    for receiver_id, event in events:
+        notify(receiver_id, event)
+    deletion_worker.wake()
+    # Local files; any left by a crash here go with sweep_orphan_uploads
+    for session_id in sessions:
+        prefix_digests.pop(session_id, None)
+        await run_in_threadpool(staging_path(session_id).unlink, missing_ok=True)
@@ -1,13 +1,26 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth import decode_token
 from connection_manager import manager
+from database import get_db, release_connection
+from event_log import replay, resync_message
 
 router = APIRouter(tags=["websocket"])
 
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, token: str = ""):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str = "",
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Notification stream. With ?since=<seq>, missed events are replayed
+    first (or a single resync event is sent if they are gone)."""
     if not token:
         await websocket.close(code=4001)
         return
@@ -19,13 +32,32 @@ async def websocket_endpoint(websocket: WebSocket, token: str = ""):
         await websocket.close(code=4001)
         return
 
-    await manager.connect(user_id, websocket)
+    # Registered before reading the log, so nothing published in between
+    # is lost; live messages are held until the replay has been sent.
+    conn = await manager.connect(user_id, websocket, hold=since is not None)
     try:
+        if since is not None:
+            missed, current = await replay(db, user_id, since)
+            await release_connection(db)
+            if missed is None:
+                await websocket.send_text(json.dumps(resync_message(current)))
+            else:
+                for text in missed:
+                    await websocket.send_text(text)
+            if not conn.resume(current) and not conn.enqueue(
+                json.dumps(resync_message(current))
+            ):
+                manager.evict(conn)
+
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_text("pong")
+                # Through the queue, so it never interleaves with a writer send
+                if not conn.enqueue("pong"):
+                    manager.evict(conn)
     except WebSocketDisconnect:
         pass
+    except RuntimeError:
+        pass  # socket already closed by manager.evict()
     finally:
-        await manager.disconnect(user_id, websocket)
+        await manager.disconnect(conn)
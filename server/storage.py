@@ -0,0 +1,449 @@
+"""Storage backends: where payload bytes live.
+
+Everything above this module names stored objects by key, a relative,
+slash-separated name such as ``PendingFile.stored_filename``. Payloads use
+content-addressed keys sharded by hash, ``blobs/<aa>/<sha256>`` (see
+blob_store.py), so no directory grows past a few thousand entries however
+many parts are stored. Parts stored before that layout keep their
+``<id>/part_N`` keys until ``migrate_storage.py`` moves them.
+
+Staging files for uploads in progress are not part of the backend. They are
+always local scratch under ``STORAGE_PATH`` and reach the backend in one
+``put_file`` once hashed.
+
+``STORAGE_BACKEND`` selects the implementation: ``local`` (files under
+``STORAGE_PATH``) or ``s3`` (any S3-compatible service; needs boto3).
+``backend`` is the one in use (replaced at startup, so refer to it as
+``storage.backend``).
+"""
+import asyncio
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import AsyncContextManager, AsyncIterator, Iterator, Optional, Protocol
+
+import aiofiles
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from config import settings
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency
+    boto3 = None
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = ".partial"  # LocalStorage objects still being written
+
+
+@dataclass
+class ObjectStat:
+    size: int
+    modified: float  # POSIX timestamp
+
+
+class ObjectWriter(Protocol):
+    async def write(self, data: bytes) -> None: ...
+
+
+class StorageBackend(ABC):
+    """Operations every backend supports; tests/test_storage.py checks them."""
+
+    @abstractmethod
+    def open_write(self, key: str) -> AsyncContextManager[ObjectWriter]:
+        """Write a new object. It appears under key only if the block exits cleanly."""
+
+    @abstractmethod
+    def read_range(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Bytes [start, end) of an object, in chunks. FileNotFoundError if missing."""
+
+    @abstractmethod
+    async def stat(self, key: str) -> ObjectStat:
+        """Size and modification time. FileNotFoundError if missing."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove an object (or, for legacy keys, everything under it); no error if missing."""
+
+    @abstractmethod
+    async def rename(self, key: str, new_key: str) -> None:
+        """Move an object to a new key, replacing any object there."""
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> AsyncIterator[tuple[str, ObjectStat]]:
+        """Every object whose key starts with prefix, in no particular order."""
+
+    async def put_file(self, key: str, source: Path) -> None:
+        """Store a finished local file under key. The source is gone afterwards."""
+        async with self.open_write(key) as dest:
+            async with aiofiles.open(source, "rb") as f:
+                while chunk := await f.read(CHUNK_SIZE):
+                    await dest.write(chunk)
+        source.unlink(missing_ok=True)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self.stat(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @abstractmethod
+    def read_blocking(self, key: str) -> Iterator[bytes]:
+        """Blocking read of a whole object, for code already in a worker thread."""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """A path the object can be read from directly (sendfile), if there is one."""
+        return None
+
+    def presigned_url(
+        self, key: str, disposition: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> Optional[str]:
+        """A short-lived URL clients can GET the object from, if the backend has one."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under root, one directory level per key component."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        parts = PurePosixPath(key).parts
+        if not parts or key.startswith("/") or ".." in parts:
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return self.root.joinpath(*parts)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+    @asynccontextmanager
+    async def open_write(self, key: str) -> AsyncIterator[ObjectWriter]:
+        dest = self._path(key)
+        # Written beside the destination, so publishing it is one rename
+        tmp = dest.parent / f".{dest.name}.{uuid.uuid4().hex}{PARTIAL_SUFFIX}"
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                yield f
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    async def put_file(self, key: str, source: Path) -> None:
+        dest = self._path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, dest)
+
+    async def read_range(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self._path(key), "rb") as f:
+            await f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await f.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def read_blocking(self, key: str) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+    async def stat(self, key: str) -> ObjectStat:
+        st = await run_in_threadpool(os.stat, self._path(key))
+        return ObjectStat(size=st.st_size, modified=st.st_mtime)
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(_remove_tree_or_file, self._path(key))
+
+    async def rename(self, key: str, new_key: str) -> None:
+        dest = self._path(new_key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._path(key), dest)
+
+    async def list(self, prefix: str = "") -> AsyncIterator[tuple[str, ObjectStat]]:
+        async for item in iterate_in_threadpool(self._walk(prefix)):
+            yield item
+
+    def _walk(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        # Only descend into directories that can hold matching keys
+        top = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        start = self._path(top) if top else self.root
+        for dirpath, dirnames, filenames in os.walk(start):
+            rel_dir = Path(dirpath).relative_to(self.root).as_posix()
+            base = "" if rel_dir == "." else f"{rel_dir}/"
+            dirnames[:] = [d for d in dirnames if _may_match(f"{base}{d}/", prefix)]
+            for name in filenames:
+                key = f"{base}{name}"
+                if not key.startswith(prefix) or name.endswith(PARTIAL_SUFFIX):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                yield key, ObjectStat(size=st.st_size, modified=st.st_mtime)
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, ...), under an optional prefix.
+
+    boto3 blocks, so every call runs in the threadpool. Writes go up as
+    multipart uploads with up to ``concurrency`` part PUTs in flight, and an
+    object only appears when its upload completes; objects smaller than one
+    part take a single PUT.
+    """
+
+    def __init__(
+        self, client, bucket: str, prefix: str = "", part_size: int = 64 * 1024 ** 2,
+        concurrency: int = 4, presign_ttl: int = 300,
+    ) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.presign_ttl = presign_ttl
+
+    def _key(self, key: str) -> str:
+        parts = PurePosixPath(key).parts
+        if not parts or key.startswith("/") or ".." in parts:
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return f"{self.prefix}{key}"
+
+    @asynccontextmanager
+    async def open_write(self, key: str) -> AsyncIterator[ObjectWriter]:
+        upload = _MultipartUpload(self, self._key(key))
+        try:
+            yield upload
+            await upload.complete()
+        except BaseException:
+            await upload.abort()
+            raise
+
+    async def read_range(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        if end is not None and end <= start:
+            await self.stat(key)  # still FileNotFoundError if missing
+            return
+        byte_range = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            response = await run_in_threadpool(
+                self.client.get_object, Bucket=self.bucket, Key=self._key(key), Range=byte_range
+            )
+        except ClientError as exc:
+            if _error_code(exc) == "InvalidRange":  # start at or past the end
+                return
+            raise _os_error(exc, key) from exc
+        body = response["Body"]
+        try:
+            async for chunk in iterate_in_threadpool(body.iter_chunks(CHUNK_SIZE)):
+                yield chunk
+        finally:
+            body.close()
+
+    def read_blocking(self, key: str) -> Iterator[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as exc:
+            raise _os_error(exc, key) from exc
+        body = response["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    async def stat(self, key: str) -> ObjectStat:
+        try:
+            head = await run_in_threadpool(
+                self.client.head_object, Bucket=self.bucket, Key=self._key(key)
+            )
+        except ClientError as exc:
+            raise _os_error(exc, key) from exc
+        return ObjectStat(size=head["ContentLength"], modified=head["LastModified"].timestamp())
+
+    async def delete(self, key: str) -> None:
+        # Legacy keys name directories, so everything under key/ goes too
+        try:
+            keys = [self._key(key)] + [f"{self.prefix}{k}" async for k, _ in self.list(f"{key}/")]
+            for i in range(0, len(keys), 1000):  # the API's batch limit
+                response = await run_in_threadpool(
+                    self.client.delete_objects,
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+                )
+                if response.get("Errors"):
+                    error = response["Errors"][0]
+                    raise OSError(f"Could not delete {error['Key']}: {error.get('Message')}")
+        except ClientError as exc:
+            raise _os_error(exc, key) from exc
+
+    async def rename(self, key: str, new_key: str) -> None:
+        source = {"Bucket": self.bucket, "Key": self._key(key)}
+        try:
+            # Managed copy: server-side, and multipart for objects over 5 GB
+            await run_in_threadpool(self.client.copy, source, self.bucket, self._key(new_key))
+        except ClientError as exc:
+            raise _os_error(exc, key) from exc
+        await run_in_threadpool(self.client.delete_object, **source)
+
+    async def list(self, prefix: str = "") -> AsyncIterator[tuple[str, ObjectStat]]:
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=f"{self.prefix}{prefix}"
+        )
+        async for page in iterate_in_threadpool(iter(pages)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], ObjectStat(
+                    size=obj["Size"], modified=obj["LastModified"].timestamp()
+                )
+
+    def presigned_url(
+        self, key: str, disposition: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+    ) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if disposition:
+            params["ResponseContentDisposition"] = disposition
+        if content_encoding:
+            params["ResponseContentEncoding"] = content_encoding
+        # Signed locally, no request is made
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.presign_ttl
+        )
+
+
+class _MultipartUpload:
+    """Cuts writes into parts and PUTs them in the background as they fill.
+
+    At most ``concurrency`` parts are buffered or in flight, so memory stays
+    at about ``concurrency * part_size`` however large the object is.
+    """
+
+    def __init__(self, store: S3Storage, key: str) -> None:
+        self.store = store
+        self.key = key
+        self.upload_id: Optional[str] = None
+        self._buffer = bytearray()
+        self._parts: list[asyncio.Task] = []
+        self._slots = asyncio.Semaphore(store.concurrency)
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.store.part_size:
+            part = bytes(self._buffer[:self.store.part_size])
+            del self._buffer[:self.store.part_size]
+            await self._start_part(part)
+
+    async def _start_part(self, data: bytes) -> None:
+        client = self.store.client
+        if self.upload_id is None:
+            created = await run_in_threadpool(
+                client.create_multipart_upload, Bucket=self.store.bucket, Key=self.key
+            )
+            self.upload_id = created["UploadId"]
+        await self._slots.acquire()
+        self._parts.append(asyncio.create_task(self._put_part(len(self._parts) + 1, data)))
+
+    async def _put_part(self, number: int, data: bytes) -> dict:
+        try:
+            response = await run_in_threadpool(
+                self.store.client.upload_part,
+                Bucket=self.store.bucket, Key=self.key, UploadId=self.upload_id,
+                PartNumber=number, Body=data,
+            )
+        finally:
+            self._slots.release()
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    async def complete(self) -> None:
+        client = self.store.client
+        if self.upload_id is None:
+            await run_in_threadpool(
+                client.put_object, Bucket=self.store.bucket, Key=self.key, Body=bytes(self._buffer)
+            )
+            return
+        if self._buffer:
+            await self._start_part(bytes(self._buffer))
+            self._buffer.clear()
+        parts = await asyncio.gather(*self._parts)
+        await run_in_threadpool(
+            client.complete_multipart_upload,
+            Bucket=self.store.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    async def abort(self) -> None:
+        # Part PUTs already in a thread cannot be cancelled; let them finish
+        await asyncio.gather(*self._parts, return_exceptions=True)
+        if self.upload_id is not None:
+            await run_in_threadpool(
+                self.store.client.abort_multipart_upload,
+                Bucket=self.store.bucket, Key=self.key, UploadId=self.upload_id,
+            )
+
+
+def _error_code(exc: "ClientError") -> str:
+    return exc.response.get("Error", {}).get("Code", "")
+
+
+def _os_error(exc: "ClientError", key: str) -> OSError:
+    """FileNotFoundError for a missing object, OSError for any other failure,
+    so callers need not know about boto3."""
+    code = _error_code(exc)
+    if code in ("404", "NoSuchKey", "NotFound"):
+        return FileNotFoundError(key)
+    return OSError(f"{key}: {code or exc}")
+
+
+def _may_match(directory: str, prefix: str) -> bool:
+    return directory.startswith(prefix) or prefix.startswith(directory)
+
+
+def _remove_tree_or_file(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def create_backend() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.STORAGE_PATH)
+    if settings.STORAGE_BACKEND == "s3":
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 installed")
+        client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            # Room for every part PUT in flight beside ordinary requests
+            config=BotoConfig(
+                signature_version="s3v4",
+                max_pool_connections=settings.S3_UPLOAD_CONCURRENCY + 10,
+            ),
+        )
+        return S3Storage(
+            client, settings.S3_BUCKET, settings.S3_PREFIX, settings.S3_PART_SIZE,
+            settings.S3_UPLOAD_CONCURRENCY, settings.S3_PRESIGN_TTL,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND!r}")
+
+
+backend: StorageBackend = LocalStorage(settings.STORAGE_PATH)
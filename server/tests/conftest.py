@@ -1,4 +1,8 @@
+import importlib.util
+import socket
+import subprocess
 import sys
+import time
 from pathlib import Path
 
 # Make server/ importable without installing
@@ -7,22 +11,38 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 import pytest
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
-from auth import create_access_token, hash_password, init_admin
+from auth import create_access_token, hash_password
 from config import settings
 from database import Base, get_db
 from main import app
 from models import User
 
 
+@pytest.fixture(autouse=True)
+def _reset_principal_cache():
+    # Each test gets a fresh database whose user ids repeat
+    from principal_cache import principal_cache
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
+
+@pytest.fixture(scope="function")
+def db_path(tmp_path_factory):
+    # A file rather than :memory: so the sync fixtures and the app's
+    # aiosqlite engine see the same database.
+    return tmp_path_factory.mktemp("db") / "test.db"
+
+
 @pytest.fixture(scope="function")
-def db_engine():
+def db_engine(db_path):
     engine = create_engine(
-        "sqlite:///:memory:",
+        f"sqlite:///{db_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     Base.metadata.create_all(bind=engine)
     yield engine
@@ -34,18 +54,32 @@ def db_engine():
 def db_session(db_engine):
     Session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
     session = Session()
-    init_admin(session)
+    session.add(
+        User(
+            username="admin",
+            password_hash=hash_password("admin"),
+            is_admin=True,
+            force_change_password=True,
+        )
+    )
+    session.commit()
     yield session
     session.close()
 
 
 @pytest.fixture(scope="function")
-def test_app(db_session, tmp_storage):
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+async def session_factory(db_path):
+    """Async sessions on the test database, for background tasks under test."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture(scope="function")
+async def test_app(db_session, session_factory, tmp_storage):
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
     yield app
@@ -62,10 +96,62 @@ async def client(test_app):
 
 @pytest.fixture(scope="function")
 def tmp_storage(tmp_path, monkeypatch):
+    import storage
+
     monkeypatch.setattr(settings, "STORAGE_PATH", tmp_path)
+    monkeypatch.setattr(storage, "backend", storage.LocalStorage(tmp_path))
     return tmp_path
 
 
+@pytest.fixture(scope="session")
+def s3_endpoint(tmp_path_factory):
+    """A local moto S3 server, run apart from the test process; skipped without moto."""
+    if importlib.util.find_spec("moto") is None or importlib.util.find_spec("flask") is None:
+        pytest.skip("moto[server] not installed")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Run from a scratch directory: server/responses.py would shadow the
+    # ``responses`` package moto imports
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        cwd=tmp_path_factory.mktemp("moto"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                pytest.skip("moto server did not start")
+            time.sleep(0.1)
+    yield f"http://127.0.0.1:{port}"
+    proc.terminate()
+    proc.wait()
+
+
+@pytest.fixture(scope="function")
+def s3_backend(s3_endpoint):
+    """S3Storage on a fresh bucket of the local moto server."""
+    boto3 = pytest.importorskip("boto3")
+    from storage import S3Storage
+
+    client = boto3.client(
+        "s3", endpoint_url=s3_endpoint, region_name="us-east-1",
+        aws_access_key_id="test", aws_secret_access_key="test",
+    )
+    client.create_bucket(Bucket="exchange")
+    # The smallest part size S3 allows, so tests can span several parts
+    yield S3Storage(client, "exchange", prefix="fx/", part_size=5 * 1024 ** 2, concurrency=2)
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket="exchange"):
+        for obj in page.get("Contents", []):
+            client.delete_object(Bucket="exchange", Key=obj["Key"])
+    client.delete_bucket(Bucket="exchange")
+
+
 @pytest.fixture(scope="function")
 def admin_token(db_session):
     admin = db_session.query(User).filter(User.is_admin == True).first()
@@ -89,3 +175,27 @@ def regular_user(db_session):
 @pytest.fixture(scope="function")
 def user_token(regular_user):
     return create_access_token({"sub": str(regular_user.id)})
+
+
+@pytest.fixture(scope="function")
+def sender_token(regular_user):
+    return create_access_token({"sub": str(regular_user.id)})
+
+
+@pytest.fixture(scope="function")
+def receiver(db_session):
+    user = User(
+        username="receiver",
+        password_hash=hash_password("recv"),
+        is_admin=False,
+        force_change_password=False,
+    )
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture(scope="function")
+def receiver_token(receiver):
+    return create_access_token({"sub": str(receiver.id)})
@@ -65,3 +65,74 @@ async def test_change_password_unauthenticated(client):
         json={"current_password": "admin", "new_password": "new"},
     )
     assert resp.status_code == 401
+
+
+async def test_principal_cache_hits_and_invalidation(client, admin_token):
+    from principal_cache import principal_cache
+
+    auth = {"Authorization": f"Bearer {admin_token}"}
+    await client.get("/users/me", headers=auth)
+    before = principal_cache.stats()
+    me = await client.get("/users/me", headers=auth)
+    after = principal_cache.stats()
+    assert me.json()["force_change_password"] is True
+    assert after["token_hits"] == before["token_hits"] + 1
+    assert after["user_hits"] == before["user_hits"] + 1
+
+    # The password change is committed through a cached principal...
+    resp = await client.post(
+        "/auth/change-password",
+        json={"current_password": "admin", "new_password": "newpass123"},
+        headers=auth,
+    )
+    assert resp.status_code == 204
+    # ...and evicts it, so the next request sees the new state
+    me = await client.get("/users/me", headers=auth)
+    assert me.json()["force_change_password"] is False
+    resp = await client.post(
+        "/auth/change-password",
+        json={"current_password": "admin", "new_password": "other"},
+        headers=auth,
+    )
+    assert resp.status_code == 400
+
+
+async def test_deleted_user_token_rejected_after_caching(
+    client, admin_token, user_token, regular_user
+):
+    auth = {"Authorization": f"Bearer {user_token}"}
+    assert (await client.get("/users/me", headers=auth)).status_code == 200
+    await client.delete(
+        f"/users/{regular_user.id}", headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    assert (await client.get("/users/me", headers=auth)).status_code == 401
+
+
+async def test_hash_pool_sheds_load_beyond_queue_limit():
+    import asyncio
+    import threading
+    from fastapi import HTTPException
+    from hash_pool import HashPool
+
+    pool = HashPool(workers=1, queue_limit=1)
+    gate = threading.Event()
+    try:
+        running = asyncio.ensure_future(pool.run(gate.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        assert pool.stats()["queued"] == 1
+
+        with pytest.raises(HTTPException) as exc:
+            await pool.run(lambda: "rejected")
+        assert exc.value.status_code == 503
+
+        gate.set()
+        assert await running is True
+        assert await queued == "queued"
+        stats = pool.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 2
+        assert stats["in_flight"] == 0
+    finally:
+        gate.set()
+        pool.shutdown()
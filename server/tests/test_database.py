@@ -0,0 +1,51 @@
+from sqlalchemy import create_engine, inspect, text
+
+
+def test_upgrade_schema_adds_missing_columns(tmp_path):
+    from database import Base, upgrade_schema
+    import models  # noqa: F401  (registers tables)
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE pending_files (id INTEGER PRIMARY KEY, sender_id INTEGER, "
+            "receiver_id INTEGER, original_filename VARCHAR(255), "
+            "stored_filename VARCHAR(255), part_number INTEGER, total_parts INTEGER, "
+            "comment TEXT, status VARCHAR(16), created_at DATETIME)"
+        ))
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        upgrade_schema(conn)
+
+    columns = {col["name"] for col in inspect(engine).get_columns("pending_files")}
+    assert "content_encoding" in columns
+    engine.dispose()
+
+
+def test_sqlite_pragmas_applied_per_connection(tmp_path):
+    from database import configure_sqlite
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    configure_sqlite(engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 30_000
+    engine.dispose()
+
+
+async def test_run_maintenance_truncates_wal(tmp_path):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from database import configure_sqlite, run_maintenance
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}")
+    configure_sqlite(engine.sync_engine)
+    async with engine.connect() as conn:  # held open so the WAL survives
+        await conn.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+        await conn.exec_driver_sql("INSERT INTO t VALUES (1)")
+        await conn.commit()
+        assert (tmp_path / "wal.db-wal").stat().st_size > 0
+
+        await run_maintenance(engine)
+        assert (tmp_path / "wal.db-wal").stat().st_size == 0
+    await engine.dispose()
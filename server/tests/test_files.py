@@ -1,38 +1,12 @@
 import asyncio
+import hashlib
 import io
+import os
+import time
 
 import pytest
 
 
-@pytest.fixture
-def sender_token(regular_user):
-    from auth import create_access_token
-    return create_access_token({"sub": str(regular_user.id)})
-
-
-@pytest.fixture
-def receiver(db_session):
-    from auth import hash_password
-    from models import User
-
-    u = User(
-        username="receiver",
-        password_hash=hash_password("recv"),
-        is_admin=False,
-        force_change_password=False,
-    )
-    db_session.add(u)
-    db_session.commit()
-    db_session.refresh(u)
-    return u
-
-
-@pytest.fixture
-def receiver_token(receiver):
-    from auth import create_access_token
-    return create_access_token({"sub": str(receiver.id)})
-
-
 async def _upload(client, sender_token, receiver_id, content=b"hello", filename="test.txt"):
     return await client.post(
         "/files/upload",
@@ -57,11 +31,170 @@ async def test_upload_file(client, sender_token, receiver, tmp_storage):
     assert stored.exists()
 
 
-async def test_upload_creates_directory(client, sender_token, receiver, tmp_storage):
-    resp = await _upload(client, sender_token, receiver.id)
+async def test_upload_stores_content_addressed_blob(client, sender_token, receiver, tmp_storage):
+    content = b"hello"
+    resp = await _upload(client, sender_token, receiver.id, content=content)
     assert resp.status_code == 201
-    file_id = resp.json()["id"]
-    assert (tmp_storage / str(file_id)).is_dir()
+    digest = hashlib.sha256(content).hexdigest()
+    assert resp.json()["stored_filename"] == f"blobs/{digest[:2]}/{digest}"
+    assert (tmp_storage / "blobs" / digest[:2] / digest).read_bytes() == content
+
+
+async def test_identical_uploads_share_blob(client, sender_token, receiver, tmp_storage, db_session):
+    from models import Blob
+
+    first = await _upload(client, sender_token, receiver.id, content=b"same bytes")
+    second = await _upload(client, sender_token, receiver.id, content=b"same bytes")
+    assert first.json()["id"] != second.json()["id"]
+    assert first.json()["stored_filename"] == second.json()["stored_filename"]
+
+    digest = hashlib.sha256(b"same bytes").hexdigest()
+    db_session.expire_all()
+    assert db_session.get(Blob, digest).ref_count == 2
+    assert list((tmp_storage / "tmp").iterdir()) == []
+
+
+async def _upload_raw(client, sender_token, receiver_id, content, filename="raw.bin"):
+    return await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver_id, "original_filename": filename},
+        content=content,
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+
+
+async def test_upload_raw_body(client, sender_token, receiver, receiver_token, tmp_storage):
+    content = b"raw body bytes" * 1000
+    resp = await _upload_raw(client, sender_token, receiver.id, content)
+    assert resp.status_code == 201
+    assert resp.json()["original_filename"] == "raw.bin"
+
+    dl = await client.get(
+        f"/files/{resp.json()['id']}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+    assert dl.content == content
+
+
+async def test_upload_records_and_checks_sha256(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    content = b"integrity matters"
+    digest = hashlib.sha256(content).hexdigest()
+    params = {"receiver_id": receiver.id, "original_filename": "a.txt"}
+    auth = {"Authorization": f"Bearer {sender_token}"}
+
+    resp = await client.put(
+        "/files/upload",
+        params=params,
+        content=content,
+        headers={**auth, "X-Content-SHA256": hashlib.sha256(b"other").hexdigest()},
+    )
+    assert resp.status_code == 400
+    assert list((tmp_storage / "tmp").iterdir()) == []
+    assert not (tmp_storage / "blobs").exists()
+
+    resp = await client.put(
+        "/files/upload",
+        params=params,
+        content=content,
+        headers={**auth, "X-Content-SHA256": digest.upper()},
+    )
+    assert resp.status_code == 201
+    assert resp.json()["sha256"] == digest
+    assert resp.json()["size"] == len(content)
+
+    dl = await client.get(
+        f"/files/{resp.json()['id']}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+    assert dl.headers["x-content-sha256"] == digest
+    assert hashlib.sha256(dl.content).hexdigest() == digest
+
+
+async def test_backfill_digests(
+    client, sender_token, receiver, receiver_token, tmp_storage, db_session, session_factory
+):
+    from blob_store import backfill_digests
+    from models import PendingFile
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    resp = await _upload(client, sender_token, receiver.id, content=b"old part")
+    record = db_session.get(PendingFile, resp.json()["id"])
+    record.sha256, record.size = None, None
+    db_session.commit()
+    etag = (await client.get("/files/pending", headers=auth)).headers["etag"]
+
+    async with session_factory() as db:
+        await backfill_digests(db)
+    db_session.expire_all()
+    record = db_session.get(PendingFile, resp.json()["id"])
+    assert record.sha256 == hashlib.sha256(b"old part").hexdigest()
+    assert record.size == len(b"old part")
+
+    # The listing changed, so its ETag must too
+    pending = await client.get("/files/pending", headers={**auth, "If-None-Match": etag})
+    assert pending.status_code == 200
+    assert pending.json()[0]["sha256"] == record.sha256
+
+
+async def test_upload_raw_chunked(client, sender_token, receiver, tmp_storage):
+    async def body():
+        for _ in range(4):
+            yield b"x" * 1000
+
+    resp = await _upload_raw(client, sender_token, receiver.id, body())
+    assert resp.status_code == 201
+    assert (tmp_storage / resp.json()["stored_filename"]).stat().st_size == 4000
+
+
+async def test_upload_holds_no_write_lock_while_streaming(
+    client, sender_token, receiver, tmp_storage, db_path
+):
+    import sqlite3
+
+    async def body():
+        yield b"first"
+        # Another writer must get the lock immediately mid-upload
+        conn = sqlite3.connect(db_path, timeout=0)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.rollback()
+        conn.close()
+        yield b"second"
+
+    resp = await _upload_raw(client, sender_token, receiver.id, body())
+    assert resp.status_code == 201
+
+
+async def test_sweep_staging_removes_stale_files(tmp_storage):
+    import os
+    from blob_store import new_staging_path, sweep_staging
+
+    stale, fresh = new_staging_path(), new_staging_path()
+    stale.write_bytes(b"abandoned")
+    fresh.write_bytes(b"in flight")
+    os.utime(stale, (0, 0))
+
+    assert sweep_staging(max_age=3600) == 1
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+async def test_upload_raw_too_large(client, sender_token, receiver, tmp_storage, monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 10)
+
+    async def body():
+        for _ in range(4):
+            yield b"x" * 8
+
+    resp = await _upload_raw(client, sender_token, receiver.id, body())
+    assert resp.status_code == 413
+    assert list((tmp_storage / "tmp").iterdir()) == []
+
+    resp = await _upload_raw(client, sender_token, receiver.id, b"y" * 11)
+    assert resp.status_code == 413
 
 
 async def test_upload_unknown_receiver(client, sender_token):
@@ -89,6 +222,52 @@ async def test_list_pending_as_sender(client, sender_token, receiver, tmp_storag
     assert resp.json() == []
 
 
+async def test_list_pending_keyset_pagination(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    ids = [
+        (await _upload(client, sender_token, receiver.id, content=bytes([i]))).json()["id"]
+        for i in range(5)
+    ]
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+
+    page1 = await client.get("/files/pending", params={"limit": 2}, headers=auth)
+    assert [f["id"] for f in page1.json()] == ids[:2]
+    after = page1.headers["x-next-after-id"]
+
+    page2 = await client.get(
+        "/files/pending", params={"limit": 2, "after_id": after}, headers=auth
+    )
+    assert [f["id"] for f in page2.json()] == ids[2:4]
+
+    page3 = await client.get(
+        "/files/pending",
+        params={"limit": 2, "after_id": page2.headers["x-next-after-id"]},
+        headers=auth,
+    )
+    assert [f["id"] for f in page3.json()] == ids[4:]
+    assert "x-next-after-id" not in page3.headers
+
+
+async def test_list_pending_conditional_get(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    file_id = (await _upload(client, sender_token, receiver.id)).json()["id"]
+
+    first = await client.get("/files/pending", headers=auth)
+    etag = first.headers["etag"]
+    again = await client.get("/files/pending", headers={**auth, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    await client.post(f"/files/{file_id}/ack", headers=auth)
+    changed = await client.get("/files/pending", headers={**auth, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == []
+    assert changed.headers["etag"] != etag
+
+
 async def test_download_as_receiver(client, sender_token, receiver, receiver_token, tmp_storage):
     content = b"file content here"
     resp = await _upload(client, sender_token, receiver.id, content=content)
@@ -139,19 +318,245 @@ async def test_ack_marks_delivered(client, sender_token, receiver, receiver_toke
     assert record.status == "delivered"
 
 
-async def test_ack_deletes_disk_file(client, sender_token, receiver, receiver_token, tmp_storage):
+async def test_ack_deletes_disk_file(
+    client, sender_token, receiver, receiver_token, tmp_storage, session_factory
+):
+    from deletion_queue import DeletionWorker
+
     resp = await _upload(client, sender_token, receiver.id)
     file_id = resp.json()["id"]
-    dir_path = tmp_storage / str(file_id)
-    assert dir_path.exists()
+    blob_path = tmp_storage / resp.json()["stored_filename"]
+    assert blob_path.exists()
 
     await client.post(
         f"/files/{file_id}/ack",
         headers={"Authorization": f"Bearer {receiver_token}"},
     )
-    # Give background task time to run
+    # Queued durably with the ack, and removed by the worker
+    assert blob_path.exists()
+    worker = DeletionWorker()
+    assert await worker.run_once(session_factory) == 1
+    assert not blob_path.exists()
+    assert list((tmp_storage / "tmp").iterdir()) == []
+    assert worker.stats()["deleted"] == 1
+    assert await worker.run_once(session_factory) == 0
+
+
+async def test_deletion_queue_retries_with_backoff(
+    tmp_storage, db_session, session_factory, monkeypatch
+):
+    import deletion_queue
+    import storage
+    from expiry import utcnow
+    from models import PendingDeletion
+
+    async def busy(key):
+        raise PermissionError(key)
+
+    db_session.add(PendingDeletion(path="tmp/stuck"))
+    db_session.commit()
+    monkeypatch.setattr(storage.backend, "delete", busy)
+
+    worker = deletion_queue.DeletionWorker()
+    assert await worker.run_once(session_factory) == 1
+
+    db_session.expire_all()
+    item = db_session.query(PendingDeletion).one()
+    assert item.attempts == 1
+    assert item.not_before > utcnow()
+    assert worker.stats()["failed"] == 1
+    # Not due again until its backoff has passed
+    assert await worker.run_once(session_factory) == 0
+
+
+async def test_orphan_blobs_are_queued_and_removed(
+    client, sender_token, receiver, tmp_storage, session_factory, db_session
+):
+    from blob_store import blob_relative_path, queue_orphan_blobs
+    from deletion_queue import DeletionWorker
+
+    kept = tmp_storage / (await _upload(client, sender_token, receiver.id)).json()["stored_filename"]
+    # Stored by an upload whose transaction then failed
+    orphan = tmp_storage / blob_relative_path("ab" * 32)
+    orphan.parent.mkdir(parents=True, exist_ok=True)
+    orphan.write_bytes(b"left behind")
+    old = time.time() - 2 * 24 * 3600
+    for path in (kept, orphan):
+        os.utime(path, (old, old))
+
+    async with session_factory() as db:
+        assert await queue_orphan_blobs(db) == 1
+        assert await queue_orphan_blobs(db) == 0  # already queued
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert not orphan.exists()
+    assert kept.exists()
+
+
+async def test_blob_deletion_holds_no_write_lock(
+    client, sender_token, receiver, receiver_token, tmp_storage, session_factory, db_path,
+    monkeypatch,
+):
+    import sqlite3
+
+    import storage
+    from deletion_queue import DeletionWorker
+
+    resp = await _upload(client, sender_token, receiver.id, content=b"going")
+    blob_sha = resp.json()["sha256"]
+    await client.post(
+        f"/files/{resp.json()['id']}/ack",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+
+    delete = storage.backend.delete
+    seen = []
+
+    async def remote_delete(key):
+        # Another writer must get the lock while the backend deletes
+        conn = sqlite3.connect(db_path, timeout=0)
+        conn.execute("BEGIN IMMEDIATE")
+        seen.append(conn.execute("SELECT deleting FROM blobs WHERE sha256 = ?", (blob_sha,)).fetchone())
+        conn.rollback()
+        conn.close()
+        await delete(key)
+
+    monkeypatch.setattr(storage.backend, "delete", remote_delete)
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert seen == [(1,)]
+    assert not (tmp_storage / resp.json()["stored_filename"]).exists()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone() == (0,)
+    conn.close()
+
+
+async def test_ack_keeps_blob_still_referenced(
+    client, sender_token, receiver, receiver_token, tmp_storage, session_factory
+):
+    from deletion_queue import DeletionWorker
+
+    first = await _upload(client, sender_token, receiver.id, content=b"shared")
+    second = await _upload(client, sender_token, receiver.id, content=b"shared")
+    blob_path = tmp_storage / first.json()["stored_filename"]
+
+    await client.post(
+        f"/files/{first.json()['id']}/ack",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
     await asyncio.sleep(0.1)
-    assert not dir_path.exists()
+    assert blob_path.exists()
+
+    dl = await client.get(
+        f"/files/{second.json()['id']}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+    assert dl.content == b"shared"
+
+    await client.post(
+        f"/files/{second.json()['id']}/ack",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert not blob_path.exists()
+
+
+async def test_blob_uploaded_again_before_deletion_is_kept(
+    client, sender_token, receiver, receiver_token, tmp_storage, session_factory, db_session
+):
+    from deletion_queue import DeletionWorker
+    from models import Blob, PendingDeletion
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    first = await _upload(client, sender_token, receiver.id, content=b"again")
+    await client.post(f"/files/{first.json()['id']}/ack", headers=auth)
+    second = await _upload(client, sender_token, receiver.id, content=b"again")
+
+    # The queued deletion finds the blob in use again and only drops itself
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert db_session.query(PendingDeletion).count() == 0
+    digest = hashlib.sha256(b"again").hexdigest()
+    db_session.expire_all()
+    assert db_session.get(Blob, digest).ref_count == 1
+    dl = await client.get(f"/files/{second.json()['id']}/part/1", headers=auth)
+    assert dl.content == b"again"
+
+
+async def test_release_rolled_back_keeps_blob(
+    client, sender_token, receiver, tmp_storage, session_factory
+):
+    from blob_store import release_blob
+
+    resp = await _upload(client, sender_token, receiver.id, content=b"kept")
+    key = resp.json()["stored_filename"]
+    async with session_factory() as db:
+        assert await release_blob(db, key) == key
+        await db.rollback()
+    assert (tmp_storage / key).read_bytes() == b"kept"
+
+
+async def test_upload_to_many_receivers_stores_once(
+    client, sender_token, receiver, receiver_token, admin_token, tmp_storage, db_session,
+    session_factory,
+):
+    from deletion_queue import DeletionWorker
+    from models import Blob, User
+
+    admin = db_session.query(User).filter(User.is_admin == True).first()
+    resp = await client.put(
+        "/files/upload",
+        params={
+            "receiver_ids": [receiver.id, admin.id, receiver.id],
+            "original_filename": "report.pdf",
+        },
+        content=b"for everyone",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 201
+    records = resp.json()
+    assert [r["receiver_id"] for r in records] == [receiver.id, admin.id]
+    assert records[0]["stored_filename"] == records[1]["stored_filename"]
+    assert len([p for p in (tmp_storage / "blobs").rglob("*") if p.is_file()]) == 1
+
+    digest = hashlib.sha256(b"for everyone").hexdigest()
+    db_session.expire_all()
+    assert db_session.get(Blob, digest).ref_count == 2
+
+    blob_path = tmp_storage / records[0]["stored_filename"]
+    await client.post(
+        f"/files/{records[0]['id']}/ack", headers={"Authorization": f"Bearer {receiver_token}"}
+    )
+    assert blob_path.exists()
+    await client.post(
+        f"/files/{records[1]['id']}/ack", headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert not blob_path.exists()
+
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_ids": [receiver.id, 99999], "original_filename": "x"},
+        content=b"x",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 404
+
+
+async def test_ack_only_moves_pending_parts(
+    client, sender_token, receiver, receiver_token, tmp_storage, db_session
+):
+    from models import PendingFile
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    acked = (await _upload(client, sender_token, receiver.id, b"one")).json()["id"]
+    assert (await client.post(f"/files/{acked}/ack", headers=auth)).status_code == 204
+    assert (await client.post(f"/files/{acked}/ack", headers=auth)).status_code == 204
+
+    expired = (await _upload(client, sender_token, receiver.id, b"two")).json()["id"]
+    db_session.get(PendingFile, expired).status = "expired"
+    db_session.commit()
+    resp = await client.post(f"/files/{expired}/ack", headers=auth)
+    assert resp.status_code == 409
+    db_session.expire_all()
+    assert db_session.get(PendingFile, expired).status == "expired"
 
 
 async def test_ack_wrong_user(client, sender_token, receiver, tmp_storage):
@@ -165,6 +570,200 @@ async def test_ack_wrong_user(client, sender_token, receiver, tmp_storage):
     assert ack.status_code == 403
 
 
+async def test_batch_ack_reports_per_id(
+    client, sender_token, receiver, receiver_token, regular_user, tmp_storage, db_session
+):
+    from models import PendingDeletion
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    mine = [(await _upload(client, sender_token, receiver.id, bytes([i]))).json()["id"] for i in range(3)]
+    other = (await _upload(client, receiver_token, regular_user.id, b"not yours")).json()["id"]
+    await client.post(f"/files/{mine[0]}/ack", headers=auth)
+
+    resp = await client.post("/files/ack", json={"ids": [*mine, other, 99999]}, headers=auth)
+    assert resp.status_code == 200
+    assert resp.json() == [
+        {"id": mine[0], "result": "not_pending"},
+        {"id": mine[1], "result": "acked"},
+        {"id": mine[2], "result": "acked"},
+        {"id": other, "result": "forbidden"},
+        {"id": 99999, "result": "not_found"},
+    ]
+    assert db_session.query(PendingDeletion).count() == 3
+
+    pending = await client.get("/files/pending", headers=auth)
+    assert pending.json() == []
+    # One delta for the whole batch
+    assert pending.headers["x-inbox-version"] == "5"
+
+
+async def test_batch_ack_all_from_sender(
+    client, sender_token, receiver, receiver_token, regular_user, admin_token, tmp_storage
+):
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    for i in range(2):
+        await _upload(client, sender_token, receiver.id, bytes([i]))
+    kept = (await _upload(client, admin_token, receiver.id, b"admin's")).json()["id"]
+
+    resp = await client.post("/files/ack", json={"sender_id": regular_user.id}, headers=auth)
+    assert [r["result"] for r in resp.json()] == ["acked", "acked"]
+
+    pending = await client.get("/files/pending", headers=auth)
+    assert [f["id"] for f in pending.json()] == [kept]
+
+    resp = await client.post("/files/ack", json={}, headers=auth)
+    assert resp.status_code == 400
+
+
+async def test_download_bundle_zip(
+    client, sender_token, receiver, receiver_token, regular_user, tmp_storage
+):
+    import gzip
+    import zipfile
+
+    text = b"compress me " * 10_000
+    noise = os.urandom(300_000)
+    a = (await _upload(client, sender_token, receiver.id, text, "notes.txt")).json()["id"]
+    b = (await _upload(client, sender_token, receiver.id, noise, "notes.txt")).json()["id"]
+    c = (
+        await client.put(
+            "/files/upload",
+            params={"receiver_id": receiver.id, "original_filename": "dir/log.csv"},
+            content=gzip.compress(text),
+            headers={"Authorization": f"Bearer {sender_token}", "Content-Encoding": "gzip"},
+        )
+    ).json()["id"]
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    resp = await client.get("/files/bundle", params={"ids": f"{a},{b},{c}"}, headers=auth)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as archive:
+        assert archive.testzip() is None
+        infos = archive.infolist()
+        assert [i.filename for i in infos] == ["notes.txt", "notes (2).txt", "log.csv"]
+        assert [i.compress_type for i in infos] == [
+            zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED,
+        ]
+        assert archive.read("notes.txt") == text
+        assert archive.read("notes (2).txt") == noise
+        assert archive.read("log.csv") == text
+
+    # Every id must be the caller's
+    other = (await _upload(client, receiver_token, regular_user.id)).json()["id"]
+    resp = await client.get("/files/bundle", params={"ids": f"{a},{other}"}, headers=auth)
+    assert resp.status_code == 403
+    resp = await client.get("/files/bundle", params={"ids": f"{a},99999"}, headers=auth)
+    assert resp.status_code == 404
+    resp = await client.get("/files/bundle", params={"ids": "x"}, headers=auth)
+    assert resp.status_code == 400
+
+
+async def test_zip_stream_memory_is_bounded(tmp_path):
+    from datetime import datetime
+
+    from zip_stream import CHUNK_SIZE, ZipEntry, iter_zip
+
+    big = tmp_path / "big.bin"
+    with open(big, "wb") as f:
+        for _ in range(32):
+            f.write(os.urandom(CHUNK_SIZE))
+    pieces = list(iter_zip([ZipEntry("big.bin", big, datetime(2024, 1, 1))]))
+    assert len(pieces) > 32
+    assert max(len(p) for p in pieces) <= CHUNK_SIZE + 1024
+
+
+async def test_upload_per_file_ttl(client, sender_token, receiver, tmp_storage):
+    from datetime import datetime, timedelta
+
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver.id, "original_filename": "t.bin", "ttl_hours": 2},
+        content=b"short-lived",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 201
+    body = resp.json()
+    lifetime = datetime.fromisoformat(body["expires_at"]) - datetime.fromisoformat(body["created_at"])
+    assert abs(lifetime - timedelta(hours=2)) < timedelta(seconds=5)
+
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver.id, "original_filename": "t.bin", "ttl_hours": 0},
+        content=b"x",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 400
+
+
+async def test_expiry_scheduler_expires_due_parts(
+    client, sender_token, receiver, receiver_token, tmp_storage, db_session, session_factory,
+    monkeypatch,
+):
+    from datetime import timedelta
+
+    from config import settings
+    from expiry import ExpiryScheduler, utcnow
+    from models import PendingFile
+    from routes.files import expire_files
+
+    monkeypatch.setattr(settings, "EXPIRY_BATCH_SIZE", 1)
+    due = (await _upload(client, sender_token, receiver.id, b"due")).json()["id"]
+    later = (await _upload(client, sender_token, receiver.id, b"later")).json()["id"]
+    legacy = (await _upload(client, sender_token, receiver.id, b"legacy")).json()["id"]
+    db_session.query(PendingFile).filter(PendingFile.id == due).update(
+        {"expires_at": utcnow() - timedelta(seconds=1)}
+    )
+    # Stored before per-file deadlines existed, and older than the default TTL
+    db_session.query(PendingFile).filter(PendingFile.id == legacy).update(
+        {"expires_at": None, "created_at": utcnow() - timedelta(hours=settings.FILE_TTL_HOURS + 1)}
+    )
+    db_session.commit()
+
+    scheduler = ExpiryScheduler()
+    task = asyncio.create_task(scheduler.run(session_factory, expire_files))
+    for _ in range(50):
+        if scheduler.expired == 2:
+            break
+        await asyncio.sleep(0.05)
+    task.cancel()
+    await task
+
+    db_session.expire_all()
+    assert {
+        r.id: r.status for r in db_session.query(PendingFile).filter(PendingFile.id.in_([due, later, legacy]))
+    } == {due: "expired", later: "pending", legacy: "expired"}
+    assert scheduler.stats()["scheduled"] == 1
+
+    pending = await client.get("/files/pending", headers={"Authorization": f"Bearer {receiver_token}"})
+    assert [f["id"] for f in pending.json()] == [later]
+
+
+async def test_backfill_expires_at(
+    client, sender_token, receiver, receiver_token, tmp_storage, db_session, session_factory
+):
+    from expiry import backfill_expires_at
+    from models import PendingFile
+
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    resp = await _upload(client, sender_token, receiver.id, content=b"old part")
+    record = db_session.get(PendingFile, resp.json()["id"])
+    record.expires_at = None
+    db_session.commit()
+    etag = (await client.get("/files/pending", headers=auth)).headers["etag"]
+
+    async with session_factory() as db:
+        await backfill_expires_at(db)
+    db_session.expire_all()
+    assert db_session.get(PendingFile, resp.json()["id"]).expires_at is not None
+
+    # The listing changed, so its ETag must too
+    pending = await client.get("/files/pending", headers={**auth, "If-None-Match": etag})
+    assert pending.status_code == 200
+    assert pending.json()[0]["expires_at"] is not None
+
+
 async def test_download_as_admin(client, sender_token, receiver, admin_token, tmp_storage):
     content = b"admin can see this"
     resp = await _upload(client, sender_token, receiver.id, content=content)
@@ -176,3 +775,208 @@ async def test_download_as_admin(client, sender_token, receiver, admin_token, tm
     )
     assert dl.status_code == 200
     assert dl.content == content
+
+
+async def test_download_single_range(client, sender_token, receiver, receiver_token, tmp_storage):
+    content = b"0123456789"
+    file_id = (await _upload(client, sender_token, receiver.id, content=content)).json()["id"]
+
+    dl = await client.get(
+        f"/files/{file_id}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}", "Range": "bytes=2-5"},
+    )
+    assert dl.status_code == 206
+    assert dl.content == b"2345"
+    assert dl.headers["content-range"] == "bytes 2-5/10"
+
+
+async def test_download_multi_range(client, sender_token, receiver, receiver_token, tmp_storage):
+    content = b"0123456789"
+    file_id = (await _upload(client, sender_token, receiver.id, content=content)).json()["id"]
+
+    dl = await client.get(
+        f"/files/{file_id}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}", "Range": "bytes=0-1,7-8"},
+    )
+    assert dl.status_code == 206
+    assert dl.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert "content-range" not in dl.headers
+    assert b"01" in dl.content and b"78" in dl.content
+    assert b"Content-Range: bytes 7-8/10" in dl.content
+
+
+async def test_download_etag_and_conditionals(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    content = b"etag me"
+    file_id = (await _upload(client, sender_token, receiver.id, content=content)).json()["id"]
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    digest = hashlib.sha256(content).hexdigest()
+
+    head = await client.head(f"/files/{file_id}/part/1", headers=auth)
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == str(len(content))
+    assert head.headers["etag"] == f'"{digest}-{len(content)}"'
+    assert head.headers["x-content-sha256"] == digest
+
+    etag = head.headers["etag"]
+    cached = await client.get(f"/files/{file_id}/part/1", headers={**auth, "If-None-Match": etag})
+    assert cached.status_code == 304
+
+    # If-Range with a stale validator ignores Range and sends everything
+    stale = await client.get(
+        f"/files/{file_id}/part/1",
+        headers={**auth, "Range": "bytes=0-1", "If-Range": '"stale"'},
+    )
+    assert stale.status_code == 200
+    assert stale.content == content
+
+    fresh = await client.get(
+        f"/files/{file_id}/part/1",
+        headers={**auth, "Range": "bytes=0-1", "If-Range": etag},
+    )
+    assert fresh.status_code == 206
+    assert fresh.content == b"et"
+
+
+async def test_zerocopy_send_extension(tmp_path):
+    from responses import ZeroCopyFileResponse
+
+    path = tmp_path / "blob"
+    path.write_bytes(b"0123456789")
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            f = message["file"]
+            f.seek(message["offset"])
+            message = {**message, "data": f.read(message.get("count", -1))}
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"bytes=3-6")],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await ZeroCopyFileResponse(str(path))(scope, receive, send)
+
+    assert messages[0]["status"] == 206
+    assert messages[1]["type"] == "http.response.zerocopysend"
+    assert messages[1]["data"] == b"3456"
+
+
+async def test_upload_gzip_served_compressed_or_decoded(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    import gzip
+
+    content = b"log line\n" * 5000
+    compressed = gzip.compress(content)
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver.id, "original_filename": "app.log"},
+        content=compressed,
+        headers={"Authorization": f"Bearer {sender_token}", "Content-Encoding": "gzip"},
+    )
+    assert resp.status_code == 201
+    assert resp.json()["content_encoding"] == "gzip"
+    assert (tmp_storage / resp.json()["stored_filename"]).read_bytes() == compressed
+
+    url = f"/files/{resp.json()['id']}/part/1"
+    async with client.stream(
+        "GET", url,
+        headers={"Authorization": f"Bearer {receiver_token}", "Accept-Encoding": "gzip"},
+    ) as dl:
+        assert dl.headers["content-encoding"] == "gzip"
+        raw = b"".join([chunk async for chunk in dl.aiter_raw()])
+    assert raw == compressed
+
+    plain = await client.get(
+        url,
+        headers={"Authorization": f"Bearer {receiver_token}", "Accept-Encoding": "identity"},
+    )
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers
+    assert plain.content == content
+
+
+async def test_upload_unsupported_encoding(client, sender_token, receiver, tmp_storage):
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver.id, "original_filename": "x.bin"},
+        content=b"data",
+        headers={"Authorization": f"Bearer {sender_token}", "Content-Encoding": "br"},
+    )
+    assert resp.status_code == 415
+
+
+async def test_upload_zstd_decoded_for_identity_clients(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    zstandard = pytest.importorskip("zstandard")
+
+    content = b"csv,row,data\n" * 3000
+    resp = await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver.id, "original_filename": "dump.csv"},
+        content=zstandard.ZstdCompressor().compress(content),
+        headers={"Authorization": f"Bearer {sender_token}", "Content-Encoding": "zstd"},
+    )
+    assert resp.json()["content_encoding"] == "zstd"
+
+    plain = await client.get(
+        f"/files/{resp.json()['id']}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}", "Accept-Encoding": "identity"},
+    )
+    assert plain.content == content
+
+
+async def test_download_from_s3(
+    client, sender_token, receiver, receiver_token, tmp_storage, s3_backend, monkeypatch
+):
+    import zipfile
+
+    import httpx
+
+    import storage
+    from config import settings
+
+    monkeypatch.setattr(storage, "backend", s3_backend)
+    content = os.urandom(100_000)
+    resp = await _upload_raw(client, sender_token, receiver.id, content)
+    assert resp.status_code == 201
+    url = f"/files/{resp.json()['id']}/part/1"
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+
+    # A plain GET goes straight to the bucket
+    dl = await client.get(url, headers=auth)
+    assert dl.status_code == 307
+    assert "fx/blobs/" in dl.headers["location"]
+    async with httpx.AsyncClient() as bucket:
+        fetched = await bucket.get(dl.headers["location"])
+    assert fetched.content == content
+    assert 'filename="raw.bin"' in fetched.headers["content-disposition"]
+
+    # Resumes carry If-Range, so they are streamed through with our ETag
+    head = await client.head(url, headers=auth)
+    assert head.status_code == 200
+    assert head.headers["content-length"] == str(len(content))
+    etag = head.headers["etag"]
+    dl = await client.get(url, headers={**auth, "Range": "bytes=1000-", "If-Range": etag})
+    assert dl.status_code == 206
+    assert dl.content == content[1000:]
+
+    monkeypatch.setattr(settings, "STORAGE_REDIRECT_DOWNLOADS", False)
+    dl = await client.get(url, headers=auth)
+    assert dl.status_code == 200
+    assert dl.content == content
+
+    bundle = await client.get("/files/bundle", params={"ids": resp.json()["id"]}, headers=auth)
+    assert bundle.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(bundle.content)) as archive:
+        assert archive.read("raw.bin") == content
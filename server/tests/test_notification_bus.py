@@ -0,0 +1,112 @@
+import asyncio
+import json
+import socket
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).parent.parent
+
+# A worker process: joins the bus, reports ready, prints the first event it gets
+WORKER = f"""
+import asyncio, json, sys
+sys.path.insert(0, {str(SERVER_DIR)!r})
+from notification_bus import UnixSocketBus
+
+async def main():
+    got = asyncio.get_running_loop().create_future()
+    bus = UnixSocketBus(sys.argv[1], deliver=lambda u, m: got.done() or got.set_result([u, m]))
+    await bus.start()
+    print("ready", flush=True)
+    print(json.dumps(await asyncio.wait_for(got, 10)), flush=True)
+    await bus.stop()
+
+asyncio.run(main())
+"""
+
+
+async def _spawn_worker(bus_dir):
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", WORKER, str(bus_dir),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    assert (await asyncio.wait_for(proc.stdout.readline(), 10)).strip() == b"ready"
+    return proc
+
+
+async def test_publish_reaches_every_worker_process(tmp_path):
+    from notification_bus import UnixSocketBus
+
+    workers = [await _spawn_worker(tmp_path) for _ in range(2)]
+    local = []
+    bus = UnixSocketBus(tmp_path, deliver=lambda u, m: local.append((u, m)))
+    await bus.start()
+    try:
+        bus.publish(42, {"event": "new_file", "file_id": 7})
+        for proc in workers:
+            line = await asyncio.wait_for(proc.stdout.readline(), 10)
+            assert json.loads(line) == [42, {"event": "new_file", "file_id": 7}]
+            assert await proc.wait() == 0
+        assert local == [(42, {"event": "new_file", "file_id": 7})]
+    finally:
+        await bus.stop()
+        for proc in workers:
+            if proc.returncode is None:
+                proc.kill()
+
+
+async def test_dead_worker_socket_is_removed(tmp_path):
+    from notification_bus import UnixSocketBus
+
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / "99999.sock"))
+    dead.close()  # socket file stays behind, nobody listening
+
+    bus = UnixSocketBus(tmp_path, deliver=lambda u, m: None)
+    await bus.start()
+    try:
+        bus.publish(1, {"event": "new_file"})
+        assert not (tmp_path / "99999.sock").exists()
+    finally:
+        await bus.stop()
+
+
+# A worker process: caches a principal, reports ready, then waits for its eviction
+CACHING_WORKER = f"""
+import asyncio, sys
+sys.path.insert(0, {str(SERVER_DIR)!r})
+from models import User
+from notification_bus import UnixSocketBus
+from principal_cache import principal_cache
+
+async def main():
+    bus = UnixSocketBus(sys.argv[1], deliver=lambda u, m: None)
+    await bus.start()
+    principal_cache.put_user(User(id=7, username="u", password_hash="x", is_admin=True))
+    print("ready", flush=True)
+    while principal_cache.user(7) is not None:
+        await asyncio.sleep(0.01)
+    print("evicted", flush=True)
+    await bus.stop()
+
+asyncio.run(main())
+"""
+
+
+async def test_user_change_evicts_cached_principal_in_every_worker(tmp_path):
+    from notification_bus import UnixSocketBus
+    from principal_cache import principal_cache
+
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", CACHING_WORKER, str(tmp_path), stdout=asyncio.subprocess.PIPE,
+    )
+    bus = UnixSocketBus(tmp_path, deliver=lambda u, m: None)
+    await bus.start()
+    try:
+        assert (await asyncio.wait_for(proc.stdout.readline(), 10)).strip() == b"ready"
+        principal_cache.user_changed(7)
+        assert (await asyncio.wait_for(proc.stdout.readline(), 10)).strip() == b"evicted"
+        assert await proc.wait() == 0
+    finally:
+        await bus.stop()
+        if proc.returncode is None:
+            proc.kill()
@@ -0,0 +1,217 @@
+"""Conformance tests every storage backend must pass, plus the legacy migration."""
+import hashlib
+import os
+
+import pytest
+
+DATA = bytes(range(256)) * 5000  # spans several read chunks
+
+
+@pytest.fixture(params=["local", "s3"])
+def backend(request, tmp_path):
+    from storage import LocalStorage
+
+    if request.param == "local":
+        return LocalStorage(tmp_path / "objects")
+    return request.getfixturevalue("s3_backend")
+
+
+async def _read(backend, key, start=0, end=None):
+    return b"".join([chunk async for chunk in backend.read_range(key, start, end)])
+
+
+async def _write(backend, key, data):
+    async with backend.open_write(key) as f:
+        for i in range(0, len(data), 100_000):
+            await f.write(data[i:i + 100_000])
+
+
+async def test_write_then_read(backend):
+    await _write(backend, "blobs/ab/abc", DATA)
+    assert await _read(backend, "blobs/ab/abc") == DATA
+    stat = await backend.stat("blobs/ab/abc")
+    assert stat.size == len(DATA)
+    assert stat.modified > 0
+
+
+async def test_range_reads(backend):
+    await _write(backend, "k", DATA)
+    assert await _read(backend, "k", 10, 20) == DATA[10:20]
+    assert await _read(backend, "k", len(DATA) - 5) == DATA[-5:]
+    assert await _read(backend, "k", 0, 0) == b""
+    # Across a chunk boundary
+    assert await _read(backend, "k", 1024 * 1024 - 3, 1024 * 1024 + 3) == DATA[
+        1024 * 1024 - 3:1024 * 1024 + 3
+    ]
+
+
+async def test_write_is_invisible_until_complete(backend):
+    await _write(backend, "k", b"old")
+    with pytest.raises(RuntimeError):
+        async with backend.open_write("k") as f:
+            await f.write(b"new and partial")
+            assert await _read(backend, "k") == b"old"
+            raise RuntimeError("upload failed")
+    assert await _read(backend, "k") == b"old"
+    assert [key async for key, _ in backend.list()] == ["k"]
+
+
+async def test_missing_object(backend):
+    with pytest.raises(FileNotFoundError):
+        await backend.stat("nope")
+    with pytest.raises(FileNotFoundError):
+        await _read(backend, "nope")
+    assert not await backend.exists("nope")
+    await backend.delete("nope")  # no error
+
+
+async def test_delete_and_rename(backend):
+    await _write(backend, "a/one", b"1")
+    await backend.rename("a/one", "trash/x")
+    assert not await backend.exists("a/one")
+    assert await _read(backend, "trash/x") == b"1"
+    await backend.delete("trash/x")
+    assert not await backend.exists("trash/x")
+    with pytest.raises(FileNotFoundError):
+        await backend.rename("a/one", "trash/y")
+
+
+async def test_list_by_prefix(backend):
+    for key in ("blobs/aa/aa1", "blobs/aa/aa2", "blobs/ab/ab1", "trash/t"):
+        await _write(backend, key, key.encode())
+    listed = {key: stat.size async for key, stat in backend.list("blobs/aa")}
+    assert listed == {"blobs/aa/aa1": 12, "blobs/aa/aa2": 12}
+    assert len([key async for key, _ in backend.list()]) == 4
+
+
+async def test_put_file_consumes_source(backend, tmp_path):
+    source = tmp_path / "staged"
+    source.write_bytes(DATA)
+    await backend.put_file("blobs/cd/cd1", source)
+    assert not source.exists()
+    assert await _read(backend, "blobs/cd/cd1") == DATA
+
+
+async def test_read_blocking(backend):
+    await _write(backend, "k", DATA)
+    assert b"".join(backend.read_blocking("k")) == DATA
+
+
+async def test_s3_multipart_upload(s3_backend, tmp_path):
+    data = os.urandom(11 * 1024 * 1024)  # three parts at 5 MiB
+    source = tmp_path / "staged"
+    source.write_bytes(data)
+    await s3_backend.put_file("blobs/ef/ef1", source)
+    assert await _read(s3_backend, "blobs/ef/ef1") == data
+    assert await _read(s3_backend, "blobs/ef/ef1", 5 * 1024 * 1024 - 1, 5 * 1024 * 1024 + 1) == (
+        data[5 * 1024 * 1024 - 1:5 * 1024 * 1024 + 1]
+    )
+    # Keys live under the prefix in the bucket
+    head = s3_backend.client.head_object(Bucket="exchange", Key="fx/blobs/ef/ef1")
+    assert head["ContentLength"] == len(data)
+
+
+async def test_s3_failed_multipart_upload_is_aborted(s3_backend):
+    with pytest.raises(RuntimeError):
+        async with s3_backend.open_write("big") as f:
+            await f.write(b"x" * (6 * 1024 * 1024))  # starts the multipart upload
+            raise RuntimeError("upload failed")
+    assert not await s3_backend.exists("big")
+    uploads = s3_backend.client.list_multipart_uploads(Bucket="exchange")
+    assert not uploads.get("Uploads")
+
+
+async def test_rejects_keys_outside_the_store(backend):
+    for key in ("../escape", "/abs", ""):
+        with pytest.raises(ValueError):
+            await backend.stat(key)
+
+
+async def test_migrate_legacy_layout(db_session, session_factory, regular_user, tmp_storage):
+    from deletion_queue import DeletionWorker
+    from migrate_storage import migrate
+    from models import PendingDeletion, PendingFile
+
+    record = PendingFile(
+        sender_id=regular_user.id, receiver_id=regular_user.id,
+        original_filename="old.bin", stored_filename="7/part_1", status="pending",
+    )
+    acked = PendingFile(
+        sender_id=regular_user.id, receiver_id=regular_user.id,
+        original_filename="gone.bin", stored_filename="8/part_1", status="delivered",
+    )
+    db_session.add_all([record, acked])
+    db_session.commit()
+    for key in ("7/part_1", "8/part_1"):
+        (tmp_storage / key).parent.mkdir(parents=True)
+        (tmp_storage / key).write_bytes(b"legacy bytes")
+
+    version = regular_user.inbox_version
+    stats = await migrate(session_factory)
+    assert (stats.migrated, stats.orphans) == (1, 1)
+
+    digest = hashlib.sha256(b"legacy bytes").hexdigest()
+    db_session.expire_all()
+    record = db_session.get(PendingFile, record.id)
+    assert record.stored_filename == f"blobs/{digest[:2]}/{digest}"
+    assert (record.sha256, record.size) == (digest, len(b"legacy bytes"))
+    # /files/pending returns the rewritten fields, so its version moves
+    db_session.refresh(regular_user)
+    assert regular_user.inbox_version == version + 1
+    assert (tmp_storage / record.stored_filename).read_bytes() == b"legacy bytes"
+
+    # Old directories stay for the grace period, then go
+    assert sorted(p.path for p in db_session.query(PendingDeletion)) == ["7", "8"]
+    assert await DeletionWorker().run_once(session_factory) == 0
+    stats = await migrate(session_factory)
+    assert (stats.migrated, stats.orphans) == (0, 0)
+
+    db_session.query(PendingDeletion).update({"not_before": PendingDeletion.created_at})
+    db_session.commit()
+    assert await DeletionWorker().run_once(session_factory) == 2
+    assert not (tmp_storage / "7").exists()
+    assert not (tmp_storage / "8").exists()
+
+
+async def test_abandoned_migration_queues_its_blob(
+    db_session, session_factory, regular_user, tmp_storage
+):
+    from datetime import timedelta
+
+    from deletion_queue import DeletionWorker
+    from migrate_storage import migrate_part
+    from models import PendingFile
+
+    record = PendingFile(
+        sender_id=regular_user.id, receiver_id=regular_user.id,
+        original_filename="old.bin", stored_filename="9/part_1", status="delivered",
+    )
+    db_session.add(record)
+    db_session.commit()
+    (tmp_storage / "9").mkdir()
+    (tmp_storage / "9/part_1").write_bytes(b"acked meanwhile")
+
+    assert not await migrate_part(session_factory, record.id, "9/part_1", timedelta(0))
+    digest = hashlib.sha256(b"acked meanwhile").hexdigest()
+    assert (tmp_storage / f"blobs/{digest[:2]}/{digest}").exists()
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert not (tmp_storage / f"blobs/{digest[:2]}/{digest}").exists()
+
+
+async def test_s3_errors_surface_as_oserror(s3_backend, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    import deletion_queue
+    import storage
+
+    def throttled(**kwargs):
+        raise ClientError({"Error": {"Code": "SlowDown", "Message": "Reduce your rate"}}, "DeleteObjects")
+
+    await _write(s3_backend, "blobs/ab/ab1", b"kept")
+    monkeypatch.setattr(s3_backend.client, "delete_objects", throttled)
+    with pytest.raises(OSError):
+        await s3_backend.delete("blobs/ab/ab1")
+    # So the deletion worker records a failed attempt instead of aborting its batch
+    monkeypatch.setattr(storage, "backend", s3_backend)
+    assert not await deletion_queue._remove("blobs/ab/ab1")
+    assert await s3_backend.exists("blobs/ab/ab1")
@@ -0,0 +1,121 @@
+import hashlib
+
+
+async def _upload_part(client, token, receiver_id, content, part_number, total_parts=3):
+    return await client.put(
+        "/files/upload",
+        params={
+            "receiver_id": receiver_id,
+            "original_filename": "movie.mkv",
+            "part_number": part_number,
+            "total_parts": total_parts,
+        },
+        content=content,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+PARTS = [b"first part|", b"second part|", b"third"]
+
+
+async def test_parts_are_grouped_and_reassembled(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    third = (await _upload_part(client, sender_token, receiver.id, PARTS[2], 3)).json()
+    first = (await _upload_part(client, sender_token, receiver.id, PARTS[0], 1)).json()
+    transfer_id = first["transfer_id"]
+    assert third["transfer_id"] == transfer_id
+
+    manifest = (await client.get(f"/transfers/{transfer_id}", headers=auth)).json()
+    assert manifest["complete"] is False
+    assert [p["part_number"] for p in manifest["parts"]] == [1, 3]
+    resp = await client.get(f"/transfers/{transfer_id}/content", headers=auth)
+    assert resp.status_code == 409
+
+    second = (await _upload_part(client, sender_token, receiver.id, PARTS[1], 2)).json()
+    assert second["transfer_id"] == transfer_id
+
+    manifest = (await client.get(f"/transfers/{transfer_id}", headers=auth)).json()
+    assert manifest["complete"] is True
+    assert manifest["size"] == sum(len(p) for p in PARTS)
+    assert [(p["size"], p["sha256"]) for p in manifest["parts"]] == [
+        (len(p), hashlib.sha256(p).hexdigest()) for p in PARTS
+    ]
+
+    resp = await client.get(f"/transfers/{transfer_id}/content", headers=auth)
+    assert resp.status_code == 200
+    assert resp.content == b"".join(PARTS)
+    assert "movie.mkv" in resp.headers["content-disposition"]
+
+    # A range spanning the part boundaries
+    resp = await client.get(
+        f"/transfers/{transfer_id}/content",
+        headers={**auth, "Range": "bytes=5-15", "If-Range": resp.headers["etag"]},
+    )
+    assert resp.status_code == 206
+    assert resp.content == b"".join(PARTS)[5:16]
+    assert resp.headers["content-range"] == f"bytes 5-15/{sum(len(p) for p in PARTS)}"
+
+    resp = await client.head(f"/transfers/{transfer_id}/content", headers=auth)
+    assert resp.headers["content-length"] == str(sum(len(p) for p in PARTS))
+
+
+async def test_resent_file_starts_a_new_transfer(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    first = (await _upload_part(client, sender_token, receiver.id, b"a", 1, 1)).json()
+    again = (await _upload_part(client, sender_token, receiver.id, b"b", 1, 1)).json()
+    assert first["transfer_id"] != again["transfer_id"]
+
+    # An acked transfer is closed: the next part 1 of 2 does not join it
+    pair = (await _upload_part(client, sender_token, receiver.id, b"x", 1, 2)).json()
+    await client.post(
+        f"/files/{pair['id']}/ack", headers={"Authorization": f"Bearer {receiver_token}"}
+    )
+    second = (await _upload_part(client, sender_token, receiver.id, b"y", 2, 2)).json()
+    assert second["transfer_id"] != pair["transfer_id"]
+
+
+async def test_transfer_access_is_receiver_only(
+    client, sender_token, receiver, tmp_storage
+):
+    part = (await _upload_part(client, sender_token, receiver.id, b"x", 1, 1)).json()
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    resp = await client.get(f"/transfers/{part['transfer_id']}", headers=auth)
+    assert resp.status_code == 403
+    resp = await client.get("/transfers/99999", headers=auth)
+    assert resp.status_code == 404
+
+
+async def test_concat_response_uses_zerocopy_per_part(tmp_path):
+    from responses import ConcatFileResponse
+
+    files = []
+    for i, data in enumerate(PARTS):
+        path = tmp_path / f"part{i}"
+        path.write_bytes(data)
+        files.append((path, len(data)))
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            f = message["file"]
+            f.seek(message["offset"])
+            message = {**message, "data": f.read(message["count"])}
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"bytes=8-")],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await ConcatFileResponse(files)(scope, receive, send)
+
+    assert messages[0]["status"] == 206
+    assert [m["data"] for m in messages[1:-1]] == [b"rt|", PARTS[1], PARTS[2]]
+    assert messages[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
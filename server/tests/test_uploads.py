@@ -0,0 +1,376 @@
+import asyncio
+
+import pytest
+
+
+async def _create_session(client, token, receiver_id, size, filename="big.bin"):
+    return await client.post(
+        "/files/uploads",
+        json={
+            "receiver_id": receiver_id,
+            "original_filename": filename,
+            "size": size,
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+async def _patch(client, token, session_id, offset, data):
+    return await client.patch(
+        f"/files/uploads/{session_id}",
+        content=data,
+        headers={"Authorization": f"Bearer {token}", "Upload-Offset": str(offset)},
+    )
+
+
+async def test_create_session(client, sender_token, receiver, tmp_storage):
+    resp = await _create_session(client, sender_token, receiver.id, 10)
+    assert resp.status_code == 201
+    body = resp.json()
+    assert body["offset"] == 0
+    assert body["ranges"] == []
+    assert resp.headers["location"].endswith(body["id"])
+
+
+async def test_create_session_unknown_receiver(client, sender_token, tmp_storage):
+    resp = await _create_session(client, sender_token, 99999, 10)
+    assert resp.status_code == 404
+
+
+async def test_resume_reports_offset(client, sender_token, receiver, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 10)).json()["id"]
+
+    resp = await _patch(client, sender_token, session_id, 0, b"01234")
+    assert resp.status_code == 204
+    assert resp.headers["upload-offset"] == "5"
+
+    head = await client.head(
+        f"/files/uploads/{session_id}",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert head.status_code == 200
+    assert head.headers["upload-offset"] == "5"
+    assert head.headers["upload-length"] == "10"
+
+
+async def test_out_of_order_ranges_then_complete(
+    client, sender_token, receiver, receiver_token, tmp_storage
+):
+    content = b"abcdefghijkl"
+    session_id = (
+        await _create_session(client, sender_token, receiver.id, len(content))
+    ).json()["id"]
+
+    await _patch(client, sender_token, session_id, 8, content[8:])
+    await _patch(client, sender_token, session_id, 4, content[4:8])
+
+    info = await client.get(
+        f"/files/uploads/{session_id}",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert info.json()["offset"] == 0
+    assert info.json()["ranges"] == [[4, 12]]
+
+    await _patch(client, sender_token, session_id, 0, content[:4])
+    done = await client.post(
+        f"/files/uploads/{session_id}/complete",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert done.status_code == 201
+    file_id = done.json()["id"]
+
+    dl = await client.get(
+        f"/files/{file_id}/part/1",
+        headers={"Authorization": f"Bearer {receiver_token}"},
+    )
+    assert dl.content == content
+    assert not (tmp_storage / "uploads" / session_id).exists()
+
+
+async def test_complete_incomplete_session(client, sender_token, receiver, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 10)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"012")
+
+    resp = await client.post(
+        f"/files/uploads/{session_id}/complete",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 409
+
+
+async def test_patch_beyond_size(client, sender_token, receiver, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    resp = await _patch(client, sender_token, session_id, 2, b"too long")
+    assert resp.status_code == 413
+
+
+async def test_session_wrong_user(client, sender_token, receiver, receiver_token, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    resp = await _patch(client, receiver_token, session_id, 0, b"data")
+    assert resp.status_code == 403
+
+
+async def test_abort_session(client, sender_token, receiver, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    resp = await client.delete(
+        f"/files/uploads/{session_id}",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.status_code == 204
+    assert not (tmp_storage / "uploads" / session_id).exists()
+
+
+async def test_abort_during_complete(client, sender_token, receiver, tmp_storage, monkeypatch):
+    import time
+
+    import routes.uploads
+    from upload_sessions import lock_staging
+
+    def slow_lock(*args):
+        locked = lock_staging(*args)
+        time.sleep(0.3)  # holding the lock, before the session is claimed
+        return locked
+
+    monkeypatch.setattr(routes.uploads, "lock_staging", slow_lock)
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    complete = asyncio.create_task(client.post(f"/files/uploads/{session_id}/complete", headers=auth))
+    await asyncio.sleep(0.1)
+    abort = await client.delete(f"/files/uploads/{session_id}", headers=auth)
+    assert (await complete).status_code == 201
+    assert abort.status_code == 404
+
+
+async def test_session_to_many_receivers(
+    client, sender_token, receiver, regular_user, tmp_storage
+):
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    resp = await client.post(
+        "/files/uploads",
+        json={
+            "receiver_ids": [receiver.id, regular_user.id],
+            "original_filename": "big.bin",
+            "size": 4,
+        },
+        headers=auth,
+    )
+    assert resp.status_code == 201
+    session_id = resp.json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+
+    resp = await client.post(f"/files/uploads/{session_id}/complete", headers=auth)
+    assert resp.status_code == 201
+    records = resp.json()
+    assert [r["receiver_id"] for r in records] == [receiver.id, regular_user.id]
+    assert len({r["stored_filename"] for r in records}) == 1
+
+
+async def test_complete_skips_deleted_receivers(
+    client, sender_token, receiver, tmp_storage, db_session
+):
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    resp = await client.post(
+        "/files/uploads",
+        json={"receiver_ids": [1, receiver.id], "original_filename": "big.bin", "size": 4},
+        headers=auth,
+    )
+    session_id = resp.json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+    db_session.delete(receiver)
+    db_session.commit()
+
+    resp = await client.post(f"/files/uploads/{session_id}/complete", headers=auth)
+    assert resp.status_code == 201
+    assert [r["receiver_id"] for r in resp.json()] == [1]
+
+
+async def test_complete_without_receivers_left(
+    client, sender_token, receiver, tmp_storage, db_session
+):
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+    db_session.delete(receiver)
+    db_session.commit()
+
+    resp = await client.post(f"/files/uploads/{session_id}/complete", headers=auth)
+    assert resp.status_code == 404
+    assert resp.json()["detail"] == "Receiver not found"
+    resp = await client.get(f"/files/uploads/{session_id}", headers=auth)
+    assert resp.json()["offset"] == 4
+
+
+async def test_session_sha256_mismatch_discards_session(
+    client, sender_token, receiver, tmp_storage
+):
+    import hashlib
+
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    resp = await client.post(
+        "/files/uploads",
+        json={
+            "receiver_id": receiver.id,
+            "original_filename": "big.bin",
+            "size": 4,
+            "sha256": hashlib.sha256(b"data").hexdigest(),
+        },
+        headers=auth,
+    )
+    session_id = resp.json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"dama")
+
+    resp = await client.post(f"/files/uploads/{session_id}/complete", headers=auth)
+    assert resp.status_code == 400
+    resp = await client.get(f"/files/uploads/{session_id}", headers=auth)
+    assert resp.status_code == 404
+
+
+async def test_concurrent_completes_store_once(client, sender_token, receiver, tmp_storage):
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+
+    url = f"/files/uploads/{session_id}/complete"
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    first, second = await asyncio.gather(
+        client.post(url, headers=auth), client.post(url, headers=auth)
+    )
+    assert sorted([first.status_code, second.status_code])[0] == 201
+    assert sorted([first.status_code, second.status_code])[1] in (404, 409)
+
+
+async def test_failed_complete_can_be_retried(
+    client, sender_token, receiver, tmp_storage, monkeypatch
+):
+    import routes.files
+
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+
+    acquire_blob = routes.files.acquire_blob
+    calls = []
+
+    async def fails_once(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return await acquire_blob(*args, **kwargs)
+
+    monkeypatch.setattr(routes.files, "acquire_blob", fails_once)
+    url = f"/files/uploads/{session_id}/complete"
+    auth = {"Authorization": f"Bearer {sender_token}"}
+    with pytest.raises(OSError):
+        await client.post(url, headers=auth)
+
+    resp = await client.get(f"/files/uploads/{session_id}", headers=auth)
+    assert resp.json()["offset"] == 4
+    resp = await client.post(url, headers=auth)
+    assert resp.status_code == 201
+
+
+@pytest.mark.parametrize("rewrite", [False, True])
+async def test_in_order_session_is_hashed_as_it_arrives(
+    client, sender_token, receiver, tmp_storage, monkeypatch, rewrite
+):
+    import hashlib
+
+    import blob_store
+    import routes.uploads
+
+    read_from = []
+
+    def spy(path, digest=None, start=0):
+        read_from.append(start)
+        return blob_store.hash_file(path, digest, start)
+
+    monkeypatch.setattr(routes.uploads, "hash_file", spy)
+    content = b"0123456789"
+    session_id = (await _create_session(client, sender_token, receiver.id, 10)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"01234")
+    if rewrite:
+        # Hashed bytes written again differently: the digest starts over
+        await _patch(client, sender_token, session_id, 0, b"0123X")
+        await _patch(client, sender_token, session_id, 4, b"4")
+    await _patch(client, sender_token, session_id, 5, b"56789")
+
+    resp = await client.post(
+        f"/files/uploads/{session_id}/complete",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    )
+    assert resp.json()["sha256"] == hashlib.sha256(content).hexdigest()
+    assert read_from == [0 if rewrite else 10]
+
+
+async def test_orphan_staging_files_are_swept(
+    client, sender_token, receiver, tmp_storage, session_factory
+):
+    import os
+
+    from upload_sessions import staging_path, sweep_orphan_uploads
+
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    # Left by a create or complete that crashed with no row for it
+    orphan, fresh = staging_path("crashed"), staging_path("creating")
+    orphan.write_bytes(b"data")
+    fresh.write_bytes(b"data")
+    for path in (orphan, staging_path(session_id)):
+        os.utime(path, (0, 0))
+
+    async with session_factory() as db:
+        assert await sweep_orphan_uploads(db, max_age=3600) == 1
+    assert not orphan.exists()
+    assert fresh.exists()
+    assert staging_path(session_id).exists()
+
+
+async def test_complete_waits_for_patch_in_flight(
+    client, sender_token, receiver, tmp_storage
+):
+    import hashlib
+
+    session_id = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    await _patch(client, sender_token, session_id, 0, b"data")
+
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def slow_body():
+        yield b"DA"
+        started.set()
+        await finish.wait()
+        yield b"TA"
+
+    patch = asyncio.create_task(_patch(client, sender_token, session_id, 0, slow_body()))
+    await started.wait()
+    complete = asyncio.create_task(client.post(
+        f"/files/uploads/{session_id}/complete",
+        headers={"Authorization": f"Bearer {sender_token}"},
+    ))
+    await asyncio.sleep(0.2)
+    assert not complete.done()
+    finish.set()
+
+    assert (await patch).status_code == 204
+    resp = await complete
+    assert resp.status_code == 201
+    stored = (tmp_storage / resp.json()["stored_filename"]).read_bytes()
+    assert stored == b"DATA"
+    assert resp.json()["sha256"] == hashlib.sha256(stored).hexdigest()
+
+
+async def test_digests_of_finished_sessions_are_dropped(
+    client, sender_token, receiver, tmp_storage, session_factory, db_session
+):
+    from models import UploadSession
+    from upload_sessions import drop_finished_digests, prefix_digests
+
+    finished = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    open_ = (await _create_session(client, sender_token, receiver.id, 4)).json()["id"]
+    # Completed by another worker, which had no digest to drop
+    db_session.query(UploadSession).filter(UploadSession.id == finished).delete()
+    db_session.commit()
+
+    async with session_factory() as db:
+        await drop_finished_digests(db)  # others are left over from earlier tests
+    assert finished not in prefix_digests
+    assert open_ in prefix_digests
@@ -94,3 +94,51 @@ async def test_delete_non_admin(client, user_token, db_session):
         headers={"Authorization": f"Bearer {user_token}"},
     )
     assert resp.status_code == 403
+
+
+async def test_delete_user_releases_pending_files(
+    client, admin_token, user_token, regular_user, tmp_storage, session_factory
+):
+    import io
+
+    from deletion_queue import DeletionWorker
+    from models import UploadSession
+    from upload_sessions import staging_path
+
+    resp = await client.post(
+        "/files/upload",
+        files={"file": ("a.txt", io.BytesIO(b"orphan"), "application/octet-stream")},
+        data={"receiver_id": str(regular_user.id), "original_filename": "a.txt"},
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    blob_path = tmp_storage / resp.json()["stored_filename"]
+    assert blob_path.exists()
+    session_id = (
+        await client.post(
+            "/files/uploads",
+            json={"receiver_id": 1, "original_filename": "b.bin", "size": 4},
+            headers={"Authorization": f"Bearer {user_token}"},
+        )
+    ).json()["id"]
+    staging = staging_path(session_id)
+    assert staging.exists()
+
+    resp = await client.delete(
+        f"/users/{regular_user.id}",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert resp.status_code == 204
+    assert await DeletionWorker().run_once(session_factory) == 1
+    assert not blob_path.exists()
+    assert not staging.exists()
+    async with session_factory() as db:
+        assert await db.get(UploadSession, session_id) is None
+
+
+async def test_metrics_admin_only(client, admin_token, user_token):
+    resp = await client.get("/metrics", headers={"Authorization": f"Bearer {admin_token}"})
+    assert resp.status_code == 200
+    assert {"size", "busy", "waiting"} <= resp.json()["threadpool"].keys()
+
+    resp = await client.get("/metrics", headers={"Authorization": f"Bearer {user_token}"})
+    assert resp.status_code == 403
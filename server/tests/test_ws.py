@@ -2,7 +2,6 @@ import asyncio
 import io
 import threading
 
-import pytest
 from starlette.testclient import TestClient
 
 
@@ -127,34 +126,172 @@ async def test_upload_triggers_new_file_notification(
     assert notification[0].get("event") == "new_file"
 
 
-# ---------------------------------------------------------------------------
-# Fixtures
-# ---------------------------------------------------------------------------
+async def _upload(client, token, receiver_id, content):
+    return await client.put(
+        "/files/upload",
+        params={"receiver_id": receiver_id, "original_filename": "f.bin"},
+        content=content,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
 
-@pytest.fixture
-def sender_token(regular_user):
-    from auth import create_access_token
-    return create_access_token({"sub": str(regular_user.id)})
+def _ws_messages(app, token, since, count):
+    with TestClient(app).websocket_connect(f"/ws?token={token}&since={since}") as ws:
+        return [ws.receive_json() for _ in range(count)]
 
 
-@pytest.fixture
-def receiver(db_session):
-    from auth import hash_password
-    from models import User
+async def test_reconnect_replays_missed_events(
+    client, test_app, sender_token, receiver, receiver_token, tmp_storage
+):
+    first = await _upload(client, sender_token, receiver.id, b"one")
+    second = await _upload(client, sender_token, receiver.id, b"two")
 
-    u = User(
-        username="ws_receiver",
-        password_hash=hash_password("recv"),
-        is_admin=False,
-        force_change_password=False,
+    pending = await client.get(
+        "/files/pending", headers={"Authorization": f"Bearer {receiver_token}"}
     )
-    db_session.add(u)
-    db_session.commit()
-    db_session.refresh(u)
-    return u
+    assert pending.headers["x-event-seq"] == "2"
+
+    events = await asyncio.to_thread(_ws_messages, test_app, receiver_token, 0, 2)
+    assert [(e["event"], e["seq"], e["file_id"]) for e in events] == [
+        ("new_file", 1, first.json()["id"]),
+        ("new_file", 2, second.json()["id"]),
+    ]
+
+    events = await asyncio.to_thread(_ws_messages, test_app, receiver_token, 1, 1)
+    assert events[0]["seq"] == 2
 
 
-@pytest.fixture
-def receiver_token(receiver):
-    from auth import create_access_token
-    return create_access_token({"sub": str(receiver.id)})
+async def test_events_are_self_contained_inbox_deltas(
+    client, test_app, sender_token, receiver, receiver_token, tmp_storage
+):
+    auth = {"Authorization": f"Bearer {receiver_token}"}
+    upload = await _upload(client, sender_token, receiver.id, b"one")
+    file_id = upload.json()["id"]
+    pending = await client.get("/files/pending", headers=auth)
+    assert pending.headers["x-inbox-version"] == "1"
+
+    ack = await client.post(f"/files/{file_id}/ack", headers=auth)
+    assert ack.status_code == 204
+
+    added, removed = await asyncio.to_thread(_ws_messages, test_app, receiver_token, 0, 2)
+    assert added["event"] == "new_file"
+    assert added["inbox_version"] == 1
+    assert added["file"] == pending.json()[0]
+    assert removed == {
+        "event": "files_removed",
+        "file_ids": [file_id],
+        "reason": "delivered",
+        "inbox_version": 2,
+        "seq": 2,
+    }
+
+
+async def test_reconnect_after_pruned_events_asks_for_resync(
+    client, test_app, sender_token, receiver, receiver_token, tmp_storage, db_session
+):
+    from models import Event
+
+    await _upload(client, sender_token, receiver.id, b"one")
+    await _upload(client, sender_token, receiver.id, b"two")
+    db_session.query(Event).filter(Event.seq == 1).delete()
+    db_session.commit()
+
+    events = await asyncio.to_thread(_ws_messages, test_app, receiver_token, 0, 1)
+    assert events == [{"event": "resync", "seq": 2}]
+
+    # A seq from the future (e.g. the server's database was reset) as well
+    events = await asyncio.to_thread(_ws_messages, test_app, receiver_token, 99, 1)
+    assert events == [{"event": "resync", "seq": 2}]
+
+
+class _FakeSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+async def test_slow_socket_does_not_delay_others(monkeypatch):
+    from config import settings
+    from connection_manager import ConnectionManager
+
+    monkeypatch.setattr(settings, "WS_SEND_TIMEOUT", 0.2)
+    mgr = ConnectionManager()
+    fast, stalled = _FakeSocket(), _FakeSocket(delay=10)
+    fast_conn = await mgr.connect(1, fast)
+    await mgr.connect(1, stalled)
+
+    await mgr.send_to_user(1, {"event": "new_file"})
+    await asyncio.sleep(0.05)
+    assert fast.sent == ['{"event": "new_file"}']
+
+    await asyncio.sleep(0.3)  # stalled send times out and the socket is evicted
+    assert stalled.closed
+    assert mgr.stats() == {"users": 1, "sockets": 1, "evicted": 1}
+    await mgr.disconnect(fast_conn)
+    await asyncio.sleep(0.01)
+
+
+async def test_full_send_queue_evicts_socket(monkeypatch):
+    from config import settings
+    from connection_manager import ConnectionManager
+
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 2)
+    mgr = ConnectionManager()
+    slow = _FakeSocket(delay=10)
+    await mgr.connect(7, slow)
+    for i in range(4):
+        await mgr.send_to_user(7, {"n": i})
+    await asyncio.sleep(0)
+    assert slow.closed
+    assert mgr.stats()["sockets"] == 0
+    await asyncio.sleep(0.01)  # let the cancelled writer unwind
+
+
+async def test_held_messages_deduplicated_against_replay():
+    from connection_manager import ConnectionManager
+
+    mgr = ConnectionManager()
+    sock = _FakeSocket()
+    conn = await mgr.connect(3, sock, hold=True)
+    await mgr.send_to_user(3, {"event": "new_file", "seq": 4})  # also in the replay
+    await mgr.send_to_user(3, {"event": "new_file", "seq": 5})
+    await asyncio.sleep(0.01)
+    assert sock.sent == []
+
+    assert conn.resume(after_seq=4)
+    await asyncio.sleep(0.01)
+    assert sock.sent == ['{"event": "new_file", "seq": 5}']
+    await mgr.disconnect(conn)
+    await asyncio.sleep(0.01)
+
+
+async def test_held_messages_beyond_send_queue_evict_socket(monkeypatch):
+    from config import settings
+    from connection_manager import ConnectionManager
+
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 2)
+    mgr = ConnectionManager()
+    sock = _FakeSocket(delay=10)
+    conn = await mgr.connect(3, sock, hold=True)
+    # Queue filled before the writer gets to run
+    conn.queue.put_nowait("pong")
+    conn.queue.put_nowait("pong")
+    for seq in (1, 2):
+        await mgr.send_to_user(3, {"event": "new_file", "seq": seq})
+
+    assert conn.resume(after_seq=0)
+    await asyncio.sleep(0)
+    assert sock.closed
+    assert mgr.stats()["sockets"] == 0
+    await asyncio.sleep(0.01)
@@ -0,0 +1,66 @@
+"""Grouping of uploaded parts into transfers.
+
+A file too large for one upload is sent as ``total_parts`` separate parts,
+each its own ``PendingFile``. When a part is stored it joins the newest open
+transfer with the same sender, receiver, file name and part count that does
+not have that part number yet. A transfer is open while none of its parts
+has been acked or has expired. Otherwise the part starts a new transfer.
+
+Once every part is in, ``GET /transfers/{id}/content`` streams the parts back
+to back as the original file.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import PendingFile, Transfer
+
+
+async def assign_transfer(
+    db: AsyncSession,
+    sender_id: int,
+    receiver_id: int,
+    original_filename: str,
+    part_number: int,
+    total_parts: int,
+) -> int:
+    """Id of the transfer a new part belongs to, creating it if needed."""
+    has_part = (
+        select(PendingFile.id)
+        .where(PendingFile.transfer_id == Transfer.id, PendingFile.part_number == part_number)
+        .exists()
+    )
+    closed = (
+        select(PendingFile.id)
+        .where(PendingFile.transfer_id == Transfer.id, PendingFile.status != "pending")
+        .exists()
+    )
+    transfer_id = await db.scalar(
+        select(Transfer.id)
+        .where(
+            Transfer.receiver_id == receiver_id,
+            Transfer.sender_id == sender_id,
+            Transfer.original_filename == original_filename,
+            Transfer.total_parts == total_parts,
+            ~has_part,
+            ~closed,
+        )
+        .order_by(Transfer.id.desc())
+        .limit(1)
+    )
+    if transfer_id is None:
+        transfer = Transfer(
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            original_filename=original_filename,
+            total_parts=total_parts,
+        )
+        db.add(transfer)
+        await db.flush()
+        transfer_id = transfer.id
+    return transfer_id
+
+
+def is_complete(transfer: Transfer) -> bool:
+    """Every part 1..total_parts is present and still pending."""
+    pending = {p.part_number for p in transfer.parts if p.status == "pending"}
+    return pending == set(range(1, transfer.total_parts + 1))
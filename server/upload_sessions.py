@@ -0,0 +1,144 @@
+"""State of resumable upload sessions kept outside the database.
+
+Each session writes into a preallocated staging file under
+``STORAGE_PATH/uploads``, and the worker that created it keeps a running
+digest of the bytes that arrived in order. Both go when the session
+completes, is aborted or is purged as stale.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only
+    fcntl = None
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from blob_store import STAGING_MAX_AGE, remove_path
+from config import settings
+from models import UploadSession
+
+
+class PrefixDigest:
+    """SHA-256 of a session's bytes [0, offset), fed by PATCHes as they arrive.
+
+    Kept per process and lost on restart. Completion uses it only if every
+    recorded range was written through it; otherwise, or for what it does
+    not cover, the staging file is read back.
+    """
+
+    def __init__(self) -> None:
+        self.digest = hashlib.sha256()
+        self.offset = 0
+        self.ranges: list[tuple[int, int]] = []  # recorded by this process
+        self.valid = True
+
+    def feed(self, position: int, chunk: bytes) -> None:
+        if position == self.offset:
+            self.digest.update(chunk)
+            self.offset += len(chunk)
+        elif position < self.offset:
+            self.valid = False  # rewrites bytes already hashed
+
+    def covers(self, session: UploadSession) -> bool:
+        return self.valid and sorted(self.ranges) == sorted((r.start, r.end) for r in session.ranges)
+
+
+prefix_digests: dict[str, PrefixDigest] = {}
+
+
+UPLOADS_DIR = "uploads"
+
+
+def staging_path(session_id: str) -> Path:
+    return settings.STORAGE_PATH / UPLOADS_DIR / session_id
+
+
+def lock_staging(fd: int, session_id: str, exclusive: bool = False) -> bool:
+    """flock an open staging file; False if it is no longer the session's file.
+
+    PATCHes hold a shared lock while writing and completion an exclusive one
+    while hashing and storing, so no worker process writes into a file that
+    is being finalised. A writer let in afterwards finds the file moved or
+    removed and must not write. Released when the file is closed. Blocking;
+    run it with ``run_in_threadpool``. Without fcntl (Windows) nothing is
+    locked.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        return os.stat(staging_path(session_id)).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _stale_staging_names(cutoff: float) -> list[str]:
+    uploads_dir = settings.STORAGE_PATH / UPLOADS_DIR
+    if not uploads_dir.is_dir():
+        return []
+    names = []
+    for entry in os.scandir(uploads_dir):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                names.append(entry.name)
+        except FileNotFoundError:
+            pass
+    return names
+
+
+async def drop_finished_digests(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Forget prefix digests of sessions whose row is gone.
+
+    Only the worker that completes, aborts or purges a session drops its
+    digest there; the one that created it may be another. Returns the
+    number dropped.
+    """
+    session_ids = list(prefix_digests)
+    dropped = 0
+    for i in range(0, len(session_ids), batch_size):
+        batch = session_ids[i:i + batch_size]
+        known = set(await db.scalars(select(UploadSession.id).where(UploadSession.id.in_(batch))))
+        for session_id in batch:
+            if session_id not in known:
+                prefix_digests.pop(session_id, None)
+                dropped += 1
+    return dropped
+
+
+async def purge_stale_sessions(db: AsyncSession, cutoff: datetime) -> None:
+    """Drop upload sessions (and their staging files) created before cutoff."""
+    stale = (
+        await db.execute(select(UploadSession).where(UploadSession.created_at < cutoff))
+    ).scalars().all()
+    for session in stale:
+        staging_path(session.id).unlink(missing_ok=True)
+        prefix_digests.pop(session.id, None)
+        await db.delete(session)
+    await db.commit()
+
+
+async def sweep_orphan_uploads(
+    db: AsyncSession, max_age: float = STAGING_MAX_AGE, batch_size: int = 1000
+) -> int:
+    """Delete staging files no session refers to, once older than max_age seconds.
+
+    A create that fails after preallocating, or a crash while a completion
+    is storing the file it claimed, leaves one behind that
+    ``purge_stale_sessions`` never sees. Returns the number of files removed.
+    """
+    names = await run_in_threadpool(_stale_staging_names, time.time() - max_age)
+    removed = 0
+    for i in range(0, len(names), batch_size):
+        batch = names[i:i + batch_size]
+        known = set(await db.scalars(select(UploadSession.id).where(UploadSession.id.in_(batch))))
+        for name in batch:
+            if name not in known:
+                await run_in_threadpool(remove_path, staging_path(name))
+                removed += 1
+    return removed
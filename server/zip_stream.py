@@ -0,0 +1,106 @@
+"""ZIP64 archives streamed as they are built, without temp files.
+
+``zipfile`` can write to any object with ``write``/``tell``. When it cannot
+seek back to patch a local header, it emits a data descriptor after each
+entry instead. ``iter_zip`` drains its sink after every chunk, so the
+archive goes out as it is produced. Memory stays at about one chunk however
+large the bundle is.
+
+Blocking: hand the iterator to ``StreamingResponse``, which runs each step
+in the threadpool.
+"""
+import itertools
+import zipfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path, PurePath
+from typing import Callable, Iterable, Iterator, Optional
+
+from content_coding import decode_chunks
+
+CHUNK_SIZE = 256 * 1024
+SAMPLE_SIZE = 64 * 1024
+# Entries whose first chunk deflates to more than this share are stored
+STORE_RATIO = 0.9
+INCOMPRESSIBLE_SUFFIXES = frozenset({
+    ".7z", ".avi", ".bz2", ".gif", ".gz", ".jpeg", ".jpg", ".mkv", ".mov", ".mp3",
+    ".mp4", ".png", ".rar", ".webm", ".webp", ".xz", ".zip", ".zst",
+})
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    path: Optional[Path]
+    modified: datetime
+    coding: Optional[str] = None  # content-coding of the stored bytes
+    # Blocking chunk reader for objects with no local path
+    read: Optional[Callable[[], Iterable[bytes]]] = None
+
+
+class _Sink:
+    """Write-only, non-seekable buffer that iter_zip empties after every write."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _read(entry: ZipEntry) -> Iterator[bytes]:
+    if entry.read is not None:
+        chunks = iter(entry.read())
+        if entry.coding:
+            chunks = decode_chunks(chunks, entry.coding)
+        yield from chunks
+        return
+    with open(entry.path, "rb") as f:
+        chunks = iter(lambda: f.read(CHUNK_SIZE), b"")
+        if entry.coding:
+            chunks = decode_chunks(chunks, entry.coding)
+        yield from chunks
+
+
+def _compress_type(name: str, sample: bytes) -> int:
+    if not sample or PurePath(name).suffix.lower() in INCOMPRESSIBLE_SUFFIXES:
+        return zipfile.ZIP_STORED
+    sample = sample[:SAMPLE_SIZE]
+    if len(zlib.compress(sample, 1)) > len(sample) * STORE_RATIO:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_zip(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    """Yield a ZIP64 archive of entries, each stored or deflated on its own merits."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for entry in entries:
+            chunks = _read(entry)
+            first = next(chunks, b"")
+            info = zipfile.ZipInfo(entry.name, date_time=entry.modified.timetuple()[:6])
+            info.compress_type = _compress_type(entry.name, first)
+            # Sizes are unknown up front, so every entry gets ZIP64 fields
+            with archive.open(info, "w", force_zip64=True) as dest:
+                for chunk in itertools.chain([first], chunks):
+                    dest.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            if data := sink.drain():
+                yield data
+    yield sink.drain()